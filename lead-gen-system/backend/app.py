@@ -1,22 +1,53 @@
 import os
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-import sqlite3
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+from datetime import date, datetime
+from typing import Optional, List, Dict, Any, Callable, Literal
+from collections import Counter
+import csv
 import json
 from pathlib import Path
 
+import audit
+import cache
+import competition
+import db
+import demo_server
+import events
+import joblog
+import metrics
+import dedup
+import discovery
+from dedup import DEDUP_FUZZY, DEDUP_THRESHOLD, INTAKE_DEDUPE, business_key, location_block
+import importer
+import migrations
+import results
+import validation
+from notify import Notifier
+from jobs import (
+    create_job, enqueue_batch, enqueue_matching, enqueue_stage, find_jobs, get_job_by_business, get_jobs,
+    get_next_stage, keyset, location_weights, queue_depth, reconcile_stage_counts, set_location_weight,
+    stage_counts, stage_statuses, start_pipeline, update_job_stage,
+)
+from runner import JobRunner
+from stages import STAGE_FUNCTIONS, STAGE_MESSAGES
+
 # ======================
 # Configuration
 # ======================
 BASE_DIR = Path(__file__).parent
-DB_PATH = BASE_DIR / "data" / "leads.db"
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 UPLOAD_DIR = BASE_DIR / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+# Largest number of ids (or filter matches) one batch request may touch
+MAX_BATCH = 5000
+# Listing pages; NDJSON exports read the table in pages of EXPORT_PAGE_SIZE
+MAX_PAGE_SIZE = 1000
+EXPORT_PAGE_SIZE = 1000
+
 # Telegram config
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
@@ -34,80 +65,51 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 # ======================
 # Database helpers
 # ======================
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    # Pooled per-thread connection; do not close it after use
+    return db.get_conn()
 
 def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
+    # Schema lives in migrations.py; this brings any existing DB up to date
     try:
-        # Businesses
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS businesses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                location TEXT,
-                website_url TEXT,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        # Jobs (state machine)
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS jobs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                business_id INTEGER,
-                stage TEXT NOT NULL,
-                status TEXT DEFAULT 'idle',
-                data_json TEXT,
-                last_error TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (business_id) REFERENCES businesses(id)
-            )
-        ''')
-        # Campaign/Stage definitions (you can expand)
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS stages (
-                stage_name TEXT PRIMARY KEY,
-                description TEXT
-            )
-        ''')
-        # Insert default stages
-        stages = [
-            ("Intake", "Collect business info"),
-            ("Analysis", "Website audit"),
-            ("Competitors", "Top competitor research"),
-            ("Rebuild", "Generate new structure"),
-            ("Demo", "Deploy demo site"),
-            ("Pitch", "Generate pitch materials")
-        ]
-        cur.executemany("INSERT OR IGNORE INTO stages (stage_name, description) VALUES (?,?)", stages)
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                job_id INTEGER,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                level TEXT,
-                message TEXT,
-                FOREIGN KEY (job_id) REFERENCES jobs(id)
-            )
-        ''')
+        migrations.migrate(get_conn())
     except Exception as e:
         print(f"DB init error: {e}")
-    finally:
-        conn.commit()
-        conn.close()
-
-def log_job_event(job_id: int, level: str, message: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO logs (job_id, level, message) VALUES (?,?,?)", (job_id, level, message))
-    conn.commit()
-    conn.close()
+        raise
+
+def log_job_event(job_id: int, level: str, message: str, stage: Optional[str] = None,
+                  duration: Optional[float] = None, payload: Optional[Dict[str, Any]] = None):
+    # Buffered; the log sink writes it with the next batch
+    joblog.sink.emit(job_id, level, message, stage=stage, duration=duration, payload=payload)
+
+def find_logs(limit: int, cursor: Optional[int] = None, descending: bool = False,
+              job_id: Optional[int] = None, business_id: Optional[int] = None, level: Optional[str] = None):
+    clauses, params = [], []
+    if job_id is not None:
+        clauses.append("job_id = ?")
+        params.append(job_id)
+    if business_id is not None:
+        clauses.append("job_id IN (SELECT id FROM jobs WHERE business_id = ?)")
+        params.append(business_id)
+    if level:
+        clauses.append("level = ?")
+        params.append(level)
+    bound, bound_params, order = keyset("id", cursor, descending)
+    rows = get_conn().execute(
+        f"SELECT id, job_id, timestamp, level, message, stage, duration_ms, payload FROM logs "
+        f"WHERE {' AND '.join(clauses) or '1'} AND {bound} ORDER BY {order} LIMIT ?",
+        (*params, *bound_params, limit)
+    ).fetchall()
+    return [
+        {"id": r[0], "job_id": r[1], "timestamp": r[2], "level": r[3], "message": r[4], "stage": r[5],
+         "duration_ms": r[6], "payload": json.loads(r[7]) if r[7] else None}
+        for r in rows
+    ]
 
 # ======================
 # Pydantic models (input validation)
@@ -132,243 +134,430 @@ class Demo(BaseModel):
 class Pitch(BaseModel):
     business_id: int
 
+class JobFilter(BaseModel):
+    stage: Optional[str] = None
+    status: Optional[str] = None
+    created_after: Optional[datetime] = None  # business created_at, inclusive
+    created_before: Optional[datetime] = None  # exclusive
+
+class StageBatch(BaseModel):
+    # Either an explicit id list or a filter
+    business_ids: Optional[List[int]] = None
+    filter: Optional[JobFilter] = None
+    limit: int = Field(1000, ge=1, le=MAX_BATCH)
+
+class DedupScan(BaseModel):
+    threshold: float = Field(DEDUP_THRESHOLD, gt=0, le=1)
+    action: Literal["report", "flag", "merge"] = "report"
+
+class DedupMerge(BaseModel):
+    business_id: int
+    into: int
+
+class DedupDismiss(BaseModel):
+    business_id: int
+    duplicate_of: int
+
+class LocationWeight(BaseModel):
+    location: str
+    weight: float = Field(..., gt=0, le=100)
+
+class StatusBatch(BaseModel):
+    job_ids: Optional[List[int]] = None
+    filter: Optional[JobFilter] = None
+    limit: int = Field(1000, ge=1, le=MAX_BATCH)
+
 # ======================
 # Helper functions
 # ======================
 def get_business_id(name: str, location: str) -> Optional[int]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM businesses WHERE name=? AND location=?", (name, location))
-    row = cur.fetchone()
-    conn.close()
+    row = get_conn().execute("SELECT id FROM businesses WHERE name=? AND location=?", (name, location)).fetchone()
     return row[0] if row else None
 
-def create_job(business_id: int, stage: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO jobs (business_id, stage) VALUES (?,?)",
-        (business_id, stage)
-    )
-    job_id = cur.lastrowid
-    conn.commit()
-    conn.close()
-    return job_id
-
-def get_next_stage(stage: str) -> Optional[str]:
-    # simple sequential flow
-    stages = ["Intake", "Analysis", "Competitors", "Rebuild", "Demo", "Pitch"]
-    idx = stages.index(stage) if stage in stages else -1
-    return stages[idx + 1] if idx + 1 < len(stages) else None
-
-def update_job_stage(job_id: int, new_stage: str, data_json: str = None, status: str = "processing"):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE jobs SET stage=?, status=?, data_json=? WHERE id=?", (new_stage, status, data_json, job_id))
-    conn.commit()
-    conn.close()
-
-def get_job_by_business(business_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM jobs WHERE business_id=?", (business_id,))
-    rows = cur.fetchall()
-    conn.close()
-    return rows[0] if rows else None
+# Non-blocking: messages are queued, coalesced and sent by a background task
+notifier = Notifier(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID)
+
+def send_telegram(message: str, key: Optional[str] = None, summary: Optional[str] = None):
+    notifier.notify(message, key=key, summary=summary)
 
 # ======================
-# Mock processing functions (replace with real implementations)
+# Background stage runner
 # ======================
-def mock_analysis(audit_data: Dict) -> Dict:
-    # Return a simple audit result that conforms to schema_audit.json
-    return {
-        "scores": {
-            "design": 78,
-            "seo": 72,
-            "conversion": 65,
-            "trust": 70,
-            "mobile": 80
-        },
-        "finding_summary": "Initial audit completed.",
-        "quick_wins": ["Clear navigation", "Responsive layout"],
-        "weaknesses": ["Missing alt text", "No structured data"]
-    }
-
-def mock_competitors_analysis() -> Dict:
-    return {
-        "top3": [
-            {"name": "Local Pro Plumbing", "structure_strengths": ["Clear service pages"], "messaging_gaps": ["Unique value prop"]},
-            {"name": "Adelaide Coffee Co", "structure_strengths": ["Strong about page"], "messaging_gaps": ["Pricing transparency"]},
-            {"name": "Gym Pro Fitness", "structure_strengths": ["Conversion-optimized CTAs"], "messaging_gaps": ["Social proof"]},
-        ]
-    }
-
-def mock_rebuild_output() -> Dict:
-    return {
-        "structure": ["Home", "About", "Services", "Pricing", "Contact"],
-        "headings": ["Best Plumbing in Town", "Quality Coffee Nearby", "Fitness That Fits Your Schedule"],
-        "CTAs": ["Get a Quote", "Book a Free Consultation"],
-        "trust_signals": ["Testimonials", "Accreditations"]
-    }
-
-def mock_demo_url() -> Dict:
-    return {"demo_url": "http://localhost:8000/demos/placeholder"}
-
-def mock_pitch_output() -> Dict:
-    return {
-        "executive_summary": "Executive summary for the lead.",
-        "revenue_opportunity": "$24k/month potential",
-        "before_after": "Before: fragmented; After: cohesive conversion‑focused site",
-        "outbound_email": "Hi … we’d love to help …",
-        "followup_email": "Just checking in …"
-    }
-
-def send_telegram(message: str):
-    if not TELEGRAM_TOKEN or not TELEGRAM_CHAT_ID:
-        return
-    import httpx
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    payload = {"chat_id": TELEGRAM_CHAT_ID, "text": message}
-    try:
-        httpx.post(url, json=payload, timeout=5.0)
-    except Exception as e:
-        print(f"Telegram send error: {e}")
+runner = JobRunner(STAGE_FUNCTIONS, stage_messages=STAGE_MESSAGES, notify=send_telegram)
+# Finds websites for URL-less leads before Analysis (only runs with SEARXNG_URL set)
+url_discovery = discovery.UrlDiscovery()
+# Serves the Demo stage's generated sites at /demos
+demo_sites = demo_server.DemoServer()
+
+def enqueue(business_id: int, stage: str) -> Dict[str, Any]:
+    queued = enqueue_stage(business_id, stage)
+    if not queued:
+        raise HTTPException(status_code=400, detail=f"Job not in {stage} stage")
+    runner.wake()
+    return queued
+
+def _check_batch(ids: Optional[List[int]], job_filter: Optional[JobFilter], ids_field: str):
+    if (ids is None) == (job_filter is None):
+        raise HTTPException(status_code=400, detail=f"Provide either {ids_field} or filter")
+    if ids is not None and len(ids) > MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH} {ids_field} per request")
+
+def enqueue_many(stage: str, payload: StageBatch) -> Dict[str, Any]:
+    _check_batch(payload.business_ids, payload.filter, "business_ids")
+    if payload.business_ids is not None:
+        results = enqueue_batch(stage, payload.business_ids)
+    else:
+        f = payload.filter
+        if f.stage and f.stage != stage:
+            raise HTTPException(status_code=400, detail=f"Filter stage must be {stage}")
+        results = enqueue_matching(stage, payload.limit, status=f.status,
+                                   created_after=f.created_after, created_before=f.created_before)
+    runner.wake()
+    return {"stage": stage, "counts": Counter(r["outcome"] for r in results), "results": results}
+
+def paginate(fetch_page: Callable[[int, Optional[int]], List[Dict]], key: str,
+             cursor: Optional[int], limit: int, fmt: str):
+    """Serve one keyset page as JSON, or stream every page from `cursor` as NDJSON."""
+    if fmt == "ndjson":
+        def export():
+            position = cursor
+            while True:
+                page = fetch_page(EXPORT_PAGE_SIZE, position)
+                if page:
+                    yield "".join(json.dumps(item) + "\n" for item in page)
+                if len(page) < EXPORT_PAGE_SIZE:
+                    return
+                position = page[-1][key]
+        return StreamingResponse(export(), media_type="application/x-ndjson")
+    items = fetch_page(limit, cursor)
+    next_cursor = items[-1][key] if len(items) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
 
 # ======================
 # App lifecycle
 # ======================
 
 @app.on_event("startup")
-def _startup():
+async def _startup():
     # Ensure DB schema exists before any request handlers run
     init_db()
+    validation.warm()
+    # Triggers keep stage_counters exact; this only repairs drift from
+    # writes made outside them (manual edits, restores)
+    drifted = reconcile_stage_counts()
+    if drifted:
+        print(f"Reconciled {drifted} stale stage counter(s)")
+    await events.bus.start(snapshot=stage_counts)
+    joblog.sink.start()
+    runner.start()
+    if discovery.DISCOVERY_ENABLED:
+        url_discovery.start()
+    await notifier.start()
+
+@app.on_event("shutdown")
+async def _shutdown():
+    # Stop the runner first so its last notifications reach the outbox
+    runner.stop()
+    url_discovery.stop()
+    competition.engine.close()
+    joblog.sink.stop()
+    events.bus.stop()
+    await notifier.stop()
+    audit.shutdown()
+    db.close_all()
 
 # ======================
 # API Endpoints
 # ======================
+# Endpoints that touch SQLite are plain `def`, so FastAPI runs them in its
+# threadpool: a write can wait up to BUSY_TIMEOUT_MS for the runner's lock,
+# and that must not stall the event loop. The rest await their slow parts.
 
 @app.post("/api/intake")
-async def intake(payload: Intake):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO businesses (name, location, website_url, status) VALUES (?,?,?, 'pending')",
-        (payload.name, payload.location, payload.url)
-    )
-    business_id = cur.lastrowid
-    conn.commit()
-    conn.close()
-
-    job_id = create_job(business_id=business_id, stage="Intake")
-    # Auto transition to next stage (Analysis)
-    next_stage = get_next_stage("Intake")
-    update_job_stage(job_id, next_stage, status="processing")
+def intake(payload: Intake, dedupe: bool = INTAKE_DEDUPE,
+           fuzzy: Literal["off", "flag", "skip"] = DEDUP_FUZZY):
+    # Business, job and first transition commit together. A lead whose
+    # normalized name/location/host is already known returns the existing
+    # business and job instead of starting a second pipeline run
+    key = business_key(payload.name, payload.location, payload.url)
+    block = location_block(payload.location)
+    with db.transaction() as conn:
+        match = None
+        if fuzzy != "off" and not conn.execute("SELECT 1 FROM businesses WHERE dedup_key=?", (key,)).fetchone():
+            index = dedup.FuzzyIndex()
+            index.load_blocks(conn, [block])
+            match = index.best_match(dedup.FuzzyRecord.from_row(0, payload.name, payload.location, payload.url))
+        if match and fuzzy == "skip":
+            job = get_job_by_business(match[0].id)
+            return {"business_id": match[0].id, "job_id": job[0] if job else None, "status": "duplicate"}
+        if match:
+            # Held back without a job until the flag is dismissed or merged
+            business_id = conn.execute(
+                "INSERT INTO businesses (name, location, website_url, status, dedup_key, location_block) "
+                "VALUES (?,?,?,?,?,?)",
+                (payload.name, payload.location, payload.url, dedup.POSSIBLE_DUPLICATE, key, block)
+            ).lastrowid
+            dedup.flag_pairs([(business_id, match[0].id, match[1])])
+            return {"business_id": business_id, "job_id": None, "status": dedup.POSSIBLE_DUPLICATE,
+                    "duplicate_of": match[0].id}
+        row = conn.execute(
+            "INSERT INTO businesses (name, location, website_url, status, dedup_key, location_block) "
+            "VALUES (?,?,?, 'pending',?,?) ON CONFLICT(dedup_key) DO NOTHING RETURNING id",
+            (payload.name, payload.location, payload.url, key, block)
+        ).fetchone()
+        if row is None and dedupe:
+            business_id = conn.execute("SELECT id FROM businesses WHERE dedup_key=?", (key,)).fetchone()[0]
+            job = get_job_by_business(business_id)
+            if job:
+                return {"business_id": business_id, "job_id": job[0], "status": "duplicate"}
+            # No job: held back for review (or merged away); resubmitting doesn't release it
+            status = conn.execute("SELECT status FROM businesses WHERE id=?", (business_id,)).fetchone()[0]
+            flag = conn.execute(
+                "SELECT duplicate_of FROM business_duplicates WHERE business_id=? "
+                "ORDER BY status = 'flagged' DESC, id LIMIT 1",
+                (business_id,)
+            ).fetchone()
+            return {"business_id": business_id, "job_id": None, "status": status,
+                    "duplicate_of": flag[0] if flag else None}
+        elif row is None:
+            # Dedupe off: keep a second copy; the original keeps the key
+            business_id = conn.execute(
+                "INSERT INTO businesses (name, location, website_url, status, location_block) "
+                "VALUES (?,?,?, 'pending',?)",
+                (payload.name, payload.location, payload.url, block)
+            ).lastrowid
+        else:
+            business_id = row[0]
+
+        job_id = create_job(business_id=business_id, stage="Intake")
+        discover = not payload.url and discovery.DISCOVERY_ENABLED
+        if discover:
+            # Stays in Intake until discovery.py has looked for its website
+            update_job_stage(job_id, "Intake", status=discovery.DISCOVERING)
+        else:
+            # Auto transition out of Intake: Analysis, with Competitors as a branch
+            start_pipeline([job_id])
+    if discover:
+        url_discovery.wake()
+        return {"business_id": business_id, "job_id": job_id, "status": discovery.REQUIRES_URL_DISCOVERY}
     return {"business_id": business_id, "job_id": job_id, "status": "accepted"}
 
-@app.post("/api/analyze")
-async def analyze(payload: Analyze):
-    job = get_job_by_business(payload.business_id)
-    if not job or job[2] != "Analysis":  # stage index 1 in our flow
-        raise HTTPException(status_code=400, detail="Job not in Analysis stage")
-    # Collect audit output (placeholder)
-    audit = mock_analysis({"dummy": "data"})
-    update_job_stage(job_id=job[0], new_stage=get_next_stage("Analysis"), data_json=json.dumps(audit))
-    send_telegram(f"🔎 Analysis complete for business {payload.business_id}")
-    return {"audit": audit}
-
-@app.post("/api/competitors")
-async def competitors(payload: Competitors):
-    job = get_job_by_business(payload.business_id)
-    if not job or job[2] != "Competitors":
-        raise HTTPException(status_code=400, detail="Job not in Competitors stage")
-    comps = mock_competitors_analysis()
-    update_job_stage(job_id=job[0], new_stage=get_next_stage("Competitors"), data_json=json.dumps(comps))
-    send_telegram(f"🔎 Competitors analysis done for business {payload.business_id}")
-    return {"top3": comps["top3"]}
-
-@app.post("/api/rebuild")
-async def rebuild(payload: Rebuild):
-    job = get_job_by_business(payload.business_id)
-    if not job or job[2] != "Rebuild":
-        raise HTTPException(status_code=400, detail="Job not in Rebuild stage")
-    rebuild = mock_rebuild_output()
-    update_job_stage(job_id=job[0], new_stage=get_next_stage("Rebuild"), data_json=json.dumps(rebuild))
-    send_telegram(f"🏗️ Rebuild completed for business {payload.business_id}")
-    return {"rebuild": rebuild}
-
-@app.post("/api/demo")
-async def demo(payload: Demo):
-    job = get_job_by_business(payload.business_id)
-    if not job or job[2] != "Demo":
-        raise HTTPException(status_code=400, detail="Job not in Demo stage")
-    demo = mock_demo_url()
-    update_job_stage(job_id=job[0], new_stage=get_next_stage("Demo"), data_json=json.dumps(demo))
-    send_telegram(f"🚀 Demo deployed for business {payload.business_id}")
-    return demo
-
-@app.post("/api/pitch")
-async def pitch(payload: Pitch):
-    job = get_job_by_business(payload.business_id)
-    if not job or job[2] != "Pitch":
-        raise HTTPException(status_code=400, detail="Job not in Pitch stage")
-    pitch = mock_pitch_output()
-    update_job_stage(job_id=job[0], new_stage="Pitch", data_json=json.dumps(pitch), status="completed")
-    send_telegram(f"📣 Pitch generated for business {payload.business_id}")
-    return pitch
+# Stage endpoints only queue work; poll /api/status/{job_id} for the result
+
+@app.post("/api/analyze", status_code=202)
+def analyze(payload: Analyze):
+    return enqueue(payload.business_id, "Analysis")
+
+@app.post("/api/competitors", status_code=202)
+def competitors(payload: Competitors):
+    return enqueue(payload.business_id, "Competitors")
+
+@app.post("/api/rebuild", status_code=202)
+def rebuild(payload: Rebuild):
+    return enqueue(payload.business_id, "Rebuild")
+
+@app.post("/api/demo", status_code=202)
+def demo(payload: Demo):
+    return enqueue(payload.business_id, "Demo")
+
+@app.post("/api/pitch", status_code=202)
+def pitch(payload: Pitch):
+    return enqueue(payload.business_id, "Pitch")
+
+@app.post("/api/analyze/batch", status_code=202)
+def analyze_batch(payload: StageBatch):
+    return enqueue_many("Analysis", payload)
+
+@app.post("/api/competitors/batch", status_code=202)
+def competitors_batch(payload: StageBatch):
+    return enqueue_many("Competitors", payload)
+
+@app.post("/api/rebuild/batch", status_code=202)
+def rebuild_batch(payload: StageBatch):
+    return enqueue_many("Rebuild", payload)
+
+@app.post("/api/demo/batch", status_code=202)
+def demo_batch(payload: StageBatch):
+    return enqueue_many("Demo", payload)
+
+@app.post("/api/pitch/batch", status_code=202)
+def pitch_batch(payload: StageBatch):
+    return enqueue_many("Pitch", payload)
 
 @app.post("/api/upload-csv")
-async def upload_csv(file: UploadFile = File(...)):
-    # Save CSV to uploads dir
-    save_path = UPLOAD_DIR / file.filename
-    contents = await file.read()
-    with open(save_path, "wb") as f:
-        f.write(contents)
-
-    # Very simple CSV import: assumes header row with name,location,url
-    import csv, io
+async def upload_csv(file: UploadFile = File(...), dedupe: bool = INTAKE_DEDUPE,
+                     fuzzy: Literal["off", "flag", "skip"] = DEDUP_FUZZY):
+    # Stream the upload to disk and into the DB in batches; accepts both
+    # name,location,website_url and the "Business Name,Location,Website URL" export
+    save_path = UPLOAD_DIR / Path(file.filename or "upload.csv").name
     try:
-        stream = io.StringIO(contents.decode("utf-8"))
-        reader = csv.DictReader(stream)
-        for row in reader:
-            name = row.get("name")
-            location = row.get("location")
-            url = row.get("website_url", "")
-            if name and location:
-                conn = get_conn()
-                cur = conn.cursor()
-                cur.execute(
-                    "INSERT INTO businesses (name, location, website_url, status) VALUES (?,?,?, 'pending')",
-                    (name, location, url)
-                )
-                conn.commit()
-                conn.close()
-    except Exception as e:
+        report = await importer.import_upload(file, job_stage=get_next_stage("Intake"), save_path=save_path,
+                                              dedupe=dedupe, fuzzy=fuzzy, discover=discovery.DISCOVERY_ENABLED)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
         raise HTTPException(status_code=400, detail=f"CSV import error: {e}")
+    if report.awaiting_discovery:
+        url_discovery.wake()
 
-    return {"detail": "CSV file saved, data appended to businesses table."}
+    return {"detail": "CSV file saved, data appended to businesses table.", **report.to_dict()}
 
 @app.get("/api/status/{job_id}")
-async def status(job_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT stage, status, data_json FROM jobs WHERE id=?", (job_id,))
-    row = cur.fetchone()
-    conn.close()
+def status(job_id: int):
+    row = get_conn().execute(
+        "SELECT stage, status, data_json, last_error, attempts FROM jobs WHERE id=?", (job_id,)
+    ).fetchone()
     if not row:
         raise HTTPException(status_code=404, detail="Job not found")
-    return {"job_id": job_id, "stage": row[0], "status": row[1], "data": row[2]}
+    return {"job_id": job_id, "stage": row[0], "status": row[1], "data": row[2],
+            "last_error": row[3], "attempts": row[4], "stages": stage_statuses(job_id)}
+
+@app.post("/api/status/batch")
+def status_batch(payload: StatusBatch):
+    _check_batch(payload.job_ids, payload.filter, "job_ids")
+    if payload.job_ids is not None:
+        found = get_jobs(payload.job_ids)
+        results = [found.get(job_id, {"job_id": job_id, "status": "not_found"}) for job_id in payload.job_ids]
+    else:
+        f = payload.filter
+        results = find_jobs(payload.limit, stage=f.stage, status=f.status,
+                            created_after=f.created_after, created_before=f.created_before)
+    return {"results": results}
+
+@app.get("/api/jobs")
+def list_jobs(stage: Optional[str] = None, status: Optional[str] = None, business_id: Optional[int] = None,
+              cursor: Optional[int] = None, limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+              order: Literal["asc", "desc"] = "asc", format: Literal["json", "ndjson"] = "json"):
+    # Pass next_cursor back as ?cursor= for the next page; format=ndjson streams all pages
+    def fetch_page(page_size, page_cursor):
+        return find_jobs(page_size, page_cursor, descending=order == "desc", include_data=False,
+                         stage=stage, status=status, business_id=business_id)
+    return paginate(fetch_page, "job_id", cursor, limit, format)
+
+@app.get("/api/jobs/{job_id}/results")
+def job_results(job_id: int):
+    # Which stages have stored output, with sizes; fetch one with /results/{stage}
+    stored = results.list_results(job_id)
+    if not stored and not get_jobs([job_id]):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, "results": stored}
+
+@app.get("/api/jobs/{job_id}/results/{stage}")
+def job_stage_result(job_id: int, stage: str):
+    # The stored JSON is sent as is: only this stage's row is read and nothing is re-serialized
+    body = results.get_result_json(job_id, stage)
+    if body is None:
+        raise HTTPException(status_code=404, detail=f"No {stage} result for job {job_id}")
+    return Response(content=body, media_type="application/json")
+
+@app.get("/api/logs")
+async def list_logs(job_id: Optional[int] = None, business_id: Optional[int] = None, level: Optional[str] = None,
+                    cursor: Optional[int] = None, limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                    order: Literal["asc", "desc"] = "asc", format: Literal["json", "ndjson"] = "json"):
+    # Write out buffered events first so a listing sees everything logged before it
+    await run_in_threadpool(joblog.sink.flush)
+
+    def fetch_page(page_size, page_cursor):
+        return find_logs(page_size, page_cursor, descending=order == "desc",
+                         job_id=job_id, business_id=business_id, level=level)
+    return paginate(fetch_page, "id", cursor, limit, format)
+
+@app.get("/api/logs/daily")
+async def daily_logs(start: Optional[date] = None, end: Optional[date] = None, stage: Optional[str] = None,
+                     level: Optional[str] = None):
+    # Per-day counts and stage durations; covers days already compacted into rollups
+    def stats():
+        joblog.sink.flush()
+        return joblog.daily_stats(start and start.isoformat(), end and end.isoformat(), stage, level)
+    return await run_in_threadpool(stats)
+
+@app.get("/api/discovery")
+async def discovery_stats():
+    return await run_in_threadpool(url_discovery.stats)
+
+@app.post("/api/discovery/run")
+async def discovery_run():
+    # One batch now instead of waiting for the worker; blocks on SearXNG, so off the event loop
+    if not discovery.DISCOVERY_ENABLED:
+        raise HTTPException(status_code=503, detail="URL discovery is off (set SEARXNG_URL)")
+    return await run_in_threadpool(url_discovery.run_batch)
+
+@app.post("/api/dedup/scan")
+async def dedup_scan(payload: DedupScan):
+    # Blocking keeps a full-table scan to seconds, but it is still too long
+    # for the event loop
+    result = await run_in_threadpool(dedup.scan_businesses, payload.threshold, payload.action)
+    return {"action": payload.action, "threshold": payload.threshold, **result.to_dict()}
+
+@app.get("/api/dedup/flags")
+def dedup_flags(status: Optional[Literal["flagged", "merged", "dismissed"]] = "flagged",
+                cursor: Optional[int] = None, limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+                order: Literal["asc", "desc"] = "asc", format: Literal["json", "ndjson"] = "json"):
+    def fetch_page(page_size, page_cursor):
+        return dedup.find_flags(page_size, page_cursor, descending=order == "desc", status=status)
+    return paginate(fetch_page, "id", cursor, limit, format)
+
+@app.post("/api/dedup/merge")
+def dedup_merge(payload: DedupMerge):
+    if not dedup.merge_business(payload.business_id, payload.into):
+        raise HTTPException(status_code=409, detail="Both businesses must exist, differ and not be merged already")
+    return {"business_id": payload.business_id, "into": payload.into, "status": "merged"}
+
+@app.post("/api/dedup/dismiss")
+def dedup_dismiss(payload: DedupDismiss):
+    result = dedup.dismiss_flag(payload.business_id, payload.duplicate_of)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Duplicate flag not found")
+    if result["job_id"] is not None:
+        runner.wake()
+    return result
+
+@app.get("/api/counts")
+def counts():
+    by_stage = stage_counts()
+    return {"counts": by_stage, "total": sum(n for statuses in by_stage.values() for n in statuses.values())}
+
+@app.get("/api/queue")
+def queue():
+    # Queued jobs by priority band (high/medium/low, see priority.py)
+    return {**queue_depth(), "location_weights": location_weights()}
+
+@app.post("/api/queue/weights")
+def queue_weight(payload: LocationWeight):
+    flow = location_block(payload.location)
+    set_location_weight(flow, payload.weight)
+    return {"location": flow, "weight": payload.weight}
+
+@app.get("/api/events")
+async def job_events(request: Request, cursor: Optional[str] = None):
+    # Server-sent events; browsers resume with Last-Event-ID automatically
+    last_event_id = request.headers.get("last-event-id") or cursor
+    return StreamingResponse(
+        events.sse_stream(events.bus, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/api/business/{business_id}")
-async def business(business_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT name, location, website_url FROM businesses WHERE id=?", (business_id,))
-    row = cur.fetchone()
-    conn.close()
+def business(business_id: int):
+    row = get_conn().execute("SELECT name, location, website_url FROM businesses WHERE id=?", (business_id,)).fetchone()
     if not row:
         raise HTTPException(status_code=404, detail="Business not found")
     return {"name": row[0], "location": row[1], "website_url": row[2]}
 
+@app.get("/api/cache")
+def cache_stats():
+    # Hit/miss counters are per process; sizes come from the cache file
+    return cache.get_cache().stats()
+
+@app.api_route("/demos/{path:path}", methods=["GET", "HEAD"])
+async def demo_site(path: str, request: Request):
+    # Generated demo sites; hot files come from memory (see demo_server.py)
+    return await demo_sites.serve(path, request.headers, head=request.method == "HEAD")
+
+@app.get("/metrics")
+def prometheus_metrics():
+    # Prometheus text format; see metrics.py for what is recorded
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/")
 async def root():
     return {"message": "LeadGen Workflow API – use /docs for Swagger UI"}
@@ -0,0 +1,460 @@
+"""
+Website audit engine behind the Analysis stage.
+
+Pages are fetched over one shared `httpx.AsyncClient` with a global
+concurrency cap, a per-host cap, connect/read timeouts and a hard limit on
+how much of a body is read. HTML is scored on a process pool so parsing never
+blocks the event loop. Every result is validated against `AuditResult`
+(with the cached validator from validation.py) before it is returned. Given
+a `PageCache`, a repeat audit of an unchanged page skips the fetch, the
+parse, or both (see cache.py).
+
+Stage functions are synchronous, so `audit_website()` hands work to a shared
+engine running on its own event-loop thread.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+import validation
+from cache import PageCache, get_cache, normalize_url
+
+AUDIT_CONCURRENCY = int(os.getenv("AUDIT_CONCURRENCY", "64"))
+AUDIT_PER_HOST = int(os.getenv("AUDIT_PER_HOST", "2"))
+AUDIT_TIMEOUT = float(os.getenv("AUDIT_TIMEOUT", "15"))
+AUDIT_MAX_BODY_BYTES = int(os.getenv("AUDIT_MAX_BODY_BYTES", str(2 * 1024 * 1024)))
+# 0 parses on the engine's loop thread instead of a process pool
+AUDIT_PARSE_WORKERS = int(os.getenv("AUDIT_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+USER_AGENT = "LeadGenWorkflow-Audit/1.0"
+
+
+class AuditError(Exception):
+    pass
+
+
+@dataclass
+class FetchedPage:
+    url: str
+    final_url: str
+    status: int
+    headers: Dict[str, str]
+    body: str
+    truncated: bool = False
+    elapsed: float = 0.0
+
+
+# ======================
+# HTML analysis (runs in worker processes)
+# ======================
+CTA_WORDS = re.compile(r"\b(quote|book|call|contact|get started|buy|order|enquire|inquire|schedule|free|sign up|request)\b", re.I)
+TRUST_WORDS = re.compile(r"\b(testimonial|review|rated|stars?|accredit|licen[cs]ed|certified|guarantee|insured|award)", re.I)
+ADDRESS_HINTS = re.compile(r"\b(ABN\s*\d|street|st\.|road|rd\.|avenue|ave\.|\b[A-Z]{2,3}\s+\d{4}\b)", re.I)
+PHONE = re.compile(r"(\+?\d[\d\s()-]{7,}\d)")
+SOCIAL_HOSTS = ("facebook.com", "instagram.com", "linkedin.com", "twitter.com", "x.com", "youtube.com", "tiktok.com")
+
+
+class _PageParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lang = None
+        self.title = ""
+        self.meta: Dict[str, str] = {}
+        self.links: List[Dict[str, str]] = []
+        self.anchors: List[Dict[str, str]] = []
+        self.tags: Dict[str, int] = {}
+        self.images = 0
+        self.images_with_alt = 0
+        self.images_responsive = 0
+        self.inline_styles = 0
+        self.ld_json = 0
+        self.button_texts: List[str] = []
+        self.style_text = ""
+        self.text: List[str] = []
+        self._stack: List[str] = []
+        self._anchor: Optional[Dict[str, str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        a = {k: (v or "") for k, v in attrs}
+        self.tags[tag] = self.tags.get(tag, 0) + 1
+        if "style" in a:
+            self.inline_styles += 1
+        if tag == "html":
+            self.lang = a.get("lang")
+        elif tag == "meta":
+            key = (a.get("name") or a.get("property") or "").lower()
+            if key:
+                self.meta[key] = a.get("content", "")
+        elif tag == "link":
+            self.links.append({"rel": a.get("rel", "").lower(), "href": a.get("href", "")})
+        elif tag == "img":
+            self.images += 1
+            self.images_with_alt += bool(a.get("alt", "").strip())
+            self.images_responsive += "srcset" in a
+        elif tag == "source" and "srcset" in a:
+            self.images_responsive += 1
+        elif tag == "script" and a.get("type", "").lower() == "application/ld+json":
+            self.ld_json += 1
+        elif tag == "a":
+            self._anchor = {"href": a.get("href", ""), "text": "", "class": a.get("class", "")}
+            self.anchors.append(self._anchor)
+        elif tag == "input" and a.get("type", "").lower() == "submit":
+            self.button_texts.append(a.get("value", ""))
+        if tag not in ("meta", "link", "img", "input", "br", "hr", "source"):
+            self._stack.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._stack:
+            while self._stack and self._stack.pop() != tag:
+                pass
+        if tag == "a":
+            self._anchor = None
+
+    def handle_data(self, data):
+        current = self._stack[-1] if self._stack else ""
+        if current == "title":
+            self.title += data
+        elif current == "style":
+            self.style_text += data
+        elif current == "script":
+            return
+        else:
+            self.text.append(data)
+            if self._anchor is not None:
+                self._anchor["text"] += data
+            if current == "button":
+                self.button_texts.append(data)
+
+
+@dataclass
+class _Check:
+    dimension: str
+    weight: int
+    passed: bool
+    message: str
+    quick: bool = True  # quick win when failed; otherwise a weakness
+
+
+def _checks(p: _PageParser, final_url: str) -> List[_Check]:
+    text = " ".join(" ".join(p.text).split())
+    words = len(text.split())
+    title = p.title.strip()
+    description = p.meta.get("description", "").strip()
+    viewport = p.meta.get("viewport", "").lower()
+    rels = [link["rel"] for link in p.links]
+    hrefs = [a["href"].lower() for a in p.anchors]
+    cta_texts = [a["text"] for a in p.anchors] + p.button_texts
+    ctas = sum(1 for t in cta_texts if CTA_WORDS.search(t or ""))
+    h1, h2 = p.tags.get("h1", 0), p.tags.get("h2", 0)
+    alt_ratio = p.images_with_alt / p.images if p.images else 1.0
+    https = final_url.lower().startswith("https://")
+    year = str(date.today().year)
+
+    return [
+        # SEO
+        _Check("seo", 15, bool(title), "Add a descriptive <title>"),
+        _Check("seo", 10, 10 <= len(title) <= 70, "Keep the page title between 10 and 70 characters"),
+        _Check("seo", 15, bool(description), "Add a meta description"),
+        _Check("seo", 5, 50 <= len(description) <= 160, "Write a 50-160 character meta description"),
+        _Check("seo", 15, h1 == 1, "Use exactly one H1 heading"),
+        _Check("seo", 10, "canonical" in rels, "Add a canonical link"),
+        _Check("seo", 5, bool(p.lang), "Declare the page language on <html>"),
+        _Check("seo", 10, alt_ratio >= 0.9, "Add alt text to images"),
+        _Check("seo", 10, p.ld_json > 0, "Add LocalBusiness structured data", quick=False),
+        _Check("seo", 5, h2 > 0, "Break content up with H2 subheadings"),
+        # Mobile
+        _Check("mobile", 40, bool(viewport), "Add a responsive viewport meta tag"),
+        _Check("mobile", 20, "width=device-width" in viewport, "Set viewport width=device-width"),
+        _Check("mobile", 10, "user-scalable=no" not in viewport, "Allow pinch-zoom (drop user-scalable=no)"),
+        _Check("mobile", 10, "@media" in p.style_text or any("stylesheet" in r for r in rels),
+               "Layout has no responsive styles", quick=False),
+        _Check("mobile", 10, not p.images or p.images_responsive > 0, "Serve responsive images (srcset)", quick=False),
+        _Check("mobile", 10, any(h.startswith("tel:") for h in hrefs), "Add a tap-to-call link"),
+        # Conversion
+        _Check("conversion", 25, ctas > 0, "No clear call to action", quick=False),
+        _Check("conversion", 10, ctas >= 2, "Repeat the main call to action down the page"),
+        _Check("conversion", 25, p.tags.get("form", 0) > 0, "No lead-capture or enquiry form", quick=False),
+        _Check("conversion", 15, any(h.startswith("tel:") for h in hrefs) or bool(PHONE.search(text)),
+               "Show a phone number"),
+        _Check("conversion", 10, any(h.startswith("mailto:") or "contact" in h for h in hrefs), "Link to a contact page"),
+        _Check("conversion", 15, h1 > 0, "Lead with a clear headline", quick=False),
+        # Trust
+        _Check("trust", 25, https, "Serve the site over HTTPS", quick=False),
+        _Check("trust", 20, bool(TRUST_WORDS.search(text)), "No testimonials, reviews or accreditations", quick=False),
+        _Check("trust", 10, any("privacy" in h for h in hrefs), "Add a privacy policy"),
+        _Check("trust", 15, bool(ADDRESS_HINTS.search(text)), "Show a business address or ABN"),
+        _Check("trust", 10, any(host in h for h in hrefs for host in SOCIAL_HOSTS), "Link social profiles"),
+        _Check("trust", 10, any("about" in h for h in hrefs), "Add an About page", quick=False),
+        _Check("trust", 10, year in text, "Footer copyright looks out of date"),
+        # Design
+        _Check("design", 15, p.tags.get("nav", 0) > 0, "No navigation menu", quick=False),
+        _Check("design", 10, p.tags.get("header", 0) > 0, "No distinct page header", quick=False),
+        _Check("design", 10, p.tags.get("footer", 0) > 0, "No page footer", quick=False),
+        _Check("design", 10, any("icon" in r for r in rels), "Add a favicon"),
+        _Check("design", 10, sum("stylesheet" in r for r in rels) <= 5, "Combine stylesheets"),
+        _Check("design", 15, p.inline_styles < 20 and p.tags.get("table", 0) < 3 and p.tags.get("font", 0) == 0,
+               "Dated layout (inline styles / tables / <font>)", quick=False),
+        _Check("design", 10, h1 > 0 and h2 > 0, "Heading hierarchy is flat"),
+        _Check("design", 10, p.images > 0, "No imagery", quick=False),
+        _Check("design", 10, 150 <= words <= 2500, "Content is too thin or too long", quick=False),
+    ]
+
+
+def analyze_html(html: str, final_url: str) -> Dict[str, Any]:
+    """Score a page on the five AuditScore dimensions and validate the result."""
+    parser = _PageParser()
+    parser.feed(html)
+    parser.close()
+    checks = _checks(parser, final_url)
+
+    scores, totals = {}, {}
+    for c in checks:
+        totals[c.dimension] = totals.get(c.dimension, 0) + c.weight
+        scores[c.dimension] = scores.get(c.dimension, 0) + (c.weight if c.passed else 0)
+    scores = {dim: round(100 * scores[dim] / totals[dim]) for dim in totals}
+
+    failed = sorted((c for c in checks if not c.passed), key=lambda c: -c.weight)
+    host = urlsplit(final_url).hostname or final_url
+    weakest = min(scores, key=scores.get)
+    overall = round(sum(scores.values()) / len(scores))
+    result = {
+        "scores": scores,
+        "finding_summary": f"{host} scores {overall}/100 overall; weakest area is {weakest} ({scores[weakest]}/100).",
+        "quick_wins": [c.message for c in failed if c.quick][:10],
+        "weaknesses": [c.message for c in failed if not c.quick][:10],
+    }
+    validation.adapter("Analysis").validate_python(result)
+    return result
+
+
+def no_website_result() -> Dict[str, Any]:
+    # Not an error: a lead without a site is the biggest opportunity there is
+    return {
+        "scores": {"design": 0, "seo": 0, "conversion": 0, "trust": 0, "mobile": 0},
+        "finding_summary": "No website on record for this business.",
+        "quick_wins": [],
+        "weaknesses": ["No website"],
+    }
+
+
+# ======================
+# Engine
+# ======================
+class AuditEngine:
+    def __init__(
+        self,
+        concurrency: int = AUDIT_CONCURRENCY,
+        per_host: int = AUDIT_PER_HOST,
+        timeout: float = AUDIT_TIMEOUT,
+        max_body_bytes: int = AUDIT_MAX_BODY_BYTES,
+        parse_workers: int = AUDIT_PARSE_WORKERS,
+        cache: Optional[PageCache] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_body_bytes = max_body_bytes
+        self.parse_workers = parse_workers
+        self.cache = cache
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        # Only hosts with a fetch in flight keep a semaphore; idle ones drop out
+        self._hosts: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        # Audits in flight by normalized URL, so a URL requested by many leads
+        # at once is fetched and parsed once
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def __aenter__(self) -> "AuditEngine":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=min(5.0, self.timeout)),
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+            transport=self._transport,
+        )
+        self._global = asyncio.Semaphore(self.concurrency)
+        if self.parse_workers > 0:
+            self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+
+    async def aclose(self):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+        if self._parse_pool:
+            self._parse_pool.shutdown(wait=False, cancel_futures=True)
+            self._parse_pool = None
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        sem = self._hosts.get(host)
+        if sem is None:
+            sem = self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return sem
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchedPage:
+        """GET a page, reading at most max_body_bytes of it."""
+        start = time.perf_counter()
+        async with self._global, self._host_limit(url):
+            try:
+                async with self._client.stream("GET", url, headers=headers) as resp:
+                    chunks, size, truncated = [], 0, False
+                    async for chunk in resp.aiter_bytes():
+                        chunks.append(chunk)
+                        size += len(chunk)
+                        if size >= self.max_body_bytes:
+                            truncated = True
+                            break
+                    raw = b"".join(chunks)[:self.max_body_bytes]
+                    body = raw.decode(resp.encoding or "utf-8", errors="replace")
+                    return FetchedPage(url, str(resp.url), resp.status_code, dict(resp.headers), body,
+                                       truncated, time.perf_counter() - start)
+            except httpx.HTTPError as e:
+                raise AuditError(f"Fetch failed for {url}: {type(e).__name__}: {e}") from e
+
+    async def parse(self, body: str, final_url: str) -> Dict[str, Any]:
+        if self._parse_pool is None:
+            return analyze_html(body, final_url)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._parse_pool, analyze_html, body, final_url)
+
+    async def analyze(self, page: FetchedPage) -> Dict[str, Any]:
+        if page.status >= 400:
+            raise AuditError(f"Fetch failed for {page.url}: HTTP {page.status}")
+        return await self.parse(page.body, page.final_url)
+
+    async def audit(self, url: Optional[str]) -> Dict[str, Any]:
+        if not url:
+            return no_website_result()
+        if self.cache is None:
+            return await self.analyze(await self.fetch(url))
+        key = normalize_url(url)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(self._audit_cached(url))
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _audit_cached(self, url: str) -> Dict[str, Any]:
+        cache = self.cache
+        entry = cache.get_page(url)
+        if entry is not None and entry.fresh(cache.ttl):
+            result = cache.get_result(url, "audit", entry.content_hash)
+            body = None if result is not None else cache.get_body(entry)
+            if result is not None or body is not None:
+                cache.record("hits")
+                if result is None:
+                    result = await self.parse(body, entry.final_url)
+                    cache.put_result(url, "audit", entry.content_hash, result)
+                return result
+
+        page = await self.fetch(url, headers=entry.validators() if entry else None)
+        if page.status == 304 and entry is not None:
+            cache.touch(entry, page.headers)
+            digest, final_url, body = entry.content_hash, entry.final_url, None
+        else:
+            if page.status >= 400 or page.status == 304:
+                raise AuditError(f"Fetch failed for {page.url}: HTTP {page.status}")
+            stored = cache.put_page(url, page.final_url, page.status, page.headers, page.body, page.truncated)
+            digest, final_url, body = stored.content_hash, page.final_url, page.body
+
+        result = cache.get_result(url, "audit", digest) if entry is not None and entry.content_hash == digest else None
+        if result is not None:
+            cache.record("revalidated")
+            return result
+        cache.record("misses")
+        if entry is not None:
+            cache.record("changed")
+        if body is None:
+            body = cache.get_body(entry)
+            if body is None:
+                # Evicted between the 304 and now; the runner's retry refetches it
+                raise AuditError(f"Cached body for {url} was evicted during revalidation")
+        result = await self.parse(body, final_url)
+        cache.put_result(url, "audit", digest, result)
+        return result
+
+    async def audit_many(self, urls: List[Optional[str]]) -> List[Any]:
+        """Audit concurrently; failures come back as AuditError instances in place."""
+        return await asyncio.gather(*(self.audit(url) for url in urls), return_exceptions=True)
+
+
+class BackgroundEngine:
+    """An AuditEngine on a private event-loop thread, callable from sync code."""
+
+    def __init__(self, **engine_kwargs):
+        self._kwargs = engine_kwargs
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.engine: Optional[AuditEngine] = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="audit-engine", daemon=True)
+            self._thread.start()
+            self.engine = AuditEngine(**{"cache": get_cache(), **self._kwargs})
+            asyncio.run_coroutine_threadsafe(self.engine.start(), self._loop).result()
+
+    def run(self, coro_fn, *args, timeout: Optional[float] = None):
+        self._ensure_started()
+        fut = asyncio.run_coroutine_threadsafe(coro_fn(self.engine, *args), self._loop)
+        try:
+            return fut.result(timeout)
+        except TimeoutError:
+            fut.cancel()  # don't leave the work running on the loop
+            raise
+
+    def close(self):
+        with self._lock:
+            if not self._loop:
+                return
+            asyncio.run_coroutine_threadsafe(self.engine.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = self._thread = self.engine = None
+
+
+_background = BackgroundEngine()
+
+
+def audit_website(url: Optional[str]) -> Dict[str, Any]:
+    """Synchronous entry point for stage functions."""
+    if not url:
+        return no_website_result()
+    return _background.run(AuditEngine.audit, url, timeout=AUDIT_TIMEOUT * 2 + 30)
+
+
+def audit_websites(urls: List[str]) -> List[Any]:
+    """Audit many sites concurrently from sync code; failures come back as exceptions in place."""
+    urls = list(urls)
+    # Every AUDIT_CONCURRENCY sites are one more round of fetches
+    rounds = max(1, -(-len(urls) // AUDIT_CONCURRENCY))
+    return _background.run(AuditEngine.audit_many, urls, timeout=AUDIT_TIMEOUT * 2 * rounds + 30)
+
+
+def shutdown():
+    _background.close()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark: audits per minute against a local fixture server.
+
+Serves a mix of the canned good/poor sites from --hosts distinct ports (so
+the per-host limit applies as it would across real lead sites) with an
+optional response delay to mimic slow small-business hosting.
+
+    python bench_audit.py --audits 2000 --hosts 50 --latency-ms 100 --parse-workers 4
+"""
+import argparse
+import asyncio
+import time
+
+from audit import AUDIT_CONCURRENCY, AUDIT_PER_HOST, AuditEngine
+from fixture_server import GOOD_SITE, POOR_SITE, FixtureServer, canned_site
+
+
+async def run(urls, args):
+    async with AuditEngine(concurrency=args.concurrency, per_host=args.per_host,
+                           parse_workers=args.parse_workers) as engine:
+        start = time.perf_counter()
+        results = await engine.audit_many(urls)
+        return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--audits", type=int, default=1000)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--concurrency", type=int, default=AUDIT_CONCURRENCY)
+    parser.add_argument("--per-host", type=int, default=AUDIT_PER_HOST)
+    parser.add_argument("--parse-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    delay = args.latency_ms / 1000
+    servers = [
+        FixtureServer({"/good": canned_site(GOOD_SITE, delay), "/poor": canned_site(POOR_SITE, delay)}).start()
+        for _ in range(args.hosts)
+    ]
+    try:
+        urls = [servers[i % args.hosts].url("/good" if i % 2 else "/poor") for i in range(args.audits)]
+        results, elapsed = asyncio.run(run(urls, args))
+    finally:
+        for server in servers:
+            server.stop()
+
+    failed = sum(1 for r in results if isinstance(r, Exception))
+    print(f"hosts={args.hosts} latency_ms={args.latency_ms} concurrency={args.concurrency} "
+          f"per_host={args.per_host} parse_workers={args.parse_workers}")
+    print(f"audits: {len(results) - failed} ok, {failed} failed in {elapsed:.2f}s")
+    print(f"throughput: {len(results) / elapsed * 60:.0f} audits/minute")
+
+
+if __name__ == "__main__":
+    main()
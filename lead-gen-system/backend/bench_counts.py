@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Kanban count latency as the jobs table grows.
+
+Grows `jobs` through each size in --sizes (rows spread over every stage and
+status) and times stage_counts(), which reads the trigger-maintained
+stage_counters table, against the GROUP BY over jobs it replaces.
+
+    python bench_counts.py --sizes 10000 100000 1000000
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import db
+import jobs
+
+STATUSES = ["processing", "queued", "running", "completed", "failed"]
+GROUP_BY = "SELECT stage, status, COUNT(*) FROM jobs GROUP BY stage, status"
+
+
+def grow(conn, current: int, target: int) -> float:
+    start = time.perf_counter()
+    with db.transaction():
+        conn.execute(
+            f"""WITH RECURSIVE n(i) AS (SELECT ? UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+                INSERT INTO jobs (business_id, stage, status)
+                SELECT i, json_extract(?, '$[' || (i % {len(jobs.STAGES)}) || ']'),
+                          json_extract(?, '$[' || (i % {len(STATUSES)}) || ']') FROM n""",
+            (current + 1, target, str(jobs.STAGES).replace("'", '"'), str(STATUSES).replace("'", '"'))
+        )
+    return time.perf_counter() - start
+
+
+def time_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(Path(tmp) / "bench.db")
+        import app
+        app.init_db()
+        conn = db.get_conn()
+
+        print(f"{'jobs':>10} {'insert rows/s':>14} {'stage_counters ms':>18} {'GROUP BY ms':>12}")
+        size = 0
+        for target in sorted(args.sizes):
+            elapsed = grow(conn, size, target)
+            rate = (target - size) / elapsed
+            size = target
+            counters = time_ms(jobs.stage_counts, args.repeat)
+            group_by = time_ms(lambda: conn.execute(GROUP_BY).fetchall(), max(3, args.repeat // 4))
+            assert sum(sum(s.values()) for s in jobs.stage_counts().values()) == size
+            print(f"{size:>10} {rate:>14.0f} {counters:>18.3f} {group_by:>12.2f}")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
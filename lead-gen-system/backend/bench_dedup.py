@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: fuzzy duplicate scan over a large businesses table.
+
+Fills a temporary database with --rows synthetic businesses spread over
+--suburbs locations, of which --dup-rate are planted near-duplicates (legal
+suffixes, reordered words, one-letter typos). It then times
+dedup.scan_businesses() and a fuzzy=flag CSV import batch against the full
+table, and reports recall on the planted pairs.
+
+    python bench_dedup.py --rows 500000
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import db
+import dedup
+import importer
+
+FIRST = ["Bright", "Coastal", "Golden", "Green", "Harbour", "Metro", "Northern", "Premier", "Red", "Royal",
+         "Silver", "Smart", "Summit", "Sunset", "True", "Urban", "Valley", "Vital", "West", "Wild"]
+SECOND = ["Leaf", "Star", "Oak", "Bridge", "Stone", "River", "Peak", "Wave", "Field", "Point",
+          "Rock", "Gate", "Hill", "Bay", "Crest", "Ridge", "Lane", "Park", "Way", "Line"]
+TRADES = ["Plumbing", "Dental", "Bakery", "Electrical", "Fitness", "Cafe", "Landscaping", "Cleaning",
+          "Roofing", "Physio", "Pizza", "Florist", "Mechanics", "Painting", "Law", "Accounting"]
+
+
+def variant(rng: random.Random, name: str) -> str:
+    words = name.split()
+    kind = rng.randrange(3)
+    if kind == 0:
+        return name + rng.choice([" Pty Ltd", " Co", " Ltd"])
+    if kind == 1:
+        return " ".join(words[1:] + words[:1])
+    word = rng.randrange(len(words))
+    pos = rng.randrange(1, len(words[word]))
+    words[word] = words[word][:pos] + rng.choice("aeiou") + words[word][pos + 1:]
+    return " ".join(words)
+
+
+def synthesize(rng: random.Random, rows: int, suburbs: int, dup_rate: float):
+    places = [f"Suburb{i}, {rng.choice(['SA', 'WA', 'NSW', 'VIC', 'QLD'])} {1000 + i}" for i in range(suburbs)]
+    out, planted = [], []
+    while len(out) < rows:
+        business_id = len(out) + 1
+        if out and rng.random() < dup_rate:
+            original = rng.choice(out)
+            out.append((business_id, variant(rng, original[1]), original[2]))
+            planted.append((business_id, original[0]))
+        else:
+            name = f"{rng.choice(FIRST)} {rng.choice(SECOND)} {rng.choice(TRADES)}"
+            out.append((business_id, name, rng.choice(places)))
+    return out, planted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--suburbs", type=int, default=2000)
+    parser.add_argument("--dup-rate", type=float, default=0.05)
+    parser.add_argument("--batch", type=int, default=10_000, help="rows in the timed CSV import")
+    parser.add_argument("--threshold", type=float, default=dedup.DEDUP_THRESHOLD)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    rows, planted = synthesize(rng, args.rows, args.suburbs, args.dup_rate)
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(Path(tmp) / "bench.db")
+        import app
+        app.init_db()
+        start = time.perf_counter()
+        with db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO businesses (id, name, location, location_block) VALUES (?,?,?,?)",
+                [(i, name, location, dedup.location_block(location)) for i, name, location in rows]
+            )
+        print(f"loaded {len(rows)} businesses in {time.perf_counter() - start:.1f}s")
+
+        result = dedup.scan_businesses(args.threshold)
+        found = {(dup, canonical) for dup, canonical, _ in result.pairs}
+        # A planted copy counts as found when it lands in its original's cluster
+        cluster_of = {i: c[0] for c in result.clusters for i in c}
+        hits = sum(1 for dup, original in planted if dup in cluster_of and cluster_of[dup] == cluster_of.get(original))
+        print(f"scan: {result.elapsed:.1f}s, {result.compared} pairs compared, {len(found)} duplicates flagged, "
+              f"recall {hits / max(1, len(planted)):.1%} of {len(planted)} planted")
+
+        batch = [(variant(rng, name) if rng.random() < 0.5 else name + " Extra", location)
+                 for _, name, location in rng.sample(rows, args.batch)]
+        lead_importer = importer.LeadImporter("Analysis", fuzzy="flag")
+        start = time.perf_counter()
+        lead_importer.feed("name,location\n" + "".join(f'"{n}","{loc}"\n' for n, loc in batch))
+        report = lead_importer.finish()
+        elapsed = time.perf_counter() - start
+        print(f"import: {args.batch} rows in {elapsed:.1f}s ({args.batch / elapsed:.0f} rows/s), "
+              f"{report.possible_duplicates} held as possible duplicates")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
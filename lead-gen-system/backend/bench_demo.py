@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: demo sites rendered per minute.
+
+Renders --sites generated Rebuild outputs with demo.py in three passes:
+"cold" starts with an empty output directory and bytecode cache, "unchanged"
+renders the same inputs again (every page skipped by its input hash), and
+"edited" changes one CTA per site so every page is rendered again with the
+templates already compiled. Run with --workers 0 to compare against
+rendering in one process. A final "burst" pass sends --clicks page requests
+to random sites through demo_server.py, like prospects opening a mail-out,
+and reports how many files had to be read from disk.
+
+    python bench_demo.py --sites 1000 --workers 4
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import demo
+from demo import DemoBuilder
+from demo_server import DemoServer
+
+PAGES = ("Home", "About", "Services", "Pricing", "Gallery", "Reviews", "FAQ", "Contact")
+LOCATIONS = ("Adelaide, SA", "Perth, WA", "Hobart, TAS", "Darwin, NT", "Cairns, QLD")
+
+
+def sites(count: int, pages: int, cta: str):
+    return [{
+        "business": {"id": i, "name": f"Bench Business {i}", "location": LOCATIONS[i % len(LOCATIONS)]},
+        "rebuild": {
+            "structure": list(PAGES[:pages]),
+            "headings": [f"Heading {n} for business {i}" for n in range(pages)],
+            "CTAs": [cta, "Call Now"],
+            "trust_signals": ["Licensed & insured", f"{100 + i} reviews", "Local since 1998"],
+        },
+    } for i in range(count)]
+
+
+def burst(clicks: int, site_count: int):
+    server = DemoServer()
+    pages = ("", "about.html", "services.html")
+    loads = 0
+    load = server._load
+
+    def counted(*args):
+        nonlocal loads
+        loads += 1
+        return load(*args)
+    server._load = counted
+    start = time.perf_counter()
+    for _ in range(clicks):
+        server.respond(f"{random.randrange(site_count)}/{random.choice(pages)}", {"accept-encoding": "gzip, br"})
+    seconds = time.perf_counter() - start
+    print(f"  {'burst':9} {clicks:6} clicks in {seconds:6.2f}s  {clicks / seconds:10.0f} req/s  "
+          f"{loads:6} files read  {server.stats()['bytes'] / 1e6:6.1f} MB cached")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sites", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=5, choices=range(1, len(PAGES) + 1), metavar="1-8")
+    parser.add_argument("--workers", type=int, default=demo.DEMO_WORKERS, help="0 renders in this process")
+    parser.add_argument("--clicks", type=int, default=20000, help="requests in the serving burst")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        demo.configure(Path(tmp) / "demos", Path(tmp) / "jinja-cache")
+        builder = DemoBuilder(args.workers)
+        print(f"{args.sites} sites x {args.pages} pages, {args.workers} workers")
+        try:
+            for label, cta in (("cold", "Get a Quote"), ("unchanged", "Get a Quote"), ("edited", "Book Online")):
+                r = builder.build(sites(args.sites, args.pages, cta))
+                print(f"  {label:9} {r['sites']:6} sites in {r['seconds']:6.2f}s  "
+                      f"{r['sites_per_minute']:10.0f} sites/min  {r['rendered']:6} rendered  {r['skipped']:6} skipped")
+            burst(args.clicks, args.sites)
+        finally:
+            builder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark: URL discovery throughput in leads resolved per minute.
+
+Imports --leads URL-less leads, then runs discovery.py batches against a
+local fake SearXNG that answers every query after --latency-ms. The leads
+are spread over --chains businesses with several branches each, so the run
+shows the url_discovery cache at work. A second pass re-imports the same
+leads and is answered from the cache alone.
+
+    python bench_discovery.py --leads 2000 --latency-ms 300 --concurrency 16
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import cache
+import db
+import importer
+from app import init_db
+from discovery import UrlDiscovery
+from fixture_server import FixtureServer
+
+LOCATIONS = ("Adelaide, SA", "Perth, WA", "Hobart, TAS", "Darwin, NT", "Cairns, QLD")
+
+
+def fake_searxng(latency: float):
+    def handler(request):
+        time.sleep(latency)
+        query = parse_qs(urlsplit(request.path).query)["q"][0]
+        name = query.rsplit(" ", 2)[0]
+        slug = "".join(c for c in name.lower() if c.isalnum())
+        body = {"query": query, "results": [
+            {"title": f"{name} - Yellow Pages", "url": f"https://www.yellowpages.com.au/{slug}", "content": ""},
+            {"title": f"{name} | Home", "url": f"https://www.{slug}.com.au/", "content": ""},
+        ]}
+        return 200, {"Content-Type": "application/json"}, json.dumps(body)
+    return handler
+
+
+def import_leads(count: int, chains: int):
+    rows = "".join(f'"Bench Lead {i % chains}","{LOCATIONS[i // chains % len(LOCATIONS)]}",\n'
+                   for i in range(count))
+    imp = importer.LeadImporter("Analysis", dedupe=False, discover=True)
+    imp.feed("name,location,website_url\n" + rows)
+    return imp.finish().awaiting_discovery
+
+
+def run_pass(worker: UrlDiscovery, label: str, server: FixtureServer):
+    hits = server.hits("/search")
+    leads, start = 0, time.perf_counter()
+    while True:
+        report = worker.run_batch()
+        if not report["leads"]:
+            break
+        leads += report["leads"]
+    seconds = time.perf_counter() - start
+    print(f"  {label:9} {leads:6} leads in {seconds:6.2f}s  {leads / seconds * 60:10.0f} leads/min  "
+          f"{server.hits('/search') - hits:5} queries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--leads", type=int, default=1000)
+    parser.add_argument("--chains", type=int, default=400, help="distinct business names")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="fake SearXNG response time")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(Path(tmp) / "bench.db")
+        cache.configure(Path(tmp) / "cache.db")
+        init_db()
+        with FixtureServer({"/search": fake_searxng(args.latency_ms / 1000)}) as server:
+            worker = UrlDiscovery(server.url("/"), batch_size=args.batch_size, concurrency=args.concurrency)
+            try:
+                print(f"{args.leads} leads, {args.chains} names, {args.latency_ms:.0f}ms per query, "
+                      f"concurrency {args.concurrency}")
+                import_leads(args.leads, args.chains)
+                run_pass(worker, "search", server)
+                import_leads(args.leads, args.chains)
+                run_pass(worker, "re-import", server)
+            finally:
+                worker.stop()
+        rows = db.get_conn().execute("SELECT COUNT(*) FROM url_discovery").fetchone()[0]
+        print(f"  url_discovery rows: {rows}")
+        cache.get_cache().close()
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
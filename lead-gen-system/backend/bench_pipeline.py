@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Benchmark: API capacity under concurrent pipeline workloads.
+
+Runs the app in-process (httpx ASGI transport, no sockets) with the real job
+runner against a temporary SQLite file. Workloads, in order:
+
+  intake    --intake businesses posted to /api/intake, --concurrency at a time
+  csv       one --csv-rows row upload to /api/upload-csv
+  pipeline  --businesses businesses walked through every stage endpoint,
+            polling /api/status between stages (what test_workflow.py did
+            for one business against a live server)
+  mixed     --mixed-ops status/listing reads with --write-ratio intake writes
+
+Each workload reports throughput and p50/p95/p99 latency per operation.
+--output writes the numbers as JSON, and --compare prints the change against
+an earlier --output file, so runs from two commits can be diffed.
+
+    python bench_pipeline.py --businesses 200 --concurrency 32 --output before.json
+    python bench_pipeline.py --businesses 200 --concurrency 32 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+import cache
+import db
+import demo
+
+WORKLOADS = ("intake", "csv", "pipeline", "mixed")
+LOCATIONS = ("Adelaide, SA", "Perth, WA", "Hobart, TAS", "Darwin, NT", "Cairns, QLD")
+# Endpoint, and the stage a job sits in while that endpoint's work is pending
+PIPELINE = (("analyze", "Analysis"), ("competitors", "Competitors"), ("rebuild", "Rebuild"),
+            ("demo", "Demo"), ("pitch", "Pitch"))
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    # Nearest-rank on an already sorted list
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+class Recorder:
+    """Times every request of one workload by operation name."""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    async def request(self, op: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        resp = await self.client.request(method, url, **kwargs)
+        self.samples[op].append(time.perf_counter() - start)
+        if resp.status_code >= 400:
+            self.errors[f"{op} {resp.status_code}"] += 1
+        return resp
+
+    def observe(self, op: str, seconds: float):
+        self.samples[op].append(seconds)
+
+
+async def fan_out(count: int, concurrency: int, task: Callable[[int], Awaitable[None]]):
+    """Run task(0..count-1) with at most `concurrency` in flight."""
+    indexes = iter(range(count))
+
+    async def worker():
+        for i in indexes:
+            await task(i)
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, count))))
+
+
+# ======================
+# Workloads
+# ======================
+def intake_body(prefix: str, i: int) -> Dict[str, str]:
+    return {"name": f"{prefix} {i}", "location": LOCATIONS[i % len(LOCATIONS)]}
+
+
+async def run_intake(rec: Recorder, args, job_ids: List[int]) -> int:
+    async def one(i):
+        resp = await rec.request("POST /api/intake", "POST", "/api/intake", json=intake_body("Intake", i))
+        if resp.status_code == 200:
+            job_ids.append(resp.json()["job_id"])
+    await fan_out(args.intake, args.concurrency, one)
+    return args.intake
+
+
+async def run_csv(rec: Recorder, args, job_ids: List[int]) -> int:
+    rows = "".join(f'CSV Lead {i},"{LOCATIONS[i % len(LOCATIONS)]}",\n' for i in range(args.csv_rows))
+    body = ("name,location,website_url\n" + rows).encode()
+    resp = await rec.request("POST /api/upload-csv", "POST", "/api/upload-csv",
+                             files={"file": ("bench.csv", body, "text/csv")})
+    return resp.json()["imported"] if resp.status_code == 200 else 0
+
+
+async def run_pipeline(rec: Recorder, args, job_ids: List[int]) -> int:
+    completed = []
+
+    async def one(i):
+        start = time.perf_counter()
+        resp = await rec.request("POST /api/intake", "POST", "/api/intake", json=intake_body("Pipeline", i))
+        if resp.status_code != 200:
+            return
+        business_id, job_id = resp.json()["business_id"], resp.json()["job_id"]
+        for endpoint, stage in PIPELINE:
+            resp = await rec.request(f"POST /api/{endpoint}", "POST", f"/api/{endpoint}",
+                                     json={"business_id": business_id})
+            if resp.status_code >= 400:
+                return
+            while True:
+                await asyncio.sleep(args.poll_ms / 1000)
+                status = (await rec.request("GET /api/status/{job_id}", "GET", f"/api/status/{job_id}")).json()
+                if status["status"] == "failed":
+                    return
+                if status["stage"] != stage or status["status"] == "completed":
+                    break
+        rec.observe("pipeline end-to-end", time.perf_counter() - start)
+        completed.append(job_id)
+    await fan_out(args.businesses, args.concurrency, one)
+    job_ids.extend(completed)
+    return len(completed)
+
+
+async def run_mixed(rec: Recorder, args, job_ids: List[int]) -> int:
+    rng = random.Random(args.seed)
+    known = job_ids or [0]
+
+    async def one(i):
+        if rng.random() < args.write_ratio:
+            resp = await rec.request("POST /api/intake", "POST", "/api/intake", json=intake_body("Mixed", i))
+            if resp.status_code == 200:
+                known.append(resp.json()["job_id"])
+            return
+        read = rng.randrange(4)
+        if read == 0:
+            await rec.request("GET /api/status/{job_id}", "GET", f"/api/status/{rng.choice(known)}")
+        elif read == 1:
+            await rec.request("POST /api/status/batch", "POST", "/api/status/batch",
+                              json={"job_ids": rng.sample(known, min(20, len(known)))})
+        elif read == 2:
+            await rec.request("GET /api/jobs", "GET", "/api/jobs", params={"limit": 50})
+        else:
+            await rec.request("GET /api/counts", "GET", "/api/counts")
+    await fan_out(args.mixed_ops, args.concurrency, one)
+    return args.mixed_ops
+
+
+RUNNERS = {"intake": run_intake, "csv": run_csv, "pipeline": run_pipeline, "mixed": run_mixed}
+# What one counted operation of each workload is
+UNITS = {"intake": "businesses", "csv": "rows", "pipeline": "businesses", "mixed": "requests"}
+
+
+# ======================
+# Harness
+# ======================
+def _slow(fn, latency: float, job):
+    time.sleep(latency)
+    return fn(job)
+
+
+async def run_all(app, args) -> Dict[str, Dict]:
+    results = {}
+    await app._startup()
+    try:
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            job_ids: List[int] = []
+            for name in args.workloads:
+                rec = Recorder(client)
+                start = time.perf_counter()
+                ops = await RUNNERS[name](rec, args, job_ids)
+                seconds = time.perf_counter() - start
+                results[name] = {
+                    "ops": ops,
+                    "unit": UNITS[name],
+                    "seconds": round(seconds, 4),
+                    "throughput": round(ops / seconds, 2) if seconds else 0.0,
+                    "errors": dict(rec.errors),
+                    "latency": {op: summarize(s) for op, s in sorted(rec.samples.items())},
+                }
+    finally:
+        await app._shutdown()
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def report(results: Dict[str, Dict], baseline: Dict[str, Dict]):
+    def change(new, old, higher_is_better):
+        if not old:
+            return ""
+        pct = (new - old) / old * 100
+        worse = pct < 0 if higher_is_better else pct > 0
+        return f" ({pct:+.0f}%{' !' if worse and abs(pct) >= 10 else ''})"
+
+    for name, r in results.items():
+        old = baseline.get(name, {})
+        print(f"\n{name}: {r['ops']} {r['unit']} in {r['seconds']:.2f}s, "
+              f"{r['throughput']:.1f} {r['unit']}/s{change(r['throughput'], old.get('throughput'), True)}")
+        for op, lat in r["latency"].items():
+            old_p95 = old.get("latency", {}).get(op, {}).get("p95_ms")
+            print(f"  {op:32} n={lat['count']:<6} p50={lat['p50_ms']:8.2f}ms  "
+                  f"p95={lat['p95_ms']:8.2f}ms{change(lat['p95_ms'], old_p95, False):10}  p99={lat['p99_ms']:8.2f}ms")
+        if r["errors"]:
+            print(f"  errors: {r['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                        help=f"comma-separated subset of {','.join(WORKLOADS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--intake", type=int, default=1000)
+    parser.add_argument("--csv-rows", type=int, default=20000)
+    parser.add_argument("--businesses", type=int, default=100)
+    parser.add_argument("--mixed-ops", type=int, default=5000)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--poll-ms", type=float, default=10.0, help="status polling interval in the pipeline")
+    parser.add_argument("--workers", type=int, default=8, help="job runner workers")
+    parser.add_argument("--stage-latency-ms", type=float, default=0.0, help="sleep added to every stage")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--compare", type=Path, help="JSON from an earlier --output to diff against")
+    args = parser.parse_args()
+    args.workloads = [w.strip() for w in args.workloads.split(",") if w.strip()]
+    unknown = set(args.workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workload(s): {', '.join(sorted(unknown))}")
+    baseline = json.loads(args.compare.read_text())["workloads"] if args.compare else {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(Path(tmp) / "bench.db")
+        cache.configure(Path(tmp) / "cache.db")
+        demo.configure(Path(tmp) / "demos", Path(tmp) / "jinja-cache")
+        import app
+        app.UPLOAD_DIR = Path(tmp)
+        app.runner.workers = args.workers
+        if args.stage_latency_ms:
+            app.runner.stage_functions = {
+                k: partial(_slow, fn, args.stage_latency_ms / 1000) for k, fn in app.runner.stage_functions.items()
+            }
+        results = asyncio.run(run_all(app, args))
+        cache.get_cache().close()
+
+    report(results, baseline)
+    if args.output:
+        meta = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        }
+        args.output.write_text(json.dumps({"meta": meta, "workloads": results}, indent=2))
+        print(f"\nwrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
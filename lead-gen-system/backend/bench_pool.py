@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark: intake requests/sec with per-call connections vs the pool.
+
+"before" replays the original /api/intake data path (three connections, three
+commits, default rollback journal). "after" drives the real endpoint in-process
+through the ASGI transport, backed by the pooled WAL connections.
+
+    python bench_pool.py --requests 2000 --concurrency 16
+"""
+import argparse
+import asyncio
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import httpx
+
+import db
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS businesses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, location TEXT,
+        website_url TEXT, status TEXT DEFAULT 'pending', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, business_id INTEGER, stage TEXT NOT NULL,
+        status TEXT DEFAULT 'idle', data_json TEXT, last_error TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+'''
+
+
+def legacy_intake(path: Path, i: int):
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO businesses (name, location, website_url, status) VALUES (?,?,?, 'pending')",
+                (f"Business {i}", "Adelaide, SA", None))
+    business_id = cur.lastrowid
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.execute("INSERT INTO jobs (business_id, stage) VALUES (?,?)", (business_id, "Intake"))
+    job_id = cur.lastrowid
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.execute("UPDATE jobs SET stage=?, status=?, data_json=? WHERE id=?", ("Analysis", "processing", None, job_id))
+    conn.commit()
+    conn.close()
+
+
+def bench_before(path: Path, n: int, concurrency: int):
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SCHEMA)
+    errors = 0
+
+    def run(i):
+        nonlocal errors
+        try:
+            legacy_intake(path, i)
+        except sqlite3.OperationalError:
+            errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        list(ex.map(run, range(n)))
+    return time.perf_counter() - start, errors
+
+
+async def bench_after(path: Path, n: int, concurrency: int):
+    db.configure(path)
+    import app
+    app.init_db()
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def run(i):
+            nonlocal errors
+            async with sem:
+                resp = await client.post("/api/intake", json={"name": f"Business {i}", "location": "Adelaide, SA"})
+                if resp.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run(i) for i in range(n)))
+        elapsed = time.perf_counter() - start
+    db.close_all()
+    return elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before, before_err = bench_before(Path(tmp) / "before.db", args.requests, args.concurrency)
+        after, after_err = asyncio.run(bench_after(Path(tmp) / "after.db", args.requests, args.concurrency))
+
+    print(f"{'mode':<8}{'req/s':>12}{'seconds':>10}{'errors':>8}")
+    print(f"{'before':<8}{args.requests / before:>12.0f}{before:>10.2f}{before_err:>8}")
+    print(f"{'after':<8}{args.requests / after:>12.0f}{after:>10.2f}{after_err:>8}")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: push N businesses through all six stages with the job runner.
+
+Each business is taken through Intake, then queued at Analysis with
+auto-advance on, so the runner carries it through Competitors, Rebuild, Demo
+and Pitch. --stage-latency-ms adds a sleep to every stage to mimic network-bound
+work.
+
+    python bench_runner.py --businesses 2000 --workers 8 --executor thread
+"""
+import argparse
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+import db
+import jobs
+import stages
+from runner import JobRunner
+
+
+def _slow(fn, latency: float, job):
+    time.sleep(latency)
+    return fn(job)
+
+
+def seed(n: int):
+    with db.transaction() as conn:
+        for i in range(n):
+            bid = conn.execute(
+                "INSERT INTO businesses (name, location, status) VALUES (?, 'Adelaide, SA', 'pending')",
+                (f"Business {i}",)
+            ).lastrowid
+            job_id = jobs.create_job(bid, "Intake")
+            jobs.start_pipeline([job_id], status="queued")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--businesses", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--stage-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(Path(tmp) / "bench.db")
+        import app
+        app.init_db()
+        seed(args.businesses)
+
+        functions = stages.STAGE_FUNCTIONS
+        if args.stage_latency_ms:
+            functions = {k: partial(_slow, fn, args.stage_latency_ms / 1000) for k, fn in functions.items()}
+        runner = JobRunner(functions, workers=args.workers, executor=args.executor,
+                           auto_advance=True, poll_interval=0.01)
+
+        start = time.perf_counter()
+        runner.start()
+        runner.wait_idle()
+        elapsed = time.perf_counter() - start
+        runner.stop()
+
+        done = db.get_conn().execute("SELECT COUNT(*) FROM jobs WHERE status='completed'").fetchone()[0]
+        db.close_all()
+
+    executions = done * len(stages.STAGE_FUNCTIONS)
+    print(f"executor={args.executor} workers={args.workers} stage_latency_ms={args.stage_latency_ms}")
+    print(f"businesses completed: {done}/{args.businesses} in {elapsed:.2f}s")
+    print(f"throughput: {done / elapsed:.0f} businesses/s, {executions / elapsed:.0f} stage executions/s")
+
+
+if __name__ == "__main__":
+    main()
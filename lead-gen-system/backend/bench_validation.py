@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark: validating and serializing stage outputs.
+
+Compares the naive per-call `Model(**d).json()` with the cached TypeAdapter
+path in validation.py, one output at a time and as one batch per stage. The
+adapter path is two passes (validate_python, then dump_json); the
+"validate_json" row shows that serializing first to validate from JSON is
+slower, not a way to save one.
+
+    python bench_validation.py --results 20000 --stage Analysis
+"""
+import argparse
+import json
+import time
+import warnings
+
+import validation
+from stages import mock_analysis, mock_competitors_analysis, mock_pitch_output, mock_rebuild_output
+
+SAMPLES = {
+    "Analysis": lambda: mock_analysis({}),
+    "Competitors": mock_competitors_analysis,
+    "Rebuild": mock_rebuild_output,
+    "Demo": lambda: {"demo_url": "http://localhost:8000/demos/1/"},
+    "Pitch": mock_pitch_output,
+}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--results", type=int, default=20000)
+    parser.add_argument("--stage", choices=sorted(SAMPLES), default="Analysis")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = parser.parse_args()
+
+    model = validation.STAGE_MODELS[args.stage]
+    outputs = [SAMPLES[args.stage]() for _ in range(args.results)]
+    validation.warm()
+    adapter = validation.adapter(args.stage)
+    warnings.simplefilter("ignore", DeprecationWarning)  # .json() is the pydantic v1 API
+
+    runs = {
+        "Model(**d).json()": lambda: [model(**d).json() for d in outputs],
+        "dump_result (cached adapter)": lambda: [validation.dump_result(args.stage, d) for d in outputs],
+        "validate_batch": lambda: validation.validate_batch(args.stage, outputs),
+        "json.dumps + validate_json": lambda: [
+            adapter.dump_json(adapter.validate_json(json.dumps(d)), exclude_unset=True) for d in outputs],
+    }
+    baseline = None
+    print(f"{args.results} {args.stage} outputs, best of {args.repeat}")
+    for name, fn in runs.items():
+        seconds = min(timed(fn) for _ in range(args.repeat))
+        baseline = baseline or seconds
+        print(f"  {name:30} {seconds * 1e6 / args.results:7.2f} µs/result  "
+              f"{args.results / seconds:10.0f}/s  {baseline / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Page and derived-result cache.
+
+Fetched pages are stored by normalized URL, with their validators (ETag,
+Last-Modified) and the SHA-256 of the body. Bodies live in a content-addressed
+blob table, so the same page served under several URLs is stored once.
+Derived results (an `AuditResult`, a competitor summary, ...) are stored
+against (url, kind) together with the content hash they were computed from,
+and are only reused while the page still has that hash.
+
+Within `CACHE_TTL` an entry is fresh and is served without touching the
+network. After that it is stale, and the next fetch is sent with the stored
+validators. A 304 answer, or a 200 with an unchanged body, keeps the derived
+results. The cache is size-bounded: once blobs exceed `CACHE_MAX_BYTES`, the
+least recently used pages are evicted, and pages older than
+`CACHE_MAX_AGE` are dropped.
+
+The cache is a separate SQLite file (backend/data/cache.db by default) with
+its own connection pool, so a cache purge never contends with the leads DB.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from db import BASE_DIR, ConnectionPool
+
+CACHE_PATH = Path(os.getenv("CACHE_PATH", BASE_DIR / "data" / "cache.db"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(24 * 3600)))
+CACHE_MAX_AGE = float(os.getenv("CACHE_MAX_AGE", str(30 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Eviction runs after this many bytes have been written, not on every put
+EVICT_EVERY_BYTES = 4 * 1024 * 1024
+
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        body BLOB NOT NULL, -- zlib-compressed
+        size INTEGER NOT NULL -- compressed size, counted against CACHE_MAX_BYTES
+    )''',
+    '''CREATE TABLE IF NOT EXISTS pages (
+        url TEXT PRIMARY KEY, -- normalize_url()
+        final_url TEXT NOT NULL,
+        status INTEGER NOT NULL,
+        content_type TEXT,
+        etag TEXT,
+        last_modified TEXT,
+        content_hash TEXT NOT NULL REFERENCES blobs(hash),
+        truncated INTEGER NOT NULL DEFAULT 0,
+        fetched_at REAL NOT NULL, -- unix time of the last 200/304
+        accessed_at REAL NOT NULL
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_pages_accessed ON pages(accessed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_pages_fetched ON pages(fetched_at)",
+    "CREATE INDEX IF NOT EXISTS idx_pages_hash ON pages(content_hash)",
+    '''CREATE TABLE IF NOT EXISTS results (
+        url TEXT NOT NULL,
+        kind TEXT NOT NULL, -- e.g. 'audit'
+        content_hash TEXT NOT NULL,
+        result_json TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (url, kind)
+    )''',
+)
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form used as the cache key.
+
+    Lower-cases scheme and host, drops default ports, fragments and tracking
+    parameters, sorts the query string and gives empty paths a "/".
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "http").lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    netloc = host if port in (None, 80 if scheme == "http" else 443) else f"{host}:{port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, netloc, parts.path or "/", urlencode(query), ""))
+
+
+def content_hash(body: Union[str, bytes]) -> str:
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.sha256(body).hexdigest()
+
+
+@dataclass
+class CachedPage:
+    url: str
+    final_url: str
+    status: int
+    content_type: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: str
+    truncated: bool
+    fetched_at: float
+
+    def fresh(self, ttl: float = CACHE_TTL, now: Optional[float] = None) -> bool:
+        return ((now or time.time()) - self.fetched_at) < ttl
+
+    def validators(self) -> Dict[str, str]:
+        """Headers for a conditional GET."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    def __init__(
+        self,
+        path: Union[str, Path] = CACHE_PATH,
+        ttl: float = CACHE_TTL,
+        max_age: float = CACHE_MAX_AGE,
+        max_bytes: int = CACHE_MAX_BYTES,
+    ):
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._pool = ConnectionPool(path)
+        self._lock = threading.Lock()
+        self._written = 0
+        # hits: fresh page, or derived result reused; misses: nothing usable
+        # stored; revalidated: stale page confirmed by a 304 or same hash
+        self.metrics = Counter()
+        with self._pool.transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    @property
+    def path(self) -> Path:
+        return self._pool.path
+
+    def record(self, name: str, n: int = 1):
+        with self._lock:
+            self.metrics[name] += n
+
+    # ---------- pages ----------
+    def get_page(self, url: str) -> Optional[CachedPage]:
+        key = normalize_url(url)
+        conn = self._pool.connect()
+        row = conn.execute(
+            "SELECT url, final_url, status, content_type, etag, last_modified, content_hash, truncated, fetched_at "
+            "FROM pages WHERE url=?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE pages SET accessed_at=? WHERE url=?", (time.time(), key))
+        return CachedPage(*row[:7], bool(row[7]), row[8])
+
+    def get_body(self, page: CachedPage) -> Optional[str]:
+        row = self._pool.connect().execute("SELECT body FROM blobs WHERE hash=?", (page.content_hash,)).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def put_page(self, url: str, final_url: str, status: int, headers: Dict[str, str], body: str,
+                 truncated: bool = False) -> CachedPage:
+        """Store a 200 response; returns the entry (with its content hash)."""
+        key = normalize_url(url)
+        lower = {k.lower(): v for k, v in headers.items()}
+        digest = content_hash(body)
+        now = time.time()
+        page = CachedPage(key, final_url, status, lower.get("content-type"), lower.get("etag"),
+                          lower.get("last-modified"), digest, truncated, now)
+        with self._pool.transaction() as conn:
+            written = 0
+            if conn.execute("SELECT 1 FROM blobs WHERE hash=?", (digest,)).fetchone() is None:
+                packed = zlib.compress(body.encode("utf-8"), 6)
+                conn.execute("INSERT INTO blobs (hash, body, size) VALUES (?,?,?)", (digest, packed, len(packed)))
+                written = len(packed)
+            conn.execute(
+                '''INSERT INTO pages (url, final_url, status, content_type, etag, last_modified,
+                                      content_hash, truncated, fetched_at, accessed_at)
+                   VALUES (?,?,?,?,?,?,?,?,?,?)
+                   ON CONFLICT(url) DO UPDATE SET
+                     final_url=excluded.final_url, status=excluded.status, content_type=excluded.content_type,
+                     etag=excluded.etag, last_modified=excluded.last_modified, content_hash=excluded.content_hash,
+                     truncated=excluded.truncated, fetched_at=excluded.fetched_at, accessed_at=excluded.accessed_at''',
+                (key, final_url, status, page.content_type, page.etag, page.last_modified,
+                 digest, int(truncated), now, now)
+            )
+        self.record("bytes_written", written)
+        with self._lock:
+            self._written += written
+            due = self._written >= EVICT_EVERY_BYTES
+            if due:
+                self._written = 0
+        if due:
+            self.evict()
+        return page
+
+    def touch(self, page: CachedPage, headers: Optional[Dict[str, str]] = None):
+        """Mark a stale entry fresh again after a 304, taking any new validators."""
+        lower = {k.lower(): v for k, v in (headers or {}).items()}
+        page.etag = lower.get("etag", page.etag)
+        page.last_modified = lower.get("last-modified", page.last_modified)
+        page.fetched_at = time.time()
+        self._pool.connect().execute(
+            "UPDATE pages SET fetched_at=?, accessed_at=?, etag=?, last_modified=? WHERE url=?",
+            (page.fetched_at, page.fetched_at, page.etag, page.last_modified, page.url)
+        )
+
+    # ---------- derived results ----------
+    def get_result(self, url: str, kind: str, digest: str) -> Optional[Dict[str, Any]]:
+        row = self._pool.connect().execute(
+            "SELECT result_json FROM results WHERE url=? AND kind=? AND content_hash=?",
+            (normalize_url(url), kind, digest)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_result(self, url: str, kind: str, digest: str, result: Dict[str, Any]):
+        self._pool.connect().execute(
+            "INSERT OR REPLACE INTO results (url, kind, content_hash, result_json, created_at) VALUES (?,?,?,?,?)",
+            (normalize_url(url), kind, digest, json.dumps(result), time.time())
+        )
+
+    # ---------- eviction ----------
+    def size(self) -> int:
+        return self._pool.connect().execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop expired pages, then LRU pages until under max_bytes. Returns pages removed."""
+        with self._pool.transaction() as conn:
+            removed = conn.execute("DELETE FROM pages WHERE fetched_at < ?", (time.time() - self.max_age,)).rowcount
+            # Also frees bodies orphaned when a page's content changed
+            self._drop_orphans(conn)
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total > self.max_bytes:
+                # Walk pages oldest-access first. A blob shared by several pages
+                # is counted once; it is only freed if all of them go, so the
+                # bound may be overshot until the next pass
+                victims, freed, seen = [], 0, set()
+                for url, digest, size in conn.execute(
+                    "SELECT p.url, p.content_hash, b.size FROM pages p JOIN blobs b ON b.hash = p.content_hash "
+                    "ORDER BY p.accessed_at"
+                ):
+                    victims.append(url)
+                    if digest not in seen:
+                        seen.add(digest)
+                        freed += size
+                    if total - freed <= self.max_bytes:
+                        break
+                conn.execute("DELETE FROM pages WHERE url IN (SELECT value FROM json_each(?))", (json.dumps(victims),))
+                self._drop_orphans(conn)
+                removed += len(victims)
+        self.record("evictions", removed)
+        return removed
+
+    @staticmethod
+    def _drop_orphans(conn):
+        conn.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT content_hash FROM pages)")
+        conn.execute("DELETE FROM results WHERE url NOT IN (SELECT url FROM pages)")
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._pool.connect()
+        pages, blobs, results = (conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                                 for t in ("pages", "blobs", "results"))
+        with self._lock:
+            metrics = dict(self.metrics)
+        lookups = metrics.get("hits", 0) + metrics.get("misses", 0) + metrics.get("revalidated", 0)
+        return {
+            **{k: metrics.get(k, 0) for k in ("hits", "misses", "revalidated", "changed", "evictions", "bytes_written")},
+            "hit_ratio": round((metrics.get("hits", 0) + metrics.get("revalidated", 0)) / lookups, 4) if lookups else None,
+            "pages": pages,
+            "blobs": blobs,
+            "results": results,
+            "bytes": self.size(),
+            "max_bytes": self.max_bytes,
+        }
+
+    def close(self):
+        self._pool.close_all()
+
+
+_cache: Optional[PageCache] = None
+_cache_lock = threading.Lock()
+
+
+def configure(path: Optional[Union[str, Path]] = None, **kwargs) -> PageCache:
+    """Point the module cache at a different file (tests, benchmarks)."""
+    global _cache, CACHE_PATH
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        if path is not None:
+            CACHE_PATH = Path(path)
+        _cache = PageCache(CACHE_PATH, **kwargs)
+        return _cache
+
+
+def get_cache() -> PageCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageCache(CACHE_PATH)
+        return _cache
@@ -0,0 +1,289 @@
+"""
+Competitor research behind the Competitors stage, shared per market.
+
+Leads in the same trade and town have the same competitors, so research is
+keyed by (category, location block), e.g. ("plumber", "adelaide"), instead
+of by job. The category comes from trade words in the business name
+(`category_of`). When a name has none, the name tokens are the category, so
+that lead forms a group of its own.
+
+When a Competitors job finds no fresh `competitor_sets` row for its market,
+the engine researches that market. At the same time it researches every
+other stale market with Competitors jobs queued or running, up to
+COMPETITOR_MARKETS_PER_PASS markets in one pass:
+
+  1. One SearXNG query per market ("plumber Adelaide, SA"), run
+     concurrently. Directories and social sites are dropped (discovery.py).
+  2. Up to COMPETITOR_CANDIDATES sites per market are audited on the shared
+     AuditEngine, in chunks of AUDIT_CONCURRENCY. That means concurrent
+     fetches, and the page cache is shared with Analysis. A chunk that
+     fails or times out only costs its own sites.
+  3. Each market's sites are ranked by overall audit score and the best
+     COMPETITOR_KEEP are stored as `CompetitorInfo` items. A site's strong
+     audit dimensions become its structure_strengths and its failed checks
+     become messaging_gaps.
+
+Jobs whose market is already being researched wait for that run instead of
+starting their own. Every job in a market gets the stored list without the
+lead's own site, cut to the top 3. Rows older than COMPETITOR_TTL_DAYS are
+researched again on next use. A failed refresh falls back to the stale row.
+
+Without SEARXNG_URL the stage keeps returning the mock competitors.
+"""
+import json
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import audit
+import db
+import discovery
+import metrics
+import validation
+from dedup import location_block, name_tokens, normalize_text, url_host
+
+COMPETITOR_TTL_DAYS = float(os.getenv("COMPETITOR_TTL_DAYS", "14"))
+COMPETITOR_CANDIDATES = int(os.getenv("COMPETITOR_CANDIDATES", "6"))
+COMPETITOR_KEEP = int(os.getenv("COMPETITOR_KEEP", "5"))  # stored per market, so a lead's own site can be dropped
+COMPETITOR_MARKETS_PER_PASS = int(os.getenv("COMPETITOR_MARKETS_PER_PASS", "8"))
+COMPETITORS_ENABLED = discovery.DISCOVERY_ENABLED
+COMPETITOR_RESULTS = 10  # search results looked at per market
+
+# (word prefix, category); the first that starts a word of the name wins
+CATEGORY_KEYWORDS = (
+    ("plumb", "plumber"), ("electric", "electrician"), ("roof", "roofer"), ("locksmith", "locksmith"),
+    ("landscap", "landscaper"), ("garden", "gardener"), ("mow", "lawn mowing"), ("lawn", "lawn mowing"),
+    ("clean", "cleaner"), ("paint", "painter"), ("carpent", "carpenter"), ("build", "builder"),
+    ("pest", "pest control"), ("air con", "air conditioning"), ("aircon", "air conditioning"),
+    ("coffee", "cafe"), ("cafe", "cafe"), ("espresso", "cafe"), ("bake", "bakery"), ("pizza", "pizza"),
+    ("restaurant", "restaurant"), ("gym", "gym"), ("fitness", "gym"), ("yoga", "yoga studio"),
+    ("dental", "dentist"), ("dentist", "dentist"), ("physio", "physiotherapist"), ("chiro", "chiropractor"),
+    ("barber", "barber"), ("hair", "hairdresser"), ("beauty", "beauty salon"), ("salon", "beauty salon"),
+    ("mechanic", "mechanic"), ("auto", "mechanic"), ("vet", "vet"), ("accountant", "accountant"),
+    ("accounting", "accountant"), ("lawyer", "lawyer"), ("legal", "lawyer"), ("real estate", "real estate agent"),
+    ("photograph", "photographer"), ("florist", "florist"), ("flower", "florist"),
+)
+# What a high audit score in each dimension says the site does well
+STRENGTHS = {
+    "conversion": "Clear calls to action and enquiry paths",
+    "trust": "Visible trust signals (reviews, accreditations, address)",
+    "seo": "Search-friendly titles, headings and structured data",
+    "mobile": "Mobile-ready layout with tap-to-call",
+    "design": "Clean page structure (navigation, header, footer)",
+}
+STRENGTH_MIN_SCORE = 70
+
+RESEARCHED = metrics.REGISTRY.register(metrics.Counter(
+    "leadgen_competitor_markets_total", "Competitor markets served (fresh, researched, stale, failed)", ("outcome",)))
+
+Market = Tuple[str, str]  # (category, location block)
+
+
+class CompetitorError(Exception):
+    """Research failed and there is nothing stored for the market."""
+
+
+def category_of(name: str, location: Optional[str] = None) -> str:
+    text = " " + normalize_text(name)
+    for prefix, category in CATEGORY_KEYWORDS:
+        if " " + prefix in text:
+            return category
+    return " ".join(name_tokens(name, location))
+
+
+def market_of(business: Dict[str, Any]) -> Market:
+    return category_of(business.get("name") or "", business.get("location")), location_block(business.get("location"))
+
+
+def competitor_name(title: str, url: str) -> str:
+    # "Plumbing Pros | 24/7 Plumber Adelaide" -> "Plumbing Pros"
+    for sep in (" | ", " - ", " – ", " — ", " :: "):
+        title = title.split(sep)[0]
+    return (title.strip() or url_host(url))[:200]
+
+
+def competitor_info(name: str, url: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    scores = result["scores"]
+    strong = sorted((d for d in scores if scores[d] >= STRENGTH_MIN_SCORE), key=lambda d: -scores[d])
+    return {
+        "name": name,
+        "url": url,
+        "structure_strengths": [STRENGTHS[d] for d in strong if d in STRENGTHS][:5],
+        "messaging_gaps": (result["quick_wins"] + result["weaknesses"])[:5],
+        "score": round(sum(scores.values()) / len(scores)),
+    }
+
+
+# ======================
+# Shared table
+# ======================
+def stored(markets: Iterable[Market], ttl_days: float = COMPETITOR_TTL_DAYS) -> Dict[Market, Tuple[list, bool]]:
+    """market -> (competitors, fresh) for the markets researched before."""
+    rows = db.get_conn().execute(
+        "SELECT category, location_block, body, fetched_at > datetime('now', ?) FROM competitor_sets "
+        "JOIN json_each(?) m ON category = m.value ->> 0 AND location_block = m.value ->> 1",
+        (f"-{ttl_days} days", json.dumps([list(m) for m in markets]))
+    ).fetchall()
+    return {(category, block): (json.loads(body), bool(fresh)) for category, block, body, fresh in rows}
+
+
+def store(sets: Dict[Market, Tuple[str, list]]):
+    """Write market -> (location searched, competitors) rows."""
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO competitor_sets (category, location_block, location, body) VALUES (?,?,?,?) "
+            "ON CONFLICT(category, location_block) DO UPDATE SET location=excluded.location, body=excluded.body, "
+            "fetched_at=CURRENT_TIMESTAMP",
+            [(category, block, location, json.dumps(items)) for (category, block), (location, items) in sets.items()]
+        )
+
+
+def pending_markets() -> Dict[Market, str]:
+    """Markets of Competitors jobs and branches waiting or running, each with a location to search."""
+    markets: Dict[Market, str] = {}
+    for name, location in db.get_conn().execute(
+        "SELECT b.name, b.location FROM jobs j JOIN businesses b ON b.id = j.business_id "
+        "WHERE j.stage = 'Competitors' AND j.status IN ('queued', 'running') "
+        "UNION ALL SELECT b.name, b.location FROM job_branches jb JOIN jobs j ON j.id = jb.job_id "
+        "JOIN businesses b ON b.id = j.business_id WHERE jb.stage = 'Competitors' AND jb.status IN ('queued', 'running')"
+    ):
+        markets.setdefault(market_of({"name": name, "location": location}), location or "")
+    return markets
+
+
+# ======================
+# Engine
+# ======================
+class CompetitorEngine:
+    def __init__(self, base_url: str = discovery.SEARXNG_URL, candidates: int = COMPETITOR_CANDIDATES,
+                 keep: int = COMPETITOR_KEEP, ttl_days: float = COMPETITOR_TTL_DAYS, client=None,
+                 audit_many=None):
+        self.base_url = base_url
+        self.candidates = candidates
+        self.keep = keep
+        self.ttl_days = ttl_days
+        self._client = client
+        self._audit_many = audit_many or audit.audit_websites
+        self._lock = threading.Lock()
+        self._inflight: Dict[Market, Future] = {}
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                if discovery.SearxngClient is None:
+                    raise RuntimeError(f"searxng_search not found (looked in {discovery.SEARXNG_SCRIPTS})")
+                self._client = discovery.SearxngClient(self.base_url, concurrency=discovery.DISCOVERY_CONCURRENCY)
+            return self._client
+
+    def research(self, markets: Dict[Market, str]) -> Dict[Market, list]:
+        """Search and audit several markets in one pass; markets whose search failed are left out."""
+        queries = {f"{market[0]} {location}".strip(): market for market, location in markets.items()}
+        batch = self.client.search_many(list(queries), limit=COMPETITOR_RESULTS)
+        candidates: Dict[Market, List[Tuple[str, str]]] = {}
+        for answer in batch["queries"]:
+            if "error" in answer:
+                print(f"Competitor search failed for {answer['query']!r}: {answer['error']}")
+                continue
+            picked, hosts = [], set()
+            for r in answer["results"]:
+                host = url_host(r["url"])
+                if host and host not in hosts and not discovery.is_directory(host):
+                    hosts.add(host)
+                    picked.append((competitor_name(r["title"], r["url"]), r["url"]))
+            candidates[queries[answer["query"]]] = picked[:self.candidates]
+
+        urls = list(dict.fromkeys(url for picked in candidates.values() for _, url in picked))
+        audits = {}
+        for i in range(0, len(urls), audit.AUDIT_CONCURRENCY):
+            chunk = urls[i:i + audit.AUDIT_CONCURRENCY]
+            try:
+                audits.update(zip(chunk, self._audit_many(chunk)))
+            except Exception as e:
+                print(f"Competitor audits failed for {len(chunk)} site(s): {type(e).__name__}: {e}")
+                audits.update((url, e) for url in chunk)
+        found = {}
+        for market, picked in candidates.items():
+            infos = [competitor_info(name, url, audits[url]) for name, url in picked
+                     if not isinstance(audits[url], Exception)]
+            infos.sort(key=lambda info: -info["score"])
+            found[market] = infos[:self.keep]
+        return found
+
+    def refresh(self, markets: Dict[Market, str]) -> Dict[Market, list]:
+        """Research the given markets, joining runs already in flight; market -> competitors."""
+        with self._lock:
+            mine = {m: loc for m, loc in markets.items() if m not in self._inflight}
+            waiting = {m: self._inflight[m] for m in markets if m not in mine}
+            for market in mine:
+                self._inflight[market] = Future()
+        found: Dict[Market, list] = {}
+        try:
+            if mine:
+                # A run that finished since the caller looked may have stored some already
+                found = {m: items for m, (items, fresh) in stored(mine, self.ttl_days).items() if fresh}
+                todo = {m: loc for m, loc in mine.items() if m not in found}
+                if todo:
+                    researched = self.research(todo)
+                    store({m: (todo[m], items) for m, items in researched.items()})
+                    RESEARCHED.inc(len(researched), outcome="researched")
+                    found.update(researched)
+        finally:
+            with self._lock:
+                for market in mine:
+                    self._inflight.pop(market).set_result(found.get(market))
+        for market, fut in waiting.items():
+            found[market] = fut.result()
+        return found
+
+    def for_business(self, business: Dict[str, Any]) -> Dict[str, Any]:
+        """The Competitors output for one lead: its market's top 3 without the lead itself."""
+        market = market_of(business)
+        known = stored([market], self.ttl_days)
+        items, fresh = known.get(market, (None, False))
+        if not fresh:
+            # Research every stale market waiting in the queue along with this one
+            waiting = pending_markets()
+            with self._lock:
+                # Markets another worker is researching right now are theirs
+                waiting = {m: loc for m, loc in waiting.items() if m != market and m not in self._inflight}
+            stale = stored(waiting, self.ttl_days)
+            others = [(m, loc) for m, loc in waiting.items() if not stale.get(m, (None, False))[1]]
+            # Bounded, so one pass never outgrows its audit deadline; the rest go next time
+            batch = dict(others[:max(0, COMPETITOR_MARKETS_PER_PASS - 1)])
+            batch[market] = business.get("location") or ""
+            try:
+                refreshed = self.refresh(batch).get(market)
+            except Exception as e:
+                refreshed = None
+                print(f"Competitor research error for {market}: {e}")
+            if refreshed is not None:
+                items = refreshed
+            elif items is not None:
+                RESEARCHED.inc(outcome="stale")
+            else:
+                RESEARCHED.inc(outcome="failed")
+                raise CompetitorError(f"No competitor research for {market[0]!r} in {market[1]!r}")
+        else:
+            RESEARCHED.inc(outcome="fresh")
+        own = url_host(business.get("website_url"))
+        top3 = [{k: v for k, v in item.items() if k != "score"}
+                for item in items if not own or url_host(item["url"]) != own][:3]
+        result = {"top3": top3}
+        validation.adapter("Competitors").validate_python(result)
+        return result
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+
+engine = CompetitorEngine()
+
+
+def research_competitors(business: Dict[str, Any]) -> Dict[str, Any]:
+    """Synchronous entry point for the Competitors stage function."""
+    return engine.for_business(business)
@@ -0,0 +1,29 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import audit
+import cache
+import db
+import demo
+import joblog
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / "leads.db"
+    db.configure(path)
+    cache.configure(tmp_path / "cache.db")
+    demo.configure(tmp_path / "demos", tmp_path / "jinja-cache")
+    yield path
+    joblog.sink.stop()  # flush buffered events into this test's database
+    audit.shutdown()
+    cache.get_cache().close()
+    db.close_all()
+
+
+@pytest.fixture
+def client(db_path, monkeypatch):
+    import app
+    monkeypatch.setattr(app, "UPLOAD_DIR", db_path.parent)
+    with TestClient(app.app) as c:
+        yield c
@@ -0,0 +1,203 @@
+"""
+SQLite connection pool.
+
+Every thread (the event loop thread included) keeps one long-lived connection
+instead of opening and closing a new one per helper call. The connection lives
+in thread-local storage and is closed when its thread exits, so recycled
+threadpool and worker threads don't leave connections (and their mmap and
+page cache) behind. Connections are
+tuned for concurrent access (WAL journal, synchronous=NORMAL, mmap and a
+larger page cache) and run in autocommit mode: single statements commit on
+their own, and `transaction()` groups several writes into one commit.
+"""
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Union
+
+import metrics
+
+# ======================
+# Configuration
+# ======================
+BASE_DIR = Path(__file__).parent
+DB_PATH = Path(os.getenv("DATABASE_PATH", BASE_DIR / "data" / "leads.db"))
+
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", str(64 * 1024)))
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store=MEMORY",
+    f"PRAGMA mmap_size={MMAP_SIZE}",
+    f"PRAGMA cache_size=-{CACHE_SIZE_KB}",
+)
+
+
+# ======================
+# Pool
+# ======================
+class TimedConnection(sqlite3.Connection):
+    """Connection that reports statement time to metrics (see metrics.record_db).
+
+    Only the execute and commit calls are timed; rows fetched later from a
+    returned cursor are not. That keeps the cost per statement to two clock
+    reads and a counter update.
+    """
+
+    def execute(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            metrics.record_db(time.perf_counter() - start)
+
+    def executemany(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            metrics.record_db(time.perf_counter() - start)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            metrics.record_db(time.perf_counter() - start)
+
+
+class _ThreadConn:
+    """A thread's connection and the callbacks waiting for its transaction to commit."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.after_commit: List[Callable[[], None]] = []
+        # Runs when the owning thread's locals are freed, or from close_all()
+        self.close = weakref.finalize(self, conn.close)
+
+
+class ConnectionPool:
+    """One connection per live thread, closed when the thread exits."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._live: "weakref.WeakSet[_ThreadConn]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            factory=TimedConnection if metrics.METRICS_ENABLED else sqlite3.Connection,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _slot(self) -> _ThreadConn:
+        local = self._local
+        slot = getattr(local, "slot", None)
+        if slot is None:
+            slot = local.slot = _ThreadConn(self._open())
+            with self._lock:
+                self._live.add(slot)
+        return slot
+
+    def connect(self) -> sqlite3.Connection:
+        return self._slot().conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the block in a single write transaction.
+
+        Nested calls join the outer transaction, so helpers that write can be
+        composed inside one endpoint without committing half-way through.
+        """
+        slot = self._slot()
+        conn = slot.conn
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            slot.after_commit.clear()
+            raise
+        else:
+            conn.commit()
+            callbacks, slot.after_commit = slot.after_commit, []
+            for fn in callbacks:
+                fn()
+
+    def after_commit(self, fn: Callable[[], None]):
+        """Run `fn` once the current transaction commits, or now if there is none.
+
+        Dropped if the transaction rolls back, so side effects such as event
+        broadcasts never announce writes that did not happen.
+        """
+        slot = self._slot()
+        if not slot.conn.in_transaction:
+            fn()
+            return
+        slot.after_commit.append(fn)
+
+    def close_all(self):
+        # Threads still running open a fresh connection on their next call
+        with self._lock:
+            slots, self._local = list(self._live), threading.local()
+            self._live = weakref.WeakSet()
+        for slot in slots:
+            slot.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._live)
+
+
+_pool = ConnectionPool(DB_PATH)
+
+
+def configure(path: Optional[Union[str, Path]] = None) -> ConnectionPool:
+    """Point the module pool at a different database file (tests, benchmarks)."""
+    global _pool, DB_PATH
+    _pool.close_all()
+    if path is not None:
+        DB_PATH = Path(path)
+    _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def get_pool() -> ConnectionPool:
+    return _pool
+
+
+def get_conn() -> sqlite3.Connection:
+    return _pool.connect()
+
+
+def transaction():
+    return _pool.transaction()
+
+
+def after_commit(fn: Callable[[], None]):
+    _pool.after_commit(fn)
+
+
+def close_all():
+    _pool.close_all()
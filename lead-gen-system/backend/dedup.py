@@ -0,0 +1,501 @@
+"""
+Business de-duplication.
+
+Exact: `business_key()` reduces a lead to (case-folded name, normalized
+location, website host). `businesses.dedup_key` stores it under a unique
+index, so intake can use INSERT ... ON CONFLICT and get back the business
+that is already there.
+
+Fuzzy: near-duplicates such as "Plumbing Pros Adelaide" and "Plumbing Pros
+Pty Ltd, Adelaide SA" are found by blocking, then scoring. Records are
+blocked by location (`location_block`, stored and indexed on businesses) and,
+within a block, by shared name tokens or token pairs (see `FuzzyIndex`).
+Keys shared by more than `DEDUP_MAX_POSTING` names are too common to be
+useful and are skipped. Each candidate pair is scored by character-trigram
+Jaccard similarity. Trigram sets are hashed into fixed-width bitsets held as
+Python ints, so one `&`, one `|` and two `bit_count()` calls compare a pair
+at C speed (no numpy needed). Pairs scoring at least `DEDUP_THRESHOLD` are
+grouped into clusters with union-find.
+
+    python dedup.py scan [--threshold 0.85] [--flag | --merge]
+    python dedup.py check leads.csv
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+# Default for /api/intake and /api/upload-csv; both take ?dedupe= to override
+INTAKE_DEDUPE = os.getenv("INTAKE_DEDUPE", "true").lower() in ("1", "true", "yes")
+# Near-duplicate handling for intake and CSV imports: off, flag or skip
+DEDUP_FUZZY = os.getenv("DEDUP_FUZZY", "off").lower()
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))
+DEDUP_MAX_POSTING = int(os.getenv("DEDUP_MAX_POSTING", "200"))
+NGRAM_BITS = 1024
+
+# Australian state names -> abbreviations, so "Adelaide, South Australia"
+# and "adelaide sa" normalize alike
+STATES = {
+    "new south wales": "nsw",
+    "victoria": "vic",
+    "queensland": "qld",
+    "south australia": "sa",
+    "western australia": "wa",
+    "tasmania": "tas",
+    "northern territory": "nt",
+    "australian capital territory": "act",
+}
+_NON_WORD = re.compile(r"[^\w]+")
+_STATE_NAMES = re.compile(r"\b(" + "|".join(STATES) + r")\b")
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """Case-fold, strip accents and punctuation, collapse whitespace."""
+    if not value:
+        return ""
+    if not value.isascii():
+        value = unicodedata.normalize("NFKD", value)
+        value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    value = value.casefold().replace("&", " and ").replace("'", "")
+    return " ".join(_NON_WORD.sub(" ", value).split())
+
+
+@lru_cache(maxsize=65536)
+def normalize_location(location: Optional[str]) -> str:
+    # Cached: imports and scans see the same few thousand locations over and over
+    text = _STATE_NAMES.sub(lambda m: STATES[m.group(1)], normalize_text(location))
+    words = text.split()
+    if words and words[-1] == "australia":
+        words.pop()
+    return " ".join(words)
+
+
+def url_host(url: Optional[str]) -> str:
+    """Website host without scheme, "www." or port; "" when there is none."""
+    if not url or not url.strip():
+        return ""
+    url = url.strip()
+    if "://" not in url:
+        url = "http://" + url
+    try:
+        host = (urlsplit(url).hostname or "").lower().rstrip(".")
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def business_key(name: str, location: Optional[str], url: Optional[str] = None) -> str:
+    # Stored keys were backfilled with a frozen copy (see migrations.py); a
+    # change here needs a migration that re-keys businesses
+    return "|".join((normalize_text(name), normalize_location(location), url_host(url)))
+
+
+# ======================
+# Fuzzy matching
+# ======================
+# Words that say nothing about which business it is
+NAME_STOPWORDS = {"pty", "ltd", "limited", "inc", "llc", "proprietary", "co", "company", "the", "and", "of"}
+_POSTCODE = re.compile(r"\b\d{4}\b")
+
+
+@lru_cache(maxsize=65536)
+def location_block(location: Optional[str]) -> str:
+    """Suburb/city part of a location: "North Adelaide, SA 5006" -> "north adelaide"."""
+    words = _POSTCODE.sub(" ", normalize_location(location)).split()
+    while words and words[-1] in STATES.values():
+        words.pop()
+    return " ".join(words)
+
+
+def name_tokens(name: str, location: Optional[str] = None) -> List[str]:
+    """Distinguishing name words: no legal suffixes and no words of the location."""
+    words = normalize_text(name).split()
+    drop = _location_words(location)
+    kept = [w for w in words if w not in drop]
+    return kept or words
+
+
+@lru_cache(maxsize=65536)
+def _location_words(location: Optional[str]) -> frozenset:
+    return NAME_STOPWORDS | frozenset(normalize_location(location).split()) | frozenset(STATES.values())
+
+
+@lru_cache(maxsize=1 << 18)
+def _token_bits(token: str, n: int = 3) -> int:
+    padded = f" {token} "
+    bits = 0
+    for i in range(len(padded) - n + 1):
+        bits |= 1 << (zlib.crc32(padded[i:i + n].encode("utf-8")) % NGRAM_BITS)
+    return bits
+
+
+def ngram_bits(tokens: Iterable[str]) -> int:
+    """Character trigrams of each token hashed into an NGRAM_BITS-wide bitset.
+
+    Tokens are padded one by one, so word order doesn't change the result.
+    """
+    bits = 0
+    for token in tokens:
+        bits |= _token_bits(token)
+    return bits
+
+
+def similarity(a: int, b: int) -> float:
+    union = (a | b).bit_count()
+    return (a & b).bit_count() / union if union else 0.0
+
+
+@dataclass
+class FuzzyRecord:
+    id: int
+    block: str
+    tokens: Tuple[str, ...]  # sorted
+    host: str
+    bits: int
+    size: int = 0  # bits.bit_count()
+    exact: frozenset = frozenset()  # numbers and initials; a typo there is another business
+
+    @classmethod
+    def from_row(cls, business_id: int, name: str, location: Optional[str], url: Optional[str]) -> "FuzzyRecord":
+        tokens = tuple(sorted(name_tokens(name, location)))
+        bits = ngram_bits(tokens)
+        return cls(business_id, location_block(location), tokens, url_host(url), bits, bits.bit_count(),
+                   frozenset(t for t in tokens if t.isdigit() or len(t) <= 3))
+
+
+def score(a: FuzzyRecord, b: FuzzyRecord) -> float:
+    if a.host and b.host:
+        # Two different websites are two businesses; the same one is one
+        return 1.0 if a.host == b.host else 0.0
+    if a.tokens == b.tokens:
+        return 1.0
+    if a.exact != b.exact:
+        return 0.0  # "Coastal Cafe" and "Coastal Cafe 2", "ABC Electrical" and "ABD Electrical"
+    return similarity(a.bits, b.bits)
+
+
+class FuzzyIndex:
+    """Blocked index of records that new records can be matched against.
+
+    Two names are only compared when they share all but one of the shorter
+    name's tokens (one may be misspelt). Within a location block, names of
+    three or more tokens are therefore reached through a shared token pair,
+    and shorter names through a shared token.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, max_posting: int = DEDUP_MAX_POSTING):
+        self.threshold = threshold
+        self.max_posting = max_posting
+        self.records: List[FuzzyRecord] = []
+        # block -> blocking key -> positions in self.records
+        self._all_tokens: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+        self._short_tokens: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+        self._pairs: Dict[str, Dict[tuple, List[int]]] = defaultdict(lambda: defaultdict(list))
+        # Identical token sets always meet, however common their words are
+        self._same_tokens: Dict[str, Dict[tuple, List[int]]] = defaultdict(lambda: defaultdict(list))
+        self._loaded = set()
+        self.compared = 0
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def load_blocks(self, conn, blocks: Iterable[str]):
+        """Add the stored businesses of location blocks not loaded yet."""
+        wanted = sorted(set(blocks) - self._loaded)
+        if not wanted:
+            return
+        self._loaded.update(wanted)
+        for row in conn.execute(
+            "SELECT id, name, location, website_url FROM businesses "
+            "WHERE location_block IN (SELECT value FROM json_each(?)) AND status != 'merged' ORDER BY id",
+            (json.dumps(wanted),)
+        ):
+            self.add(FuzzyRecord.from_row(*row))
+
+    @staticmethod
+    def _token_pairs(record: FuzzyRecord) -> List[tuple]:
+        tokens = sorted(set(record.tokens))
+        return [(a, b) for i, a in enumerate(tokens) for b in tokens[i + 1:]]
+
+    def candidates(self, record: FuzzyRecord) -> set:
+        if record.block not in self._all_tokens:
+            return set()
+        found, limit = set(), self.max_posting
+        if len(record.tokens) <= 2:
+            lookups = [(self._all_tokens[record.block], set(record.tokens))]
+        else:
+            lookups = [(self._short_tokens[record.block], set(record.tokens)),
+                       (self._pairs[record.block], self._token_pairs(record))]
+        for postings, keys in lookups:
+            for key in keys:
+                posting = postings.get(key)
+                if posting and len(posting) <= limit:
+                    found.update(posting)
+        found.update(self._same_tokens[record.block].get(record.tokens, ()))
+        return found
+
+    def best_match(self, record: FuzzyRecord) -> Optional[Tuple[FuzzyRecord, float]]:
+        best, threshold = None, self.threshold
+        for pos in self.candidates(record):
+            other = self.records[pos]
+            if other is record:
+                continue
+            # Jaccard can't exceed the ratio of the two set sizes
+            if not (record.tokens == other.tokens or record.host or other.host) and \
+                    min(record.size, other.size) < threshold * max(record.size, other.size):
+                continue
+            self.compared += 1
+            s = score(record, other)
+            if s >= threshold and (best is None or s > best[1] or (s == best[1] and pos < best[2])):
+                best = (other, s, pos)
+        return best[:2] if best else None
+
+    def add(self, record: FuzzyRecord) -> int:
+        pos = len(self.records)
+        self.records.append(record)
+        block = record.block
+        for token in set(record.tokens):
+            self._all_tokens[block][token].append(pos)
+            if len(record.tokens) <= 2:
+                self._short_tokens[block][token].append(pos)
+        if len(record.tokens) > 2:
+            pairs = self._pairs[block]
+            for pair in self._token_pairs(record):
+                pairs[pair].append(pos)
+        self._same_tokens[block][record.tokens].append(pos)
+        return pos
+
+
+@dataclass
+class ScanResult:
+    pairs: List[Tuple[int, int, float]] = field(default_factory=list)  # (duplicate, canonical, score)
+    clusters: List[List[int]] = field(default_factory=list)
+    records: int = 0
+    compared: int = 0
+    elapsed: float = 0.0
+
+    def to_dict(self, max_clusters: int = 1000) -> Dict:
+        return {
+            "records": self.records,
+            "compared": self.compared,
+            "duplicate_pairs": len(self.pairs),
+            "clusters": len(self.clusters),
+            "sample_clusters": self.clusters[:max_clusters],
+            "elapsed_seconds": round(self.elapsed, 3),
+        }
+
+
+def find_duplicates(rows: Iterable[Sequence], threshold: float = DEDUP_THRESHOLD,
+                    max_posting: int = DEDUP_MAX_POSTING) -> ScanResult:
+    """Cluster (id, name, location, website_url) rows; the lowest id in a cluster is canonical."""
+    start = time.perf_counter()
+    index = FuzzyIndex(threshold, max_posting)
+    parent: Dict[int, int] = {}
+
+    def root(x: int) -> int:
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+
+    scored = []
+    # Rows in id order: each one is compared with the earlier rows of its block
+    for row in sorted(rows, key=lambda r: r[0]):
+        record = FuzzyRecord.from_row(*row[:4])
+        match = index.best_match(record)
+        if match is not None:
+            other, s = match
+            scored.append((record.id, other.id, s))
+            ra, rb = root(record.id), root(other.id)
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+        index.add(record)
+
+    clusters: Dict[int, List[int]] = defaultdict(list)
+    for business_id in {i for pair in scored for i in pair[:2]}:
+        clusters[root(business_id)].append(business_id)
+    result = ScanResult(records=len(index), compared=index.compared)
+    result.pairs = [(dup, root(dup), s) for dup, _, s in scored]
+    result.clusters = sorted(sorted(c) for c in clusters.values())
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+# ======================
+# Persistence
+# ======================
+# businesses.status of a row held back as a likely duplicate: it has no job
+# until the flag is dismissed
+POSSIBLE_DUPLICATE = "possible_duplicate"
+SCAN_SQL = "SELECT id, name, location, website_url FROM businesses WHERE status != 'merged' ORDER BY id"
+
+
+def scan_businesses(threshold: float = DEDUP_THRESHOLD, action: str = "report") -> ScanResult:
+    """Scan the businesses table; `action` is report, flag (record pairs) or merge."""
+    import db
+
+    result = find_duplicates(db.get_conn().execute(SCAN_SQL), threshold)
+    if action == "flag":
+        flag_pairs(result.pairs)
+    elif action == "merge":
+        with db.transaction() as conn:
+            dismissed = set(conn.execute(
+                "SELECT business_id, duplicate_of FROM business_duplicates WHERE status='dismissed'"
+            ).fetchall())
+            for duplicate_id, canonical_id, s in result.pairs:
+                if (duplicate_id, canonical_id) not in dismissed:
+                    merge_business(duplicate_id, canonical_id, s)
+    return result
+
+
+def flag_pairs(pairs: Iterable[Tuple[int, int, float]]):
+    """Record (duplicate, canonical, score) pairs for review; reviewed pairs keep their status."""
+    import db
+
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO business_duplicates (business_id, duplicate_of, score) VALUES (?,?,?) "
+            "ON CONFLICT(business_id, duplicate_of) DO UPDATE SET score=excluded.score",
+            [(dup, canonical, round(s, 4)) for dup, canonical, s in pairs]
+        )
+
+
+def merge_business(duplicate_id: int, canonical_id: int, score: float = 1.0) -> bool:
+    """Retire a duplicate: its unfinished jobs stop and it points at the canonical business."""
+    import db
+    import jobs
+
+    with db.transaction() as conn:
+        live = conn.execute(
+            "SELECT COUNT(*) FROM businesses WHERE id IN (?,?) AND status != 'merged'", (duplicate_id, canonical_id)
+        ).fetchone()[0]
+        if duplicate_id == canonical_id or live != 2:
+            return False
+        conn.execute("UPDATE businesses SET status='merged' WHERE id=?", (duplicate_id,))
+        jobs.close_business_jobs(duplicate_id, status="merged")
+        conn.execute(
+            "INSERT INTO business_duplicates (business_id, duplicate_of, score, status) VALUES (?,?,?,'merged') "
+            "ON CONFLICT(business_id, duplicate_of) DO UPDATE SET status='merged'",
+            (duplicate_id, canonical_id, round(score, 4))
+        )
+    return True
+
+
+def dismiss_flag(business_id: int, duplicate_of: int) -> Optional[Dict]:
+    """Mark a pair as not a duplicate; a held-back business with no other open flag gets its job.
+
+    Returns None when the pair was never flagged.
+    """
+    import db
+    import jobs
+
+    with db.transaction() as conn:
+        if not conn.execute(
+            "UPDATE business_duplicates SET status='dismissed' WHERE business_id=? AND duplicate_of=? RETURNING 1",
+            (business_id, duplicate_of)
+        ).fetchone():
+            return None
+        job_id = None
+        open_flags = conn.execute(
+            "SELECT COUNT(*) FROM business_duplicates WHERE business_id=? AND status='flagged'", (business_id,)
+        ).fetchone()[0]
+        released = conn.execute(
+            "UPDATE businesses SET status='pending' WHERE id=? AND status=? AND ? = 0 RETURNING id",
+            (business_id, POSSIBLE_DUPLICATE, open_flags)
+        ).fetchone()
+        if released:
+            job_id = jobs.create_job(business_id, "Intake")
+            jobs.start_pipeline([job_id])
+    return {"business_id": business_id, "duplicate_of": duplicate_of, "status": "dismissed", "job_id": job_id}
+
+
+def find_flags(limit: int, cursor: Optional[int] = None, descending: bool = False,
+               status: Optional[str] = "flagged") -> List[Dict]:
+    import db
+    from jobs import keyset
+
+    bound, bound_params, order = keyset("d.id", cursor, descending)
+    clause, params = ("d.status = ?", [status]) if status else ("1", [])
+    rows = db.get_conn().execute(
+        "SELECT d.id, d.business_id, d.duplicate_of, d.score, d.status, d.created_at, "
+        "a.name, a.location, a.website_url, b.name, b.location, b.website_url "
+        "FROM business_duplicates d JOIN businesses a ON a.id = d.business_id JOIN businesses b ON b.id = d.duplicate_of "
+        f"WHERE {clause} AND {bound} ORDER BY {order} LIMIT ?",
+        (*params, *bound_params, limit)
+    ).fetchall()
+    return [
+        {
+            "id": r[0], "business_id": r[1], "duplicate_of": r[2], "score": r[3], "status": r[4], "created_at": r[5],
+            "business": {"name": r[6], "location": r[7], "website_url": r[8]},
+            "candidate": {"name": r[9], "location": r[10], "website_url": r[11]},
+        }
+        for r in rows
+    ]
+
+
+# ======================
+# CLI
+# ======================
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Find near-duplicate businesses.")
+    parser.add_argument("--db", help="database path (default DATABASE_PATH)")
+    parser.add_argument("--threshold", type=float, default=DEDUP_THRESHOLD)
+    sub = parser.add_subparsers(dest="command", required=True)
+    scan = sub.add_parser("scan", help="scan the businesses table")
+    mode = scan.add_mutually_exclusive_group()
+    mode.add_argument("--flag", action="store_const", dest="action", const="flag", help="record pairs for review")
+    mode.add_argument("--merge", action="store_const", dest="action", const="merge", help="merge duplicates")
+    check = sub.add_parser("check", help="match a CSV's rows against the table and each other")
+    check.add_argument("csv_path")
+    args = parser.parse_args(argv)
+
+    import db
+    import migrations
+    if args.db:
+        db.configure(args.db)
+    migrations.migrate(db.get_conn())
+
+    if args.command == "scan":
+        result = scan_businesses(args.threshold, args.action or "report")
+        print(json.dumps(result.to_dict(max_clusters=20), indent=2))
+        return 0
+
+    from importer import HEADER_ALIASES, normalize_header
+    index = FuzzyIndex(args.threshold)
+    found = 0
+    with open(args.csv_path, newline="", encoding="utf-8-sig") as fh:
+        reader = csv.reader(fh)
+        columns = {}
+        for i, header in enumerate(next(reader, [])):
+            columns.setdefault(HEADER_ALIASES.get(normalize_header(header)), i)
+        for line, values in enumerate(reader, start=2):
+            row = [values[columns[c]] if columns.get(c, len(values)) < len(values) else ""
+                   for c in ("name", "location", "website_url")]
+            if not row[0].strip():
+                continue
+            # CSV rows get negative ids so they never collide with stored ones
+            record = FuzzyRecord.from_row(-line, *row)
+            index.load_blocks(db.get_conn(), [record.block])
+            match = index.best_match(record)
+            if match:
+                other, s = match
+                target = {"line": -other.id} if other.id < 0 else {"business_id": other.id}
+                print(json.dumps({"line": line, "name": row[0], "matches": target, "score": round(s, 4)}))
+                found += 1
+            index.add(record)
+    print(f"{found} likely duplicate(s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
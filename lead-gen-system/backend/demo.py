@@ -0,0 +1,310 @@
+"""
+Static demo sites behind the Demo stage.
+
+Each Rebuild output (`RebuildOutput`: structure, headings, CTAs,
+trust_signals) becomes a page set under DEMOS_DIR/<business_id>/, one page
+per `structure` entry, with "Home" as index.html. Pages are rendered from
+templates/demo with Jinja2:
+
+  - Templates compile once per process. Their bytecode is kept in a
+    FileSystemBytecodeCache under DEMO_TEMPLATE_CACHE, so pool workers and
+    restarts load compiled code instead of parsing the templates again.
+  - Every page has an input hash covering its render context and the
+    template sources. A site's manifest.json records the hash of each page
+    on disk, and a page whose hash is unchanged is not rendered again.
+    Editing a template changes every hash.
+  - Files are written under a temporary name and renamed into place, so a
+    page being served is never half written. Each one gets precompressed
+    .gz and, with the brotli package installed, .br variants next to it.
+    demo_server.py serves them as they are.
+  - The stylesheet is shared by every site as assets/site.<hash>.css, so
+    browsers can cache it for good.
+
+The Demo stage renders one site per job on the runner's workers.
+`DemoBuilder.build()` renders a batch of sites across a process pool of
+DEMO_WORKERS. `python demo.py build` re-renders every stored Rebuild output,
+e.g. after a template change.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import repeat
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import jinja2
+
+import db
+import metrics
+from db import BASE_DIR
+from results import decode_json
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants only
+    brotli = None
+
+DEMOS_DIR = Path(os.getenv("DEMOS_DIR", BASE_DIR / "data" / "demos"))
+DEMO_TEMPLATE_CACHE = Path(os.getenv("DEMO_TEMPLATE_CACHE", BASE_DIR / "data" / "jinja-cache"))
+DEMO_BASE_URL = os.getenv("DEMO_BASE_URL", "http://localhost:8000/demos").rstrip("/")
+DEMO_WORKERS = int(os.getenv("DEMO_WORKERS", str(min(4, os.cpu_count() or 1))))
+DEMO_BROTLI_QUALITY = int(os.getenv("DEMO_BROTLI_QUALITY", "11"))
+DEMO_TEMPLATES = BASE_DIR / "templates" / "demo"
+MANIFEST = "manifest.json"
+HOME_PAGES = {"home", "homepage", "index"}
+ASSETS = "assets"  # shared by all sites; business ids never collide with it
+# Precompressed variants written next to each file: (Content-Encoding, suffix)
+VARIANTS = (("br", ".br"), ("gzip", ".gz"))
+
+PAGES = metrics.REGISTRY.register(metrics.Counter(
+    "leadgen_demo_pages_total", "Demo pages rendered or skipped as unchanged", ("outcome",)))
+
+
+class DemoError(Exception):
+    pass
+
+
+# ======================
+# Templates (one environment per process)
+# ======================
+@dataclass
+class Templates:
+    env: jinja2.Environment
+    digest: str  # of every template source, part of each page's input hash
+    stylesheet: str  # hashed file name under ASSETS
+    css: bytes
+
+
+_templates: Optional[Templates] = None
+_env_lock = threading.Lock()
+
+
+def environment() -> Templates:
+    """The compiled templates of this process."""
+    global _templates
+    with _env_lock:
+        if _templates is None:
+            DEMO_TEMPLATE_CACHE.mkdir(parents=True, exist_ok=True)
+            env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(str(DEMO_TEMPLATES)),
+                bytecode_cache=jinja2.FileSystemBytecodeCache(str(DEMO_TEMPLATE_CACHE)),
+                autoescape=True,
+                auto_reload=False,  # templates only change with a deploy
+            )
+            sources = hashlib.sha256()
+            for path in sorted(DEMO_TEMPLATES.iterdir()):
+                sources.update(path.name.encode() + b"\0" + path.read_bytes())
+            css = (DEMO_TEMPLATES / "site.css").read_bytes()
+            stylesheet = f"site.{hashlib.sha256(css).hexdigest()[:12]}.css"
+            _templates = Templates(env, sources.hexdigest(), stylesheet, css)
+        return _templates
+
+
+def configure(out_dir: Optional[Union[str, Path]] = None, template_cache: Optional[Union[str, Path]] = None):
+    """Point demo output and the bytecode cache somewhere else (tests, benchmarks)."""
+    global DEMOS_DIR, DEMO_TEMPLATE_CACHE, _templates
+    with _env_lock:
+        if out_dir is not None:
+            DEMOS_DIR = Path(out_dir)
+        if template_cache is not None:
+            DEMO_TEMPLATE_CACHE = Path(template_cache)
+        _templates = None
+
+
+# ======================
+# Rendering
+# ======================
+def demo_url(business_id: int) -> str:
+    return f"{DEMO_BASE_URL}/{business_id}/"
+
+
+def page_file(title: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-")
+    return f"{slug or 'page'}.html"
+
+
+def site_pages(business: Dict[str, Any], rebuild: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """One entry per page: title, file, heading, and whether it is the home or contact page."""
+    structure = [title for title in rebuild.get("structure") or [] if title.strip()] or ["Home"]
+    home = next((i for i, title in enumerate(structure) if title.strip().lower() in HOME_PAGES), 0)
+    headings = iter(rebuild.get("headings") or [])
+    home_heading = next(headings, business.get("name") or structure[home])
+    pages, used = [], set()
+    for i, title in enumerate(structure):
+        file = "index.html" if i == home else page_file(title)
+        stem, n = file[:-5], 2
+        while file in used:
+            file, n = f"{stem}-{n}.html", n + 1
+        used.add(file)
+        pages.append({
+            "title": title,
+            "file": file,
+            "heading": home_heading if i == home else next(headings, title),
+            "is_home": i == home,
+            "is_contact": "contact" in title.lower(),
+        })
+    return pages
+
+
+def _replace(path: Path, data: bytes):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _write(path: Path, data: bytes):
+    """Write a served file with its compressed variants; the variants land first."""
+    for coding, suffix in VARIANTS:
+        variant = path.with_name(path.name + suffix)
+        if coding == "br" and brotli is None:
+            variant.unlink(missing_ok=True)  # never leave a stale one from an older build
+        elif coding == "br":
+            _replace(variant, brotli.compress(data, quality=DEMO_BROTLI_QUALITY))
+        else:
+            _replace(variant, gzip.compress(data, 9, mtime=0))
+    _replace(path, data)
+
+
+def _remove(path: Path):
+    for name in [path.name] + [path.name + suffix for _, suffix in VARIANTS]:
+        path.with_name(name).unlink(missing_ok=True)
+
+
+def render_site(site: Dict[str, Any], out_dir: Optional[Path] = None) -> Dict[str, Any]:
+    """Render one business's pages, skipping those whose input hash is unchanged.
+
+    `site` is {"business": {"id", "name", "location"}, "rebuild": RebuildOutput}.
+    Top-level and given plain dicts, so it runs on a process pool.
+    """
+    templates = environment()
+    business, rebuild = site["business"], site["rebuild"]
+    root = Path(out_dir or DEMOS_DIR)
+    asset = root / ASSETS / templates.stylesheet
+    if not asset.exists():
+        asset.parent.mkdir(parents=True, exist_ok=True)
+        _write(asset, templates.css)
+    target = root / str(business["id"])
+    target.mkdir(parents=True, exist_ok=True)
+    pages = site_pages(business, rebuild)
+    shared = {
+        "business": {"name": business.get("name") or "", "location": business.get("location") or ""},
+        "pages": pages,
+        "ctas": rebuild.get("CTAs") or [],
+        "trust_signals": rebuild.get("trust_signals") or [],
+        "contact_file": next((p["file"] for p in pages if p["is_contact"]), "index.html"),
+        "stylesheet": f"../{ASSETS}/{templates.stylesheet}",
+    }
+    try:
+        previous = json.loads((target / MANIFEST).read_text())["pages"]
+    except (OSError, ValueError, KeyError):
+        previous = {}
+
+    template = templates.env.get_template("page.html")
+    hashes, rendered = {}, 0
+    for page in pages:
+        context = {**shared, "page": page}
+        digest = hashlib.sha256((templates.digest + json.dumps(context, sort_keys=True)).encode()).hexdigest()
+        hashes[page["file"]] = digest
+        if previous.get(page["file"]) == digest and (target / page["file"]).exists():
+            continue
+        _write(target / page["file"], template.render(context).encode())
+        rendered += 1
+    for gone in set(previous) - set(hashes):
+        _remove(target / gone)
+    if hashes != previous:
+        _replace(target / MANIFEST, json.dumps({"pages": hashes}, indent=1).encode())
+    return {"business_id": business["id"], "demo_url": demo_url(business["id"]), "pages": len(pages),
+            "rendered": rendered, "skipped": len(pages) - rendered}
+
+
+def _count(reports: List[Dict[str, Any]]):
+    PAGES.inc(sum(r["rendered"] for r in reports), outcome="rendered")
+    PAGES.inc(sum(r["skipped"] for r in reports), outcome="skipped")
+
+
+def build_demo(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The Demo output for one claimed job, rendered from its Rebuild input."""
+    rebuild = job["inputs"].get("Rebuild")
+    if rebuild is None:
+        raise DemoError(f"No Rebuild output stored for job {job['id']}")
+    report = render_site({"business": job["business"], "rebuild": rebuild})
+    _count([report])
+    return {"demo_url": report["demo_url"]}
+
+
+# ======================
+# Batches
+# ======================
+class DemoBuilder:
+    """Renders batches of sites across a process pool; workers=0 renders in this process."""
+
+    def __init__(self, workers: int = DEMO_WORKERS, out_dir: Optional[Union[str, Path]] = None):
+        self.workers = workers
+        self.out_dir = Path(out_dir or DEMOS_DIR)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def build(self, sites: List[Dict[str, Any]]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        if self.workers <= 0 or len(sites) < 2:
+            reports = [render_site(site, self.out_dir) for site in sites]
+        else:
+            if self._pool is None:
+                # Each worker loads the compiled templates once, from the bytecode cache
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=environment)
+            chunksize = max(1, len(sites) // (self.workers * 4))
+            reports = list(self._pool.map(render_site, sites, repeat(self.out_dir), chunksize=chunksize))
+        _count(reports)
+        seconds = time.perf_counter() - start
+        return {
+            "sites": len(sites),
+            "pages": sum(r["pages"] for r in reports),
+            "rendered": sum(r["rendered"] for r in reports),
+            "skipped": sum(r["skipped"] for r in reports),
+            "seconds": round(seconds, 3),
+            "sites_per_minute": round(len(sites) / seconds * 60, 1) if seconds else None,
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def stored_sites() -> List[Dict[str, Any]]:
+    """Every business with a stored Rebuild output, as render_site() input (latest job wins)."""
+    sites = {}
+    for business_id, name, location, encoding, body in db.get_conn().execute(
+        "SELECT j.business_id, b.name, b.location, r.encoding, r.body FROM stage_results r "
+        "JOIN jobs j ON j.id = r.job_id JOIN businesses b ON b.id = j.business_id "
+        "WHERE r.stage = 'Rebuild' ORDER BY r.job_id"
+    ):
+        sites[business_id] = {"business": {"id": business_id, "name": name, "location": location},
+                              "rebuild": json.loads(decode_json(encoding, body))}
+    return list(sites.values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render demo sites from stored Rebuild outputs")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--db", help="database path (default DATABASE_PATH)")
+    parser.add_argument("--out", help="output directory (default DEMOS_DIR)")
+    parser.add_argument("--workers", type=int, default=DEMO_WORKERS)
+    args = parser.parse_args(argv)
+    if args.db:
+        db.configure(args.db)
+    builder = DemoBuilder(args.workers, args.out)
+    try:
+        print(json.dumps(builder.build(stored_sites())))
+    finally:
+        builder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Serving the generated demo sites at /demos.
+
+Prospects open demo links from pitch emails in bursts right after a send.
+Every file is read from disk once and then served from memory:
+
+  - demo.py writes .gz (and .br, with the brotli package) variants of every
+    page and asset at build time. The best variant the client accepts is
+    sent as is, with Vary: Accept-Encoding. Nothing is compressed or
+    rendered per request.
+  - A size-bounded LRU (DEMO_CACHE_BYTES) holds hot files with all their
+    variants and a strong ETag from the content hash. A cached file is
+    stat()ed at most every DEMO_CACHE_CHECK seconds to pick up re-renders,
+    and only read again when its size or mtime changed. Only in-memory hits
+    are answered on the event loop; stat()s and reads go to the threadpool.
+  - If-None-Match answers 304 without a body.
+  - Hashed assets (assets/site.<hash>.css) are immutable and cached for a
+    year. Pages get DEMO_MAX_AGE seconds.
+  - Files larger than DEMO_CACHE_FILE_MAX stay out of memory and go out as
+    FileResponse, which uses the server's zero-copy path send where it has
+    one.
+
+Dotfiles, manifest.json and the variant files themselves are never served.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Union
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, RedirectResponse, Response
+
+import demo
+import metrics
+
+DEMO_CACHE_BYTES = int(os.getenv("DEMO_CACHE_BYTES", str(64 * 1024 * 1024)))
+DEMO_CACHE_FILE_MAX = int(os.getenv("DEMO_CACHE_FILE_MAX", str(1024 * 1024)))
+DEMO_CACHE_CHECK = float(os.getenv("DEMO_CACHE_CHECK", "1.0"))
+DEMO_MAX_AGE = int(os.getenv("DEMO_MAX_AGE", "300"))
+IMMUTABLE = "public, max-age=31536000, immutable"
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.[A-Za-z0-9]+$")
+HIDDEN_SUFFIXES = tuple(suffix for _, suffix in demo.VARIANTS)
+
+SERVED = metrics.REGISTRY.register(metrics.Counter(
+    "leadgen_demo_responses_total", "Demo site responses (memory, file, not_modified, not_found)", ("outcome",)))
+
+
+@dataclass
+class CachedFile:
+    key: tuple  # (mtime_ns, size) of the plain file when it was read
+    etag: str  # unquoted; variants append their coding
+    content_type: str
+    cache_control: str
+    files: Dict[str, Path]  # content coding ("identity", "gzip", "br") -> file on disk
+    bodies: Optional[Dict[str, bytes]]  # None for files served from disk
+    checked: float = field(default_factory=time.monotonic)
+
+    @property
+    def size(self) -> int:
+        return sum(len(b) for b in self.bodies.values()) if self.bodies else 0
+
+
+def accepted(header: Optional[str]) -> Dict[str, float]:
+    """Accept-Encoding -> {coding: q}."""
+    found = {}
+    for part in (header or "").lower().split(","):
+        coding, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding.strip():
+            found[coding.strip()] = q
+    return found
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    # Weak comparison, as If-None-Match asks for
+    return any(tag.strip() in ("*", etag, "W/" + etag) for tag in header.split(","))
+
+
+class DemoServer:
+    def __init__(self, root: Optional[Union[str, Path]] = None, max_bytes: int = DEMO_CACHE_BYTES,
+                 file_max: int = DEMO_CACHE_FILE_MAX, check_interval: float = DEMO_CACHE_CHECK):
+        self.root = Path(root) if root else None  # None follows demo.DEMOS_DIR
+        self.max_bytes = max_bytes
+        self.file_max = min(file_max, max_bytes)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._files: "OrderedDict[Path, CachedFile]" = OrderedDict()
+        self._bytes = 0
+
+    def _load(self, path: Path, st: os.stat_result) -> CachedFile:
+        files = {"identity": path}
+        for coding, suffix in demo.VARIANTS:
+            variant = path.with_name(path.name + suffix)
+            if variant.is_file():
+                files[coding] = variant
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if content_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+        cache_control = IMMUTABLE if HASHED_NAME.search(path.name) else f"public, max-age={DEMO_MAX_AGE}"
+        key = (st.st_mtime_ns, st.st_size)
+        if st.st_size > self.file_max:
+            return CachedFile(key, f"{st.st_mtime_ns:x}-{st.st_size:x}", content_type, cache_control, files, None)
+        bodies = {coding: file.read_bytes() for coding, file in files.items()}
+        etag = hashlib.sha256(bodies["identity"]).hexdigest()[:24]
+        return CachedFile(key, etag, content_type, cache_control, files, bodies)
+
+    def cached(self, path: Path) -> Optional[CachedFile]:
+        """The file at `path` if it is in memory and was checked recently; never touches the disk."""
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and time.monotonic() - cached.checked < self.check_interval:
+                self._files.move_to_end(path)
+                return cached
+        return None
+
+    def lookup(self, path: Path) -> Optional[CachedFile]:
+        """The file at `path`, stat()ed and re-read when it changed; None when it isn't a file."""
+        hit = self.cached(path)
+        if hit is not None:
+            return hit
+        with self._lock:
+            cached = self._files.get(path)
+        try:
+            st = path.stat()
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            self._forget(path)
+            return None
+        if cached is not None and cached.key == (st.st_mtime_ns, st.st_size):
+            cached.checked = time.monotonic()
+            return cached
+        loaded = self._load(path, st)
+        with self._lock:
+            old = self._files.pop(path, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._files[path] = loaded
+            self._bytes += loaded.size
+            while self._bytes > self.max_bytes and self._files:
+                _, evicted = self._files.popitem(last=False)
+                self._bytes -= evicted.size
+        return loaded
+
+    def _forget(self, path: Path):
+        with self._lock:
+            old = self._files.pop(path, None)
+            if old is not None:
+                self._bytes -= old.size
+
+    def _target(self, path: str) -> Optional[Path]:
+        parts = [p for p in path.split("/") if p]
+        if any(p.startswith(".") for p in parts) or (parts and (parts[-1] == demo.MANIFEST
+                                                              or parts[-1].endswith(HIDDEN_SUFFIXES))):
+            return None
+        target = Path(self.root or demo.DEMOS_DIR).joinpath(*parts)
+        return target / "index.html" if not path or path.endswith("/") else target
+
+    def _missing(self, path: str, target: Optional[Path]) -> Response:
+        parts = [p for p in path.split("/") if p]
+        if target is not None and parts and target.is_dir():
+            # Pages link to each other relatively, so a site needs its trailing slash
+            return RedirectResponse(f"/demos/{'/'.join(parts)}/", status_code=301)
+        SERVED.inc(outcome="not_found")
+        return Response(status_code=404)
+
+    def respond(self, path: str, headers: Mapping[str, str], head: bool = False) -> Response:
+        """The response for GET (or HEAD) /demos/<path>, from sync code."""
+        target = self._target(path)
+        cached = self.lookup(target) if target is not None else None
+        if cached is None:
+            return self._missing(path, target)
+        return self._reply(cached, headers, head)
+
+    async def serve(self, path: str, headers: Mapping[str, str], head: bool = False) -> Response:
+        """respond() for the event loop: only in-memory hits are answered on it."""
+        target = self._target(path)
+        if target is None:
+            return self._missing(path, None)
+        cached = self.cached(target)
+        if cached is None:
+            cached = await run_in_threadpool(self.lookup, target)
+            if cached is None:
+                return await run_in_threadpool(self._missing, path, target)
+        return self._reply(cached, headers, head)
+
+    def _reply(self, cached: CachedFile, headers: Mapping[str, str], head: bool) -> Response:
+        q = accepted(headers.get("accept-encoding"))
+        coding = next((c for c, _ in demo.VARIANTS if c in cached.files and q.get(c, q.get("*", 0)) > 0),
+                      "identity")
+        etag = f'"{cached.etag}"' if coding == "identity" else f'"{cached.etag}-{coding}"'
+        out = {"etag": etag, "cache-control": cached.cache_control, "vary": "Accept-Encoding"}
+        if coding != "identity":
+            out["content-encoding"] = coding
+        if etag_matches(headers.get("if-none-match") or "", etag):
+            SERVED.inc(outcome="not_modified")
+            return Response(status_code=304, headers=out)
+        if cached.bodies is None:
+            SERVED.inc(outcome="file")
+            return FileResponse(cached.files[coding], headers=out, media_type=cached.content_type)
+        SERVED.inc(outcome="memory")
+        body = cached.bodies[coding]
+        out["content-length"] = str(len(body))
+        return Response(b"" if head else body, headers=out, media_type=cached.content_type)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"files": len(self._files), "bytes": self._bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,342 @@
+"""
+Website discovery for leads imported without a URL.
+
+When SEARXNG_URL is set, intake and CSV import leave URL-less leads in the
+Intake stage with status "discovering" (intake answers
+`requires_url_discovery`). `UrlDiscovery` takes them DISCOVERY_BATCH at a
+time and resolves each batch as follows:
+
+  1. It looks every lead up in `url_discovery`. The exact key is name tokens
+     plus location block. A chain key (name tokens only) is stored when the
+     matched domain carries no location words, so the Perth branch of a
+     chain resolved in Adelaide, or a re-imported lead, never queries again.
+  2. The leads still unknown go to SearXNG as "name location" queries, run
+     concurrently over the client's keep-alive pool.
+  3. Each result is ranked by how much of the name shows in its host name
+     and title. Location words and an early position add to the score.
+     Directories and social sites never win.
+  4. website_url and the jobs' move to Analysis are written in one
+     transaction, one UPDATE ... FROM json_each() each.
+
+Leads with no convincing match move on without a URL; Analysis scores them
+as having no website. The outcome is cached too, and retried after
+DISCOVERY_RETRY_DAYS. Search errors leave a lead discovering for the next
+batch.
+
+    python discovery.py [--limit 500]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import db
+import metrics
+from dedup import location_block, name_tokens, normalize_text
+import jobs
+from events import publish_transitions
+from pipeline import FIRST_STAGES
+
+# The client ships with the searxng-web-search skill at the repo root
+SEARXNG_SCRIPTS = Path(os.getenv(
+    "SEARXNG_SCRIPTS", Path(__file__).resolve().parents[2] / "skills" / "searxng-web-search" / "scripts"))
+if SEARXNG_SCRIPTS.is_dir() and str(SEARXNG_SCRIPTS) not in sys.path:
+    sys.path.append(str(SEARXNG_SCRIPTS))
+try:
+    from searxng_search import SearxngClient
+except ImportError:
+    SearxngClient = None
+
+SEARXNG_URL = os.getenv("SEARXNG_URL", "")
+DISCOVERY_ENABLED = bool(SEARXNG_URL) and SearxngClient is not None
+DISCOVERY_BATCH = int(os.getenv("DISCOVERY_BATCH", "100"))
+DISCOVERY_CONCURRENCY = int(os.getenv("DISCOVERY_CONCURRENCY", "8"))
+DISCOVERY_MIN_SCORE = float(os.getenv("DISCOVERY_MIN_SCORE", "0.5"))
+DISCOVERY_RETRY_DAYS = float(os.getenv("DISCOVERY_RETRY_DAYS", "7"))
+DISCOVERY_INTERVAL = float(os.getenv("DISCOVERY_INTERVAL", "5"))
+DISCOVERY_RESULTS = 10  # results ranked per query
+
+DISCOVERING = "discovering"
+REQUIRES_URL_DISCOVERY = "requires_url_discovery"
+NEXT_STAGE = FIRST_STAGES[0]
+
+# Listings, social profiles and marketplaces: they mention the business but aren't its site
+DIRECTORY_HOSTS = {
+    "facebook.com", "instagram.com", "linkedin.com", "twitter.com", "x.com", "youtube.com", "tiktok.com",
+    "yelp.com", "yelp.com.au", "yellowpages.com.au", "truelocal.com.au", "hotfrog.com.au", "localsearch.com.au",
+    "oneflare.com.au", "hipages.com.au", "airtasker.com", "tripadvisor.com", "tripadvisor.com.au",
+    "google.com", "maps.google.com", "wikipedia.org", "seek.com.au", "gumtree.com.au", "abr.business.gov.au",
+    "productreview.com.au", "startlocal.com.au", "womo.com.au", "zomato.com", "ubereats.com", "menulog.com.au",
+}
+_GENERIC_LABELS = {"www", "com", "net", "org", "au", "nz", "co", "biz", "info", "asn", "id"}
+
+RESOLVED = metrics.REGISTRY.register(metrics.Counter(
+    "leadgen_url_discovery_total", "URL discovery outcomes (found, not_found, cached, error)", ("outcome",)))
+
+
+@dataclass
+class Match:
+    url: str
+    score: float
+    chain: bool  # the domain doesn't depend on the location, so it fits every branch
+
+
+def lookup_keys(name: str, location: Optional[str]) -> Tuple[str, str]:
+    """(exact key, chain key) for the url_discovery cache."""
+    tokens = " ".join(name_tokens(name, location))
+    return f"{tokens}|{location_block(location)}", f"{tokens}|*"
+
+
+def _host(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def is_directory(host: str) -> bool:
+    return any(host == d or host.endswith("." + d) for d in DIRECTORY_HOSTS)
+
+
+def rank(name: str, location: Optional[str], results: Sequence[Dict[str, Any]],
+         min_score: float = DISCOVERY_MIN_SCORE) -> Optional[Match]:
+    """Best result whose host/title carries the business name, or None."""
+    tokens = name_tokens(name, location)
+    if not tokens:
+        return None
+    place = {w for w in location_block(location).split() if len(w) > 2}
+    best: Optional[Match] = None
+    for position, result in enumerate(results[:DISCOVERY_RESULTS]):
+        url = result.get("url") or ""
+        host = _host(url)
+        if not host or is_directory(host):
+            continue
+        label = "".join(part for part in host.split(".") if part not in _GENERIC_LABELS)
+        title = set(normalize_text(result.get("title")).split())
+        in_host = sum(1 for t in tokens if t in label) / len(tokens)
+        in_title = sum(1 for t in tokens if t in title) / len(tokens)
+        covered = sum(1 for t in tokens if t in label or t in title) / len(tokens)
+        if not in_host and in_title < 1 or covered < (1 if len(tokens) <= 3 else 0.75):
+            continue  # a page that only mentions (part of) the name in passing
+        text = label + " " + " ".join(title) + " " + normalize_text(result.get("snippet"))
+        located = any(w in text for w in place)
+        score = (0.6 * in_host + 0.3 * in_title + (0.1 if located else 0.0)
+                 + 0.05 * (1 - position / DISCOVERY_RESULTS)
+                 - (0.1 if urlsplit(url).path.strip("/") else 0.0))
+        if score >= min_score and (best is None or score > best.score):
+            scheme = urlsplit(url).scheme or "https"
+            chain = in_host == 1 and not any(w in label for w in place)
+            best = Match(f"{scheme}://{urlsplit(url).hostname}/", round(score, 3), chain)
+    return best
+
+
+# ======================
+# Cache
+# ======================
+def cached(keys: List[str], retry_days: float = DISCOVERY_RETRY_DAYS) -> Dict[str, Optional[str]]:
+    """Known outcomes by key; a None url means searched recently and nothing matched."""
+    rows = db.get_conn().execute(
+        "SELECT lookup_key, url FROM url_discovery WHERE lookup_key IN (SELECT value FROM json_each(?)) "
+        "AND (url IS NOT NULL OR resolved_at > datetime('now', ?))",
+        (json.dumps(keys), f"-{retry_days} days")
+    ).fetchall()
+    return dict(rows)
+
+
+def remember(conn, outcomes: List[Tuple[str, Optional[str], Optional[float]]]):
+    conn.executemany(
+        "INSERT INTO url_discovery (lookup_key, url, score) VALUES (?,?,?) ON CONFLICT(lookup_key) DO UPDATE SET "
+        "url=excluded.url, score=excluded.score, resolved_at=CURRENT_TIMESTAMP",
+        outcomes
+    )
+
+
+# ======================
+# Batches
+# ======================
+class UrlDiscovery:
+    def __init__(self, base_url: str = SEARXNG_URL, batch_size: int = DISCOVERY_BATCH,
+                 concurrency: int = DISCOVERY_CONCURRENCY, interval: float = DISCOVERY_INTERVAL,
+                 min_score: float = DISCOVERY_MIN_SCORE, client=None):
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.interval = interval
+        self.min_score = min_score
+        self._client = client
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._run_lock = threading.Lock()
+        self.totals = {"leads": 0, "found": 0, "not_found": 0, "cached": 0, "queries": 0, "errors": 0}
+        self.busy_seconds = 0.0
+
+    @property
+    def client(self):
+        if self._client is None:
+            if SearxngClient is None:
+                raise RuntimeError(f"searxng_search not found (looked in {SEARXNG_SCRIPTS})")
+            self._client = SearxngClient(self.base_url, concurrency=self.concurrency)
+        return self._client
+
+    def pending(self) -> List[Tuple[int, int, str, Optional[str]]]:
+        return db.get_conn().execute(
+            "SELECT j.id, b.id, b.name, b.location FROM jobs j JOIN businesses b ON b.id = j.business_id "
+            "WHERE j.stage = 'Intake' AND j.status = ? ORDER BY j.id LIMIT ?",
+            (DISCOVERING, self.batch_size)
+        ).fetchall()
+
+    def resolve(self, leads: List[Tuple[int, str, Optional[str]]]) -> Tuple[Dict[int, Optional[Match]], set]:
+        """(business_id -> match or None, ids whose search failed) for (business_id, name, location) leads."""
+        keys = {bid: lookup_keys(name, location) for bid, name, location in leads}
+        known = cached([k for pair in keys.values() for k in pair])
+        found: Dict[int, Optional[Match]] = {}
+        to_search: Dict[str, List[Tuple[int, str, Optional[str]]]] = {}
+        for bid, name, location in leads:
+            exact, chain = keys[bid]
+            for key in (exact, chain):
+                if key in known:
+                    found[bid] = Match(known[key], 1.0, key == chain) if known[key] else None
+                    break
+            else:
+                to_search.setdefault(f"{name} {location or ''}".strip(), []).append((bid, name, location))
+        self.totals["cached"] += len(found)
+        RESOLVED.inc(len(found), outcome="cached")
+
+        failed, outcomes = set(), []
+        if to_search:
+            batch = self.client.search_many(list(to_search), limit=DISCOVERY_RESULTS)
+            self.totals["queries"] += len(to_search)
+            for answer in batch["queries"]:
+                group = to_search[answer["query"]]
+                if "error" in answer:
+                    failed.update(bid for bid, _, _ in group)
+                    continue
+                for bid, name, location in group:
+                    match = rank(name, location, answer["results"], self.min_score)
+                    found[bid] = match
+                    exact, chain = keys[bid]
+                    outcomes.append((exact, match.url if match else None, match.score if match else None))
+                    if match and match.chain:
+                        outcomes.append((chain, match.url, match.score))
+        if outcomes:
+            with db.transaction() as conn:
+                remember(conn, outcomes)
+        self.totals["errors"] += len(failed)
+        RESOLVED.inc(len(failed), outcome="error")
+        return found, failed
+
+    def run_batch(self) -> Dict[str, Any]:
+        """Resolve one batch of discovering jobs and move them to Analysis."""
+        with self._run_lock:
+            start = time.perf_counter()
+            rows = self.pending()
+            if not rows:
+                return {"leads": 0}
+            found, failed = self.resolve([(bid, name, location) for _, bid, name, location in rows])
+            urls = [[bid, m.url] for bid, m in found.items() if m]
+            done = [job_id for job_id, bid, _, _ in rows if bid not in failed]
+            with db.transaction() as conn:
+                conn.execute(
+                    "UPDATE businesses SET website_url = u.value ->> 1 FROM json_each(?) u "
+                    "WHERE businesses.id = u.value ->> 0 AND COALESCE(businesses.website_url, '') = ''",
+                    (json.dumps(urls),)
+                )
+                moved = conn.execute(
+                    "UPDATE jobs SET stage = ?, status = 'processing', updated_at = CURRENT_TIMESTAMP "
+                    "WHERE id IN (SELECT value FROM json_each(?)) AND status = ? RETURNING id",
+                    (NEXT_STAGE, json.dumps(done), DISCOVERING)
+                ).fetchall()
+                publish_transitions((job_id, NEXT_STAGE, "processing") for (job_id,) in moved)
+                jobs.open_branches([job_id for (job_id,) in moved], FIRST_STAGES[1:])
+            elapsed = time.perf_counter() - start
+            found_count = len(urls)
+            self.totals["leads"] += len(done)
+            self.totals["found"] += found_count
+            self.totals["not_found"] += len(done) - found_count
+            self.busy_seconds += elapsed
+            RESOLVED.inc(found_count, outcome="found")
+            RESOLVED.inc(len(done) - found_count, outcome="not_found")
+            return {
+                "leads": len(rows), "found": found_count, "not_found": len(done) - found_count,
+                "errors": len(failed), "seconds": round(elapsed, 3),
+                "leads_per_minute": round(len(done) / elapsed * 60, 1) if elapsed else None,
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        waiting = db.get_conn().execute(
+            "SELECT COUNT(*) FROM jobs WHERE stage = 'Intake' AND status = ?", (DISCOVERING,)
+        ).fetchone()[0]
+        rate = self.totals["leads"] / self.busy_seconds * 60 if self.busy_seconds else None
+        return {"enabled": DISCOVERY_ENABLED, "waiting": waiting, **self.totals,
+                "leads_per_minute": round(rate, 1) if rate else None}
+
+    # ---------- background worker ----------
+    def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                report = self.run_batch()
+            except Exception as e:
+                print(f"URL discovery error: {e}")
+                report = {"leads": 0}
+            # Full batches go straight on; otherwise wait for new leads or the interval
+            if report["leads"] < self.batch_size or report.get("errors"):
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        if self._thread:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="url-discovery", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find websites for leads waiting in URL discovery")
+    parser.add_argument("--db", help="database path (default DATABASE_PATH)")
+    parser.add_argument("--base-url", default=SEARXNG_URL)
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many leads")
+    parser.add_argument("--batch-size", type=int, default=DISCOVERY_BATCH)
+    args = parser.parse_args(argv)
+    if not args.base_url:
+        parser.error("set SEARXNG_URL or pass --base-url")
+    if args.db:
+        db.configure(args.db)
+    worker = UrlDiscovery(args.base_url, batch_size=args.batch_size)
+    seen = 0  # leads tried, failed searches included
+    try:
+        while args.limit is None or seen < args.limit:
+            report = worker.run_batch()
+            if not report["leads"]:
+                break
+            seen += report["leads"]
+            print(json.dumps(report))
+            if report["errors"] == report["leads"]:
+                # The same leads come up next; retrying at once would just fail again
+                print("Every search in the batch failed; stopping")
+                break
+    finally:
+        worker.stop()
+    print(json.dumps(worker.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+In-process pub/sub for job transitions, streamed to dashboards over SSE.
+
+`jobs.py` publishes a (job_id, stage, status) event whenever it moves a job,
+after the surrounding transaction commits. Publishing only appends to a
+pending list; a flush on the event loop picks up everything published since
+the last one, gives the batch a sequence number, keeps it in a bounded replay
+log and hands the same batch to every subscriber. A burst of 5,000 transitions
+is therefore one batch to each client, and no client ever queries the DB.
+
+Job counts by stage and status (the Kanban columns) are computed once for all
+clients, at most every `EVENTS_SNAPSHOT_MAX_AGE` seconds. Each stream opens
+with them, and later batches carry them again whenever they were refreshed.
+Event ids are "<epoch>-<seq>". A client reconnecting with `Last-Event-ID`
+(or `?cursor=`) first gets the batches it missed from the replay log. If
+that cursor has fallen out of the log, or comes from before a restart, it
+only gets the snapshot.
+"""
+import asyncio
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import db
+
+EVENTS_BUFFER = int(os.getenv("EVENTS_BUFFER", "20000"))  # transitions kept for resume
+EVENTS_FLUSH_INTERVAL = float(os.getenv("EVENTS_FLUSH_INTERVAL", "0.1"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_SNAPSHOT_MAX_AGE = float(os.getenv("EVENTS_SNAPSHOT_MAX_AGE", "1.0"))
+SUBSCRIBER_QUEUE = 256  # batches buffered per client before it has to resync
+
+# (seq, transitions, counts if they were refreshed for this batch)
+Batch = Tuple[int, List[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue: "asyncio.Queue[Optional[Batch]]" = asyncio.Queue(SUBSCRIBER_QUEUE)
+        self.overflowed = False
+
+    def put(self, item: Optional[Batch]):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # A slow client misses live batches and catches up from the log
+            self.overflowed = True
+
+
+class EventBus:
+    def __init__(
+        self,
+        snapshot: Optional[Callable[[], Dict[str, Any]]] = None,
+        buffer_size: int = EVENTS_BUFFER,
+        flush_interval: float = EVENTS_FLUSH_INTERVAL,
+        snapshot_max_age: float = EVENTS_SNAPSHOT_MAX_AGE,
+    ):
+        self.snapshot_fn = snapshot
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.snapshot_max_age = snapshot_max_age
+        self.epoch = secrets.token_hex(4)
+        self.seq = 0
+        self._log: Deque[Tuple[int, List[Dict[str, Any]]]] = deque()
+        self._logged = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Set[Subscriber] = set()
+        self._snapshot: Optional[Tuple[float, Dict[str, Any]]] = None
+
+    # ---------- lifecycle ----------
+    @property
+    def active(self) -> bool:
+        return self._loop is not None
+
+    async def start(self, snapshot: Optional[Callable[[], Dict[str, Any]]] = None):
+        if snapshot is not None:
+            self.snapshot_fn = snapshot
+        self._loop = asyncio.get_running_loop()
+
+    def stop(self):
+        self._flush()
+        self._loop = None
+        for sub in list(self._subscribers):
+            sub.put(None)
+        self._subscribers.clear()
+
+    # ---------- publishing (any thread) ----------
+    def publish(self, events: List[Dict[str, Any]]):
+        loop = self._loop
+        if not events or loop is None:
+            return
+        with self._lock:
+            self._pending.extend(events)
+            schedule = not self._scheduled
+            self._scheduled = True
+        if schedule:
+            try:
+                loop.call_soon_threadsafe(loop.call_later, self.flush_interval, self._flush)
+            except RuntimeError:
+                pass  # loop already closed during shutdown
+
+    def _flush(self):
+        # Runs on the loop; one batch per flush interval however many events arrived
+        with self._lock:
+            events, self._pending = self._pending, []
+            self._scheduled = False
+        if not events:
+            return
+        self.seq += 1
+        self._log.append((self.seq, events))
+        self._logged += len(events)
+        while self._logged > self.buffer_size and len(self._log) > 1:
+            self._logged -= len(self._log.popleft()[1])
+        if not self._subscribers:
+            return
+        previous = self._snapshot
+        counts = self.snapshot()
+        batch = (self.seq, events, counts if self._snapshot is not previous else None)
+        for sub in self._subscribers:
+            sub.put(batch)
+
+    # ---------- subscribing (loop thread) ----------
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber()
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subscribers.discard(sub)
+
+    def cursor(self, seq: Optional[int] = None) -> str:
+        return f"{self.epoch}-{self.seq if seq is None else seq}"
+
+    def parse_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        """Sequence number for a cursor from this process, else None."""
+        if not cursor:
+            return None
+        epoch, _, seq = cursor.rpartition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self.seq:
+            return None
+        return int(seq)
+
+    def since(self, seq: int) -> Optional[List[Batch]]:
+        """Batches after `seq`, or None when some of them were already dropped."""
+        if seq == self.seq:
+            return []
+        if not self._log or self._log[0][0] > seq + 1:
+            return None
+        return [(batch_seq, events, None) for batch_seq, events in self._log if batch_seq > seq]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counts shared by every client, recomputed at most once per max age."""
+        now = time.monotonic()
+        if self._snapshot is None or now - self._snapshot[0] > self.snapshot_max_age:
+            self._snapshot = (now, self.snapshot_fn() if self.snapshot_fn else {})
+        return self._snapshot[1]
+
+
+def _sse(event: str, data: Any, event_id: Optional[str] = None) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def sse_stream(bus: EventBus, last_event_id: Optional[str] = None,
+                     heartbeat: float = EVENTS_HEARTBEAT) -> AsyncIterator[str]:
+    """Missed batches (on resume), a counts snapshot, then live batches, as SSE text."""
+    sub = bus.subscribe()
+    try:
+        delivered = bus.parse_cursor(last_event_id)
+        while True:
+            missed = bus.since(delivered) if delivered is not None else None
+            for seq, events, _ in missed or ():
+                yield _sse("transitions", {"events": events}, bus.cursor(seq))
+            delivered = bus.seq
+            yield _sse("snapshot", {"counts": bus.snapshot()}, bus.cursor(delivered))
+            sub.overflowed = False
+
+            while not sub.overflowed:
+                try:
+                    item = await asyncio.wait_for(sub.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    return
+                seq, events, counts = item
+                if seq <= delivered:
+                    continue
+                data = {"events": events}
+                if counts is not None:
+                    data["counts"] = counts
+                yield _sse("transitions", data, bus.cursor(seq))
+                delivered = seq
+            # Overflowed: drop what is queued and resync from the log
+            while not sub.queue.empty():
+                if sub.queue.get_nowait() is None:
+                    return
+    finally:
+        bus.unsubscribe(sub)
+
+
+bus = EventBus()
+
+
+def publish_transitions(rows, branch: bool = False):
+    """Announce (job_id, stage, status) rows once the current transaction commits.
+
+    Branch events (a stage running beside the job's primary one, see jobs.py)
+    carry "branch": true, so a board keyed by job can skip them.
+    """
+    if not bus.active:
+        return
+    events = [{"job_id": job_id, "stage": stage, "status": status} for job_id, stage, status in rows]
+    if branch:
+        for event in events:
+            event["branch"] = True
+    if events:
+        db.after_commit(lambda: bus.publish(events))
@@ -0,0 +1,130 @@
+"""
+Local HTTP server for canned responses, used by tests and benchmarks.
+
+Routes map a path to a (status, headers, body) tuple or to a callable that
+takes the request handler and returns one. Every request is recorded in
+`server.requests` so tests can assert what was (or wasn't) fetched.
+
+    with FixtureServer({"/": (200, {"Content-Type": "text/html"}, "<html>…")}) as server:
+        httpx.get(server.url("/"))
+"""
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Tuple, Union
+
+Response = Tuple[int, Dict[str, str], Union[str, bytes]]
+Route = Union[Response, Callable[[BaseHTTPRequestHandler], Response]]
+
+# ======================
+# Canned sites
+# ======================
+GOOD_SITE = """<!doctype html>
+<html lang="en-AU"><head>
+<meta charset="utf-8">
+<title>Plumbing Pros Adelaide | 24/7 Emergency Plumbers</title>
+<meta name="description" content="Licensed Adelaide plumbers for blocked drains, hot water and emergency repairs. Fixed-price quotes, same-day service.">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<link rel="canonical" href="https://plumbingpros.example/">
+<link rel="icon" href="/favicon.ico">
+<link rel="stylesheet" href="/site.css">
+<script type="application/ld+json">{"@type": "Plumber", "name": "Plumbing Pros Adelaide"}</script>
+<style>@media (max-width: 600px) { nav { display: none } }</style>
+</head><body>
+<header><nav><a href="/">Home</a><a href="/services">Services</a><a href="/about">About us</a><a href="/contact">Contact</a></nav></header>
+<main>
+<h1>Adelaide's trusted emergency plumbers</h1>
+<p>Family-owned and fully licensed since 1998, serving every Adelaide suburb with upfront pricing.
+Call 08 8123 4567 or visit us at 12 King William Street, Adelaide SA 5000. ABN 12 345 678 901.</p>
+<a class="btn" href="/quote">Get a free quote</a>
+<a href="tel:+61881234567">Call now</a>
+<h2>Services</h2><p>Blocked drains, hot water systems, gas fitting, leak detection and bathroom renovations.</p>
+<img src="/van.jpg" srcset="/van-2x.jpg 2x" alt="Our service van">
+<h2>Testimonials</h2><blockquote>Fantastic service, five star reviews well deserved!</blockquote>
+<form action="/quote"><input name="email"><button type="submit">Book a plumber</button></form>
+</main>
+<footer><a href="/privacy">Privacy policy</a> <a href="https://facebook.com/plumbingpros">Facebook</a>
+<a href="mailto:hello@plumbingpros.example">Email us</a> © {year} Plumbing Pros</footer>
+</body></html>
+""".replace("{year}", str(date.today().year))  # audit.py wants the current year
+
+POOR_SITE = """<html><head><title>Home</title></head>
+<body style="width:1024px">
+<table width="1024"><tr><td style="font-size:11px">Welcome to our website</td></tr></table>
+<img src="banner.gif"><img src="logo.gif">
+<p style="color:red">Under construction</p>
+</body></html>
+"""
+
+
+def canned_site(html: str = GOOD_SITE, delay: float = 0.0) -> Route:
+    def handler(request):
+        if delay:
+            time.sleep(delay)
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, html
+    return handler if delay else (200, {"Content-Type": "text/html; charset=utf-8"}, html)
+
+
+class FixtureServer:
+    def __init__(self, routes: Dict[str, Route] = None):
+        self.routes: Dict[str, Route] = dict(routes or {})
+        self.requests: List[Tuple[str, str, Dict[str, str]]] = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _serve(self):
+                path = self.path.split("?", 1)[0]
+                with server._lock:
+                    server.requests.append((self.command, self.path, dict(self.headers)))
+                route = server.routes.get(path)
+                if route is None:
+                    status, headers, body = 404, {"Content-Type": "text/plain"}, "not found"
+                else:
+                    status, headers, body = route(self) if callable(route) else route
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            do_GET = do_POST = do_HEAD = _serve
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def url(self, path: str = "/") -> str:
+        return f"http://127.0.0.1:{self.port}{path}"
+
+    def hits(self, path: str) -> int:
+        with self._lock:
+            return sum(1 for _, p, _ in self.requests if p.split("?", 1)[0] == path)
+
+    def start(self) -> "FixtureServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FixtureServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,350 @@
+"""
+Streaming CSV lead importer.
+
+The upload is read in chunks and parsed as complete records arrive, so memory
+stays flat regardless of file size (except in fuzzy mode, whose index keeps
+every imported row to match later ones against). Valid rows are inserted with batched
+`executemany` calls, one transaction per batch, and each batch creates its
+matching `jobs` rows with a single INSERT ... SELECT.
+
+With `dedupe` on, each batch drops keys that already exist with one indexed
+lookup on the unique dedup_key before inserting, and repeats within the batch
+in memory. Only the current batch's keys are held, so a key repeated in a
+later batch is found by that lookup: it counts as a duplicate in the file when
+the stored row came from this import.
+
+`fuzzy` catches near-duplicates that the exact key misses (see dedup.py).
+Each batch loads the stored businesses of its location blocks into a
+`FuzzyIndex` once and matches its rows against them and against the rows
+imported earlier in the file. "flag" inserts a match with status
+possible_duplicate, records the pair and creates no job; "skip" drops it.
+
+With `discover` on, rows without a website_url get their job in Intake with
+status "discovering" instead, for discovery.py to find their site first.
+"""
+import codecs
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+import db
+import metrics
+from dedup import (DEDUP_FUZZY, INTAKE_DEDUPE, POSSIBLE_DUPLICATE, FuzzyIndex, FuzzyRecord, business_key,
+                   location_block)
+import jobs
+from events import publish_transitions
+from pipeline import FIRST_STAGES
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 1000
+MAX_REJECTED_REPORTED = 1000
+
+# Normalized header -> column we store
+HEADER_ALIASES = {
+    "name": "name",
+    "business name": "name",
+    "business": "name",
+    "location": "location",
+    "city": "location",
+    "website url": "website_url",
+    "website": "website_url",
+    "url": "website_url",
+}
+REQUIRED_COLUMNS = ("name", "location")
+MAX_FIELD_LENGTH = {"name": 200, "location": 200, "website_url": 500}
+
+Row = Tuple[str, str, Optional[str]]
+KeyedRow = Tuple[str, str, Optional[str], Optional[str]]  # Row + dedup_key
+FUZZY_MODES = ("off", "flag", "skip")
+
+
+def normalize_header(header: str) -> str:
+    return " ".join(header.lstrip("\ufeff").replace("_", " ").strip().lower().split())
+
+
+class RecordSplitter:
+    """Split decoded text into complete CSV records.
+
+    A line break only ends a record when it is outside a quoted field, which
+    holds exactly when the number of quote characters seen so far is even.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._quotes = 0
+
+    def feed(self, text: str) -> List[str]:
+        records = []
+        current, quotes = self._pending, self._quotes
+        for line in text.splitlines(keepends=True):
+            current += line
+            quotes += line.count('"')
+            if quotes % 2 == 0 and line.endswith(("\n", "\r")):
+                records.append(current)
+                current, quotes = "", 0
+        self._pending, self._quotes = current, quotes
+        return records
+
+    def flush(self) -> List[str]:
+        rest, self._pending, self._quotes = self._pending, "", 0
+        return [rest] if rest.strip() else []
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    rejected: int = 0
+    duplicates_in_file: int = 0
+    duplicates_existing: int = 0
+    duplicates_fuzzy: int = 0  # skipped near-duplicates
+    possible_duplicates: int = 0  # imported but held back for review
+    awaiting_discovery: int = 0  # imported without a URL, waiting in discovery.py
+    batches: List[Dict[str, Any]] = field(default_factory=list)
+    rejected_rows: List[Dict[str, Any]] = field(default_factory=list)
+
+    def reject(self, row_number: int, reason: str, values: List[str]):
+        self.rejected += 1
+        if len(self.rejected_rows) < MAX_REJECTED_REPORTED:
+            self.rejected_rows.append({"row": row_number, "reason": reason, "values": values})
+
+    @property
+    def skipped(self) -> int:
+        return self.duplicates_in_file + self.duplicates_existing + self.duplicates_fuzzy
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "skipped_duplicates": self.skipped,
+            "duplicates_in_file": self.duplicates_in_file,
+            "duplicates_existing": self.duplicates_existing,
+            "duplicates_fuzzy": self.duplicates_fuzzy,
+            "possible_duplicates": self.possible_duplicates,
+            "awaiting_discovery": self.awaiting_discovery,
+            "batches": self.batches,
+            "rejected_rows": self.rejected_rows,
+            "rejected_rows_truncated": self.rejected > len(self.rejected_rows),
+        }
+
+
+class LeadImporter:
+    """Parse CSV text incrementally and write valid rows in batches."""
+
+    def __init__(self, job_stage: str, batch_size: int = BATCH_SIZE, dedupe: bool = INTAKE_DEDUPE,
+                 fuzzy: str = DEDUP_FUZZY, discover: bool = False):
+        if fuzzy not in FUZZY_MODES:
+            raise ValueError(f"fuzzy must be one of {', '.join(FUZZY_MODES)}")
+        self.job_stage = job_stage
+        self.batch_size = batch_size
+        self.dedupe = dedupe
+        self.fuzzy = fuzzy
+        self.discover = discover
+        self._index = FuzzyIndex() if fuzzy != "off" else None
+        self.report = ImportReport()
+        self._splitter = RecordSplitter()
+        self._columns: Optional[Dict[str, int]] = None
+        self._row_number = 0
+        self._pending: List[KeyedRow] = []
+        self._batch_keys = set()  # keys in _pending; earlier batches are in the DB
+        self._first_id: Optional[int] = None  # first business this import inserted
+
+    # ---------- parsing ----------
+    def _read_header(self, values: List[str]):
+        columns = {}
+        for idx, header in enumerate(values):
+            key = HEADER_ALIASES.get(normalize_header(header))
+            if key and key not in columns:
+                columns[key] = idx
+        missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+        if missing:
+            raise ValueError(f"CSV header is missing required column(s): {', '.join(missing)}")
+        self._columns = columns
+
+    def _parse_row(self, values: List[str]) -> Tuple[Optional[Row], Optional[str]]:
+        def get(col):
+            idx = self._columns.get(col)
+            return values[idx].strip() if idx is not None and idx < len(values) else ""
+
+        name, location, url = get("name"), get("location"), get("website_url")
+        if not name:
+            return None, "missing name"
+        if not location:
+            return None, "missing location"
+        for col, value in (("name", name), ("location", location), ("website_url", url)):
+            if len(value) > MAX_FIELD_LENGTH[col]:
+                return None, f"{col} longer than {MAX_FIELD_LENGTH[col]} characters"
+        if url and not url.startswith(("http://", "https://")):
+            return None, "website_url must start with http:// or https://"
+        return (name, location, url or None), None
+
+    def _consume(self, records: List[str]):
+        for values in csv.reader(records):
+            if self._columns is None:
+                self._read_header(values)
+                continue
+            if not values:
+                continue
+            self._row_number += 1
+            if not any(v.strip() for v in values):
+                continue
+            row, reason = self._parse_row(values)
+            if row is None:
+                self.report.reject(self._row_number, reason, values)
+                continue
+            key = business_key(*row)
+            if key in self._batch_keys:
+                if self.dedupe:
+                    self.report.duplicates_in_file += 1
+                    continue
+                key = None  # kept as a copy; the first row owns the key
+            else:
+                self._batch_keys.add(key)
+            self._pending.append((*row, key))
+            if len(self._pending) >= self.batch_size:
+                self._flush_batch()
+
+    # ---------- writing ----------
+    def _match_fuzzy(self, conn, rows: List[KeyedRow]) -> Tuple[List[KeyedRow], List[str], list]:
+        """Drop or flag near-duplicates; returns kept rows, their statuses and (row, match, score)."""
+        records = [FuzzyRecord.from_row(0, *r[:3]) for r in rows]
+        self._index.load_blocks(conn, [r.block for r in records])
+        kept, statuses, flagged = [], [], []
+        for row, record in zip(rows, records):
+            match = self._index.best_match(record)
+            if match and self.fuzzy == "skip":
+                self.report.duplicates_fuzzy += 1
+                continue
+            if match:
+                flagged.append((record, *match))
+            # ids are filled in once the batch is inserted
+            self._index.add(record)
+            kept.append((*row, record))
+            statuses.append(POSSIBLE_DUPLICATE if match else "pending")
+        return kept, statuses, flagged
+
+    def _flush_batch(self):
+        rows, self._pending = self._pending, []
+        self._batch_keys = set()
+        if not rows:
+            return
+        first_id = last_id = None
+        with db.transaction() as conn:
+            existing = dict(conn.execute(
+                "SELECT dedup_key, id FROM businesses WHERE dedup_key IN (SELECT value FROM json_each(?))",
+                (json.dumps([r[3] for r in rows if r[3] is not None]),)
+            ))
+            if existing and self.dedupe:
+                kept = [r for r in rows if r[3] not in existing]
+                in_file = sum(1 for r in rows if r[3] in existing and self._first_id is not None
+                              and existing[r[3]] >= self._first_id)
+                self.report.duplicates_in_file += in_file
+                self.report.duplicates_existing += len(rows) - len(kept) - in_file
+                rows = kept
+            elif existing:
+                rows = [(*r[:3], None) if r[3] in existing else r for r in rows]
+            statuses, flagged = ["pending"] * len(rows), []
+            if self._index is not None and rows:
+                rows, statuses, flagged = self._match_fuzzy(conn, rows)
+            if rows:
+                conn.executemany(
+                    "INSERT INTO businesses (name, location, website_url, status, dedup_key, location_block) "
+                    "VALUES (?,?,?,?,?,?)",
+                    [(*r[:3], status, r[3], location_block(r[1])) for r, status in zip(rows, statuses)]
+                )
+                # The write lock is held, so this batch's ids are contiguous
+                last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                first_id = last_id - len(rows) + 1
+                if self._first_id is None:
+                    self._first_id = first_id
+                if self._index is not None:
+                    for business_id, row in enumerate(rows, start=first_id):
+                        row[4].id = business_id
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO business_duplicates (business_id, duplicate_of, score) VALUES (?,?,?)",
+                        [(record.id, other.id, round(s, 4)) for record, other, s in flagged]
+                    )
+                    self.report.possible_duplicates += len(flagged)
+                created = conn.execute(
+                    "INSERT INTO jobs (business_id, stage, status) "
+                    "SELECT id, IIF(discover, 'Intake', ?), IIF(discover, 'discovering', 'processing') "
+                    "FROM (SELECT id, ? AND COALESCE(website_url, '') = '' AS discover FROM businesses "
+                    "WHERE id BETWEEN ? AND ? AND status = 'pending') ORDER BY id RETURNING id, stage, status",
+                    (self.job_stage, self.discover, first_id, last_id)
+                ).fetchall()
+                publish_transitions(created)
+                if self.job_stage == FIRST_STAGES[0]:
+                    # The stages that start alongside the first one run as branches
+                    jobs.open_branches([job_id for job_id, stage, _ in created if stage == self.job_stage],
+                                       FIRST_STAGES[1:])
+                self.report.awaiting_discovery += sum(1 for _, stage, _ in created if stage == "Intake")
+        self.report.imported += len(rows)
+        self.report.batches.append({
+            "batch": len(self.report.batches) + 1,
+            "rows": len(rows),
+            "first_business_id": first_id,
+            "last_business_id": last_id,
+            "imported_total": self.report.imported,
+            "rejected_total": self.report.rejected,
+            "skipped_total": self.report.skipped,
+        })
+
+    # ---------- public API ----------
+    def feed(self, text: str):
+        self._consume(self._splitter.feed(text))
+
+    def finish(self) -> ImportReport:
+        self._consume(self._splitter.flush())
+        if self._columns is None:
+            raise ValueError("CSV file is empty")
+        self._flush_batch()
+        return self.report
+
+
+async def import_upload(upload, job_stage: str, save_path: Optional[Path] = None,
+                        chunk_size: int = CHUNK_SIZE, batch_size: int = BATCH_SIZE,
+                        dedupe: bool = INTAKE_DEDUPE, fuzzy: str = DEDUP_FUZZY,
+                        discover: bool = False) -> ImportReport:
+    """Stream an UploadFile into the database, optionally keeping a copy on disk."""
+    importer = LeadImporter(job_stage, batch_size=batch_size, dedupe=dedupe, fuzzy=fuzzy, discover=discover)
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    out = None
+
+    # Only the upload read runs on the event loop; the copy on disk, parsing
+    # and batch inserts go to the threadpool
+    def step(chunk: bytes):
+        if out:
+            out.write(chunk)
+        importer.feed(decoder.decode(chunk))
+
+    def finish() -> ImportReport:
+        importer.feed(decoder.decode(b"", final=True))
+        return importer.finish()
+
+    started = time.perf_counter()
+    try:
+        if save_path:
+            out = await run_in_threadpool(open, save_path, "wb")
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            await run_in_threadpool(step, chunk)
+        report = await run_in_threadpool(finish)
+    finally:
+        if out:
+            await run_in_threadpool(out.close)
+    record_import(report, time.perf_counter() - started)
+    return report
+
+
+def record_import(report: ImportReport, seconds: float):
+    metrics.IMPORT_DURATION.observe(seconds)
+    for outcome, n in (("imported", report.imported), ("rejected", report.rejected), ("skipped", report.skipped)):
+        metrics.IMPORT_ROWS.inc(n, outcome=outcome)
+    rows = report.imported + report.rejected + report.skipped
+    metrics.IMPORT_RATE.set(rows / seconds if seconds > 0 else 0.0)
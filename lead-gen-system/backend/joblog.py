@@ -0,0 +1,207 @@
+"""
+Batched, structured job-event log.
+
+`sink.emit()` only appends an event (job_id, stage, level, message,
+duration, payload) to an in-memory buffer. A writer thread flushes the buffer
+to the `logs` table with one executemany per batch. It flushes when
+LOG_BATCH_SIZE events are waiting or LOG_FLUSH_INTERVAL seconds have passed,
+and once more on stop(). Logging every stage transition therefore adds one
+transaction per batch instead of one per event.
+
+Retention: rows older than LOG_RETENTION_DAYS (cut at midnight UTC) are
+folded into `log_rollups`, one row per (day, stage, level) with event, job
+and duration totals, and then deleted. `daily_stats()` answers the same
+question over rollups and recent raw rows alike. Compaction runs on the
+writer thread every LOG_COMPACT_INTERVAL seconds.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import db
+import metrics
+
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+LOG_BUFFER_MAX = int(os.getenv("LOG_BUFFER_MAX", "100000"))  # oldest events are dropped beyond this
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "30"))
+LOG_COMPACT_INTERVAL = float(os.getenv("LOG_COMPACT_INTERVAL", "3600"))
+
+# (job_id, timestamp, level, stage, message, duration_ms, payload_json)
+LogRow = Tuple[Optional[int], str, str, Optional[str], str, Optional[float], Optional[str]]
+
+LOG_EVENTS = metrics.REGISTRY.register(metrics.Counter(
+    "leadgen_log_events_total", "Job log events by outcome (written, dropped)", ("outcome",)))
+
+
+def _timestamp(ts: float) -> str:
+    # Same text format as SQLite's CURRENT_TIMESTAMP, so old and new rows sort together
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+class LogSink:
+    def __init__(self, batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL,
+                 buffer_max: int = LOG_BUFFER_MAX, retention_days: int = LOG_RETENTION_DAYS,
+                 compact_interval: float = LOG_COMPACT_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.compact_interval = compact_interval
+        self._buffer: Deque[LogRow] = deque(maxlen=buffer_max)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- producers ----------
+    def emit(self, job_id: Optional[int], level: str, message: str, stage: Optional[str] = None,
+             duration: Optional[float] = None, payload: Optional[Dict[str, Any]] = None):
+        """Queue one event; `duration` is in seconds. Never blocks on the database."""
+        if len(self._buffer) == self._buffer.maxlen:
+            LOG_EVENTS.inc(outcome="dropped")
+        self._buffer.append((
+            job_id, _timestamp(time.time()), level, stage, message,
+            round(duration * 1000, 3) if duration is not None else None,
+            json.dumps(payload) if payload else None,
+        ))
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    # ---------- writer ----------
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of rows written."""
+        written = 0
+        with self._flush_lock:
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.batch_size:
+                    batch.append(self._buffer.popleft())
+                try:
+                    with db.transaction() as conn:
+                        conn.executemany(
+                            "INSERT INTO logs (job_id, timestamp, level, stage, message, duration_ms, payload) "
+                            "VALUES (?,?,?,?,?,?,?)",
+                            batch
+                        )
+                except Exception as e:
+                    print(f"Log sink: dropping {len(batch)} event(s) after write error: {e}")
+                    LOG_EVENTS.inc(len(batch), outcome="dropped")
+                    continue
+                written += len(batch)
+        if written:
+            LOG_EVENTS.inc(written, outcome="written")
+        return written
+
+    def _loop(self):
+        next_compact = time.monotonic()
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if time.monotonic() >= next_compact:
+                next_compact = time.monotonic() + self.compact_interval
+                try:
+                    compact(self.retention_days)
+                except Exception as e:
+                    print(f"Log sink: compaction failed: {e}")
+        self.flush()
+
+    def start(self):
+        if self._thread:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="log-sink", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the writer and flush what is left (also safe when never started)."""
+        if self._thread:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+sink = LogSink()
+
+
+# ======================
+# Retention and rollups
+# ======================
+def _cutoff(retention_days: int, now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    day = (now - timedelta(days=retention_days)).date()
+    return f"{day.isoformat()} 00:00:00"
+
+
+def compact(retention_days: int = LOG_RETENTION_DAYS, now: Optional[datetime] = None) -> int:
+    """Fold whole days older than the retention window into log_rollups; returns rows removed."""
+    cutoff = _cutoff(retention_days, now)
+    with db.transaction() as conn:
+        conn.execute(
+            """INSERT INTO log_rollups (day, stage, level, events, jobs, duration_ms_sum, duration_ms_max, timed)
+               SELECT date(timestamp), COALESCE(stage, ''), COALESCE(level, ''), COUNT(*), COUNT(DISTINCT job_id),
+                      COALESCE(SUM(duration_ms), 0), MAX(duration_ms), COUNT(duration_ms)
+               FROM logs WHERE timestamp < ? GROUP BY 1, 2, 3
+               ON CONFLICT(day, stage, level) DO UPDATE SET
+                   events = events + excluded.events,
+                   jobs = jobs + excluded.jobs,
+                   duration_ms_sum = duration_ms_sum + excluded.duration_ms_sum,
+                   duration_ms_max = MAX(COALESCE(duration_ms_max, 0), COALESCE(excluded.duration_ms_max, 0)),
+                   timed = timed + excluded.timed""",
+            (cutoff,)
+        )
+        removed = conn.execute("DELETE FROM logs WHERE timestamp < ?", (cutoff,)).rowcount
+    return removed
+
+
+def daily_stats(start: Optional[str] = None, end: Optional[str] = None, stage: Optional[str] = None,
+                level: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Per-day event counts and durations from rollups plus not-yet-compacted rows.
+
+    `start` and `end` are inclusive YYYY-MM-DD days. Compaction moves whole
+    days, so each day comes from exactly one of the two sources.
+    """
+    rollup, raw = [], []
+    rollup_params, raw_params = [], []
+    if start:
+        rollup.append("day >= ?")
+        raw.append("timestamp >= ?")
+        rollup_params.append(start)
+        raw_params.append(f"{start} 00:00:00")
+    if end:
+        rollup.append("day <= ?")
+        raw.append("timestamp < ?")  # range on the raw column keeps idx_logs_timestamp usable
+        rollup_params.append(end)
+        raw_params.append(f"{date.fromisoformat(end) + timedelta(days=1)} 00:00:00")
+    for column, value in (("stage", stage), ("level", level)):
+        if value is not None:
+            rollup.append(f"{column} = ?")
+            raw.append(f"COALESCE({column}, '') = ?")
+            rollup_params.append(value)
+            raw_params.append(value)
+    rows = db.get_conn().execute(
+        f"""SELECT day, stage, level, events, jobs, duration_ms_sum, duration_ms_max, timed FROM log_rollups
+            WHERE {' AND '.join(rollup) or '1'}
+            UNION ALL
+            SELECT date(timestamp), COALESCE(stage, ''), COALESCE(level, ''), COUNT(*), COUNT(DISTINCT job_id),
+                   COALESCE(SUM(duration_ms), 0), MAX(duration_ms), COUNT(duration_ms)
+            FROM logs WHERE {' AND '.join(raw) or '1'} GROUP BY 1, 2, 3
+            ORDER BY 1, 2, 3""",
+        (*rollup_params, *raw_params)
+    ).fetchall()
+    return [
+        {
+            "day": day, "stage": stage or None, "level": level or None, "events": events, "jobs": jobs,
+            "avg_duration_ms": round(total / timed, 3) if timed else None, "max_duration_ms": max_ms,
+        }
+        for day, stage, level, events, jobs, total, max_ms, timed in rows
+    ]
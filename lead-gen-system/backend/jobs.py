@@ -0,0 +1,562 @@
+"""
+Job state machine: data access for the `jobs` table.
+
+A job's row follows its primary stage. Its status within that stage is one of
+idle | processing | queued | running | waiting | completed | failed | awaiting_approval.
+"processing" means the stage is waiting to be requested, "queued" means a
+stage endpoint asked for it and the runner has not picked it up yet,
+"running" means a worker owns it, and "waiting" means some of the stage's
+inputs are still running as branches.
+
+Stages that can run alongside the primary one (see pipeline.py) are branches
+in `job_branches`, with the same statuses, attempts and last_error of their
+own. The runner claims branches like jobs. Whenever any stage of a job
+finishes, `complete_stage()` works out what can start next. If the primary
+stage finished, the job's row moves on to a stage that is ready, or takes
+over an idle branch, or waits at the join. Every other ready stage becomes a
+branch.
+"""
+import json
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import db
+from db import get_conn
+from events import publish_transitions
+from migrations import ACTIVE_JOBS
+from pipeline import FIRST_STAGES, STAGE_INPUTS, STAGES, ancestors, ready
+from priority import BANDS, band_sql
+from results import load_inputs
+
+# Statuses an enqueue leaves alone
+BUSY = "('queued', 'running', 'waiting')"
+
+
+def get_next_stage(stage: str) -> Optional[str]:
+    # Next stage in STAGES order; use complete_stage() to follow the graph
+    idx = STAGES.index(stage) if stage in STAGES else -1
+    return STAGES[idx + 1] if idx + 1 < len(STAGES) else None
+
+def create_job(business_id: int, stage: str):
+    cur = get_conn().execute(
+        "INSERT INTO jobs (business_id, stage) VALUES (?,?)",
+        (business_id, stage)
+    )
+    publish_transitions([(cur.lastrowid, stage, "idle")])
+    return cur.lastrowid
+
+def update_job_stage(job_id: int, new_stage: str, data_json: str = None, status: str = "processing",
+                     priority: Optional[int] = None):
+    # Priority is set in the same statement, so a job queued here is
+    # stamped with its new priority (see priority.py)
+    get_conn().execute(
+        "UPDATE jobs SET stage=?, status=?, data_json=?, last_error=NULL, updated_at=CURRENT_TIMESTAMP, "
+        "priority=COALESCE(?, priority) WHERE id=?",
+        (new_stage, status, data_json, priority, job_id)
+    )
+    publish_transitions([(job_id, new_stage, status)])
+
+def get_job_by_business(business_id: int):
+    return get_conn().execute("SELECT * FROM jobs WHERE business_id=? LIMIT 1", (business_id,)).fetchone()
+
+
+# ======================
+# Stage graph (see pipeline.py)
+# ======================
+def open_branches(job_ids: List[int], stages: Iterable[str], status: str = "processing"):
+    rows = [(job_id, stage, status) for job_id in job_ids for stage in stages]
+    get_conn().executemany(
+        "INSERT INTO job_branches (job_id, stage, status) VALUES (?,?,?) ON CONFLICT(job_id, stage) DO UPDATE "
+        "SET status=excluded.status, attempts=0, last_error=NULL, updated_at=CURRENT_TIMESTAMP",
+        rows
+    )
+    publish_transitions(rows, branch=True)
+
+def start_pipeline(job_ids: List[int], status: str = "processing"):
+    """Move jobs out of Intake: the first stage becomes each job's stage, the ones that start with it branches."""
+    rows = get_conn().execute(
+        "UPDATE jobs SET stage=?, status=?, data_json=NULL, last_error=NULL, updated_at=CURRENT_TIMESTAMP "
+        "WHERE id IN (SELECT value FROM json_each(?)) RETURNING id",
+        (FIRST_STAGES[0], status, json.dumps(job_ids))
+    ).fetchall()
+    publish_transitions((job_id, FIRST_STAGES[0], status) for (job_id,) in rows)
+    open_branches([job_id for (job_id,) in rows], FIRST_STAGES[1:], status)
+
+def _graph_state(conn, job_id: int) -> Tuple[str, str, Dict[str, tuple], set]:
+    """(primary stage, its status, {branch stage: (status, attempts, last_error)}, stages done)."""
+    primary, status = conn.execute("SELECT stage, status FROM jobs WHERE id=?", (job_id,)).fetchone()
+    branches = {stage: rest for stage, *rest in conn.execute(
+        "SELECT stage, status, attempts, last_error FROM job_branches WHERE job_id=?", (job_id,)
+    )}
+    finished = {stage for stage, (st, *_) in branches.items() if st == "completed"}
+    # The primary stage only got where it is once all of its ancestors were
+    # done, except those still running as branches
+    done = set(ancestors(primary) - set(branches)) | finished
+    if status == "completed":
+        done.add(primary)
+    return primary, status, branches, done
+
+def complete_stage(job_id: int, stage: str, branch: bool = False, data_json: Optional[str] = None,
+                   priority: Optional[int] = None,
+                   queue: Callable[[str], bool] = lambda stage: False) -> Tuple[str, str]:
+    """Record a finished stage and start whatever it unblocks; returns the job's (stage, status).
+
+    Stages that start are queued when `queue(stage)` says so, otherwise left
+    "processing" for their endpoint.
+    """
+    conn = get_conn()
+    if branch:
+        conn.execute(
+            "UPDATE job_branches SET status='completed', last_error=NULL, updated_at=CURRENT_TIMESTAMP "
+            "WHERE job_id=? AND stage=?",
+            (job_id, stage)
+        )
+        publish_transitions([(job_id, stage, "completed")], branch=True)
+        if priority is not None:
+            conn.execute("UPDATE jobs SET priority=? WHERE id=?", (priority, job_id))
+    else:
+        conn.execute("UPDATE jobs SET status='completed' WHERE id=?", (job_id,))
+    primary, status, branches, done = _graph_state(conn, job_id)
+    started = done | {primary} | set(branches)
+    starting = ready(done, started)
+    status_of = lambda s: "queued" if queue(s) else "processing"
+
+    if status == "waiting" and all(d in done for d in STAGE_INPUTS[primary]):
+        # The last input of the join finished
+        update_job_stage(job_id, primary, status=status_of(primary), priority=priority)
+        status = status_of(primary)
+    elif status == "completed" and not branch:
+        unfinished = [s for s in STAGES if s in branches and branches[s][0] != "completed"]
+        idle = [s for s in unfinished if branches[s][0] not in ("queued", "running")]
+        joins = [s for s in STAGES if s not in started
+                 and all(d in done or d in unfinished for d in STAGE_INPUTS[s])]
+        attempts = last_error = None
+        finished_stage = primary
+        if starting:
+            primary = starting.pop(0)
+            status = status_of(primary)
+        elif idle:
+            # Take over a branch nobody has requested yet; its row goes away
+            primary = idle[0]
+            status, attempts, last_error = branches[primary]
+            conn.execute("DELETE FROM job_branches WHERE job_id=? AND stage=?", (job_id, primary))
+        elif joins:
+            primary, status = joins[0], "waiting"
+        if primary != finished_stage and finished_stage not in ancestors(primary):
+            # Off the new stage's path: keep it on record as a finished branch
+            conn.execute(
+                "INSERT INTO job_branches (job_id, stage, status) VALUES (?,?,'completed') "
+                "ON CONFLICT(job_id, stage) DO UPDATE SET status='completed', updated_at=CURRENT_TIMESTAMP",
+                (job_id, finished_stage)
+            )
+        update_job_stage(job_id, primary, data_json=data_json, status=status, priority=priority)
+        if attempts is not None:
+            conn.execute("UPDATE jobs SET attempts=?, last_error=? WHERE id=?", (attempts, last_error, job_id))
+    for st in ("queued", "processing"):
+        group = [s for s in starting if status_of(s) == st]
+        if group:
+            open_branches([job_id], group, st)
+    return primary, status
+
+def stage_statuses(job_id: int) -> Dict[str, str]:
+    """Status of every stage the job has reached, primary and branches, in STAGES order."""
+    conn = get_conn()
+    if not conn.execute("SELECT 1 FROM jobs WHERE id=?", (job_id,)).fetchone():
+        return {}
+    primary, status, branches, done = _graph_state(conn, job_id)
+    found = {stage: "completed" for stage in done}
+    found.update({stage: st for stage, (st, *_) in branches.items()})
+    found[primary] = status
+    return {stage: found[stage] for stage in STAGES if stage in found}
+
+
+# ======================
+# Queue operations (used by runner.py)
+# ======================
+def enqueue_stage(business_id: int, stage: str) -> Optional[Dict[str, Any]]:
+    """Queue the business's job for `stage`, as its primary stage or a branch.
+
+    Returns None when the job has not reached that stage. Stages already
+    queued, running or waiting for their inputs are left alone.
+    """
+    job = get_job_by_business(business_id)
+    if not job:
+        return None
+    if job[2] == stage:
+        cur = get_conn().execute(
+            f"UPDATE jobs SET status='queued', attempts=0, last_error=NULL, updated_at=CURRENT_TIMESTAMP "
+            f"WHERE id=? AND stage=? AND status NOT IN {BUSY}",
+            (job[0], stage)
+        )
+        status = "queued" if cur.rowcount else job[3]
+        if cur.rowcount:
+            publish_transitions([(job[0], stage, "queued")])
+        return {"business_id": business_id, "job_id": job[0], "stage": stage, "status": status}
+    branch = get_conn().execute(
+        "SELECT status FROM job_branches WHERE job_id=? AND stage=? AND status != 'completed'", (job[0], stage)
+    ).fetchone()
+    if not branch:
+        return None
+    cur = get_conn().execute(
+        f"UPDATE job_branches SET status='queued', attempts=0, last_error=NULL, updated_at=CURRENT_TIMESTAMP "
+        f"WHERE job_id=? AND stage=? AND status NOT IN {BUSY}",
+        (job[0], stage)
+    )
+    if cur.rowcount:
+        publish_transitions([(job[0], stage, "queued")], branch=True)
+    return {"business_id": business_id, "job_id": job[0], "stage": stage,
+            "status": "queued" if cur.rowcount else branch[0]}
+
+def claim_jobs(limit: int, stages: Iterable[str]) -> List[Dict[str, Any]]:
+    """Atomically move up to `limit` queued jobs to running and return them.
+
+    Jobs and branches come out in fair-queue order (smallest `fair_tag`
+    first, see priority.py). Each stage's heads are read from idx_jobs_claim
+    and idx_job_branches_fair, so a claim touches at most 2 * `limit` index
+    entries per stage.
+    """
+    stages = list(stages)
+    if limit <= 0 or not stages:
+        return []
+    with db.transaction() as conn:
+        heads = []
+        for stage in stages:
+            heads += [(tag, job_id, None) for tag, job_id in conn.execute(
+                "SELECT fair_tag, id FROM jobs WHERE status='queued' AND stage=? ORDER BY fair_tag, id LIMIT ?",
+                (stage, limit)
+            )]
+            # Branches carry a tag of their own, stamped when they were queued
+            heads += conn.execute(
+                "SELECT fair_tag, job_id, stage FROM job_branches WHERE status='queued' AND stage=? "
+                "ORDER BY fair_tag, job_id LIMIT ?",
+                (stage, limit)
+            ).fetchall()
+        picked = sorted(heads, key=lambda h: (h[0], h[1]))[:limit]
+        if not picked:
+            return []
+        rows = conn.execute(
+            "UPDATE jobs SET status='running', attempts=attempts+1, updated_at=CURRENT_TIMESTAMP "
+            "WHERE id IN (SELECT value FROM json_each(?)) RETURNING id, business_id, stage, data_json, attempts",
+            (json.dumps([job_id for _, job_id, branch in picked if branch is None]),)
+        ).fetchall()
+        branch_rows = conn.execute(
+            "UPDATE job_branches SET status='running', attempts=attempts+1, updated_at=CURRENT_TIMESTAMP "
+            "FROM json_each(?) p WHERE job_id = p.value ->> 0 AND stage = p.value ->> 1 "
+            "RETURNING job_id, (SELECT business_id FROM jobs WHERE id = job_id), stage, NULL, attempts",
+            (json.dumps([[job_id, branch] for _, job_id, branch in picked if branch is not None]),)
+        ).fetchall()
+        conn.execute("UPDATE queue_clock SET vtime = MAX(vtime, ?) WHERE id = 1", (picked[-1][0],))
+    order = {(job_id, branch): rank for rank, (_, job_id, branch) in enumerate(picked)}
+    claimed = [(row, False) for row in rows] + [(row, True) for row in branch_rows]
+    claimed.sort(key=lambda c: order[(c[0][0], c[0][2] if c[1] else None)])
+    publish_transitions((r[0], r[2], "running") for r in rows)
+    publish_transitions(((r[0], r[2], "running") for r in branch_rows), branch=True)
+    business_ids = {row[1] for row, _ in claimed}
+    businesses = {
+        r[0]: {"id": r[0], "name": r[1], "location": r[2], "website_url": r[3]}
+        for r in conn.execute(
+            f"SELECT id, name, location, website_url FROM businesses WHERE id IN ({','.join('?' * len(business_ids))})",
+            tuple(business_ids)
+        )
+    }
+    # Earlier stages' outputs, for every claimed job in one query (see results.py)
+    inputs = load_inputs((row[0], row[2]) for row, _ in claimed)
+    return [
+        {
+            "id": job_id,
+            "business_id": business_id,
+            "stage": stage,
+            "branch": branch,
+            "data": json.loads(data_json) if data_json else None,
+            "inputs": inputs.get(job_id, {}),
+            "attempts": attempts,
+            "business": businesses.get(business_id, {"id": business_id}),
+        }
+        for (job_id, business_id, stage, data_json, attempts), branch in claimed
+    ]
+
+def fail_job(job_id: int, error: str, retry: bool, branch: Optional[str] = None):
+    """Record a failed attempt of the job's primary stage, or of its `branch` stage."""
+    status = "queued" if retry else "failed"
+    if branch:
+        get_conn().execute(
+            "UPDATE job_branches SET status=?, last_error=?, updated_at=CURRENT_TIMESTAMP WHERE job_id=? AND stage=?",
+            (status, error, job_id, branch)
+        )
+        publish_transitions([(job_id, branch, status)], branch=True)
+        return
+    rows = get_conn().execute(
+        "UPDATE jobs SET status=?, last_error=?, updated_at=CURRENT_TIMESTAMP WHERE id=? RETURNING stage",
+        (status, error, job_id)
+    ).fetchall()
+    publish_transitions((job_id, stage, status) for (stage,) in rows)
+
+def requeue_running() -> int:
+    """Hand jobs and branches left running by a crashed process back to the queue."""
+    rows = get_conn().execute(
+        f"UPDATE jobs SET status='queued' WHERE {ACTIVE_JOBS} AND status='running' RETURNING id, stage"
+    ).fetchall()
+    publish_transitions((job_id, stage, "queued") for job_id, stage in rows)
+    branches = get_conn().execute(
+        f"UPDATE job_branches SET status='queued' WHERE {ACTIVE_JOBS} AND status='running' RETURNING job_id, stage"
+    ).fetchall()
+    publish_transitions(((job_id, stage, "queued") for job_id, stage in branches), branch=True)
+    return len(rows) + len(branches)
+
+def close_business_jobs(business_id: int, status: str) -> int:
+    """Stop a business's jobs that are not running right now; returns how many changed."""
+    rows = get_conn().execute(
+        "UPDATE jobs SET status=?, updated_at=CURRENT_TIMESTAMP "
+        "WHERE business_id=? AND status IS NOT ? AND status IS NOT 'running' RETURNING id, stage",
+        (status, business_id, status)
+    ).fetchall()
+    publish_transitions((job_id, stage, status) for job_id, stage in rows)
+    return len(rows)
+
+def count_active() -> int:
+    conn = get_conn()
+    return sum(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {ACTIVE_JOBS}").fetchone()[0]
+               for table in ("jobs", "job_branches"))
+
+
+# ======================
+# Batch operations
+# ======================
+def _business_jobs(conn, business_ids: List[int]) -> Dict[int, tuple]:
+    """First job per business for a list of ids, in one indexed query."""
+    found = {}
+    for business_id, job_id, stage, status in conn.execute(
+        "SELECT business_id, id, stage, status FROM jobs "
+        "WHERE business_id IN (SELECT value FROM json_each(?)) ORDER BY id",
+        (json.dumps(business_ids),)
+    ):
+        found.setdefault(business_id, (job_id, stage, status))
+    return found
+
+def enqueue_batch(stage: str, business_ids: List[int]) -> List[Dict[str, Any]]:
+    """Queue many businesses' jobs for `stage` in one transaction.
+
+    Returns one outcome per requested id, in request order: queued,
+    already_queued, waiting (for the stage's inputs), wrong_stage or
+    not_found. A job whose `stage` is a branch has that branch queued.
+    """
+    outcomes = []
+    with db.transaction() as conn:
+        found = _business_jobs(conn, business_ids)
+        branches = dict(conn.execute(
+            "SELECT job_id, status FROM job_branches WHERE stage=? AND status != 'completed' "
+            "AND job_id IN (SELECT value FROM json_each(?))",
+            (stage, json.dumps([job[0] for job in found.values() if job[1] != stage]))
+        ))
+        to_queue, to_queue_branches = [], []
+        for business_id in business_ids:
+            job = found.get(business_id)
+            if job is None:
+                outcomes.append({"business_id": business_id, "job_id": None, "stage": None, "outcome": "not_found"})
+                continue
+            job_id, job_stage, status = job
+            queue = to_queue
+            if job_stage != stage and job_id in branches:
+                job_stage, status, queue = stage, branches[job_id], to_queue_branches
+            if job_stage != stage:
+                outcome = "wrong_stage"
+            elif status in ("queued", "running"):
+                outcome = "already_queued"
+            elif status == "waiting":
+                outcome = "waiting"
+            else:
+                outcome = "queued"
+                queue.append((job_id,))
+            outcomes.append({"business_id": business_id, "job_id": job_id, "stage": job_stage, "outcome": outcome})
+        conn.executemany(
+            "UPDATE jobs SET status='queued', attempts=0, last_error=NULL, updated_at=CURRENT_TIMESTAMP WHERE id=?",
+            to_queue
+        )
+        conn.executemany(
+            "UPDATE job_branches SET status='queued', attempts=0, last_error=NULL, updated_at=CURRENT_TIMESTAMP "
+            "WHERE job_id=? AND stage=?",
+            [(job_id, stage) for (job_id,) in set(to_queue_branches)]
+        )
+        publish_transitions((job_id, stage, "queued") for (job_id,) in set(to_queue))
+        publish_transitions(((job_id, stage, "queued") for (job_id,) in set(to_queue_branches)), branch=True)
+    return outcomes
+
+def _utc_text(value: datetime) -> str:
+    # businesses.created_at is stored by CURRENT_TIMESTAMP as UTC 'YYYY-MM-DD HH:MM:SS'
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+
+def _filter_sql(stage: Optional[str] = None, status: Optional[str] = None,
+                created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+                business_id: Optional[int] = None, row: str = "j") -> Tuple[str, list]:
+    # `row` is the alias stage and status come from: "j" for jobs, "x" for
+    # job_branches joined to its job as "j"
+    clauses, params = [], []
+    if stage:
+        clauses.append(f"{row}.stage = ?")
+        params.append(stage)
+    if status:
+        clauses.append(f"{row}.status = ?")
+        params.append(status)
+    if business_id is not None:
+        clauses.append("j.business_id = ?")
+        params.append(business_id)
+    if created_after:
+        clauses.append("b.created_at >= ?")
+        params.append(_utc_text(created_after))
+    if created_before:
+        clauses.append("b.created_at < ?")
+        params.append(_utc_text(created_before))
+    return (" AND ".join(clauses) or "1"), params
+
+def enqueue_matching(stage: str, limit: int, **filters) -> List[Dict[str, Any]]:
+    """Queue up to `limit` jobs in `stage` matching the filters (status, created_after, created_before).
+
+    Jobs whose `stage` is a branch have that branch queued, as in enqueue_batch().
+    """
+    where, params = _filter_sql(stage=stage, **filters)
+    branch_where, branch_params = _filter_sql(stage=stage, row="x", **filters)
+    with db.transaction() as conn:
+        picked = conn.execute(
+            f"""SELECT j.id, 0 FROM jobs j JOIN businesses b ON b.id = j.business_id
+                WHERE {where} AND j.status NOT IN {BUSY}
+                UNION ALL
+                SELECT x.job_id, 1 FROM job_branches x JOIN jobs j ON j.id = x.job_id
+                JOIN businesses b ON b.id = j.business_id
+                WHERE {branch_where} AND x.status NOT IN {BUSY} AND x.status != 'completed'
+                ORDER BY 1 LIMIT ?""",
+            (*params, *branch_params, limit)
+        ).fetchall()
+        rows = conn.execute(
+            "UPDATE jobs SET status='queued', attempts=0, last_error=NULL, updated_at=CURRENT_TIMESTAMP "
+            "WHERE id IN (SELECT value FROM json_each(?)) RETURNING business_id, id",
+            (json.dumps([job_id for job_id, branch in picked if not branch]),)
+        ).fetchall()
+        branch_rows = conn.execute(
+            "UPDATE job_branches SET status='queued', attempts=0, last_error=NULL, updated_at=CURRENT_TIMESTAMP "
+            "WHERE stage=? AND job_id IN (SELECT value FROM json_each(?)) "
+            "RETURNING (SELECT business_id FROM jobs WHERE id = job_id), job_id",
+            (stage, json.dumps([job_id for job_id, branch in picked if branch]))
+        ).fetchall()
+    publish_transitions((job_id, stage, "queued") for _, job_id in rows)
+    publish_transitions(((job_id, stage, "queued") for _, job_id in branch_rows), branch=True)
+    return [{"business_id": business_id, "job_id": job_id, "stage": stage, "outcome": "queued"}
+            for business_id, job_id in sorted(rows + branch_rows, key=lambda r: r[1])]
+
+JOB_COLUMNS = ("j.id, j.business_id, j.stage, j.status, j.data_json, j.last_error, j.attempts, j.updated_at, "
+               "j.priority")
+# The same columns for a branch ("x") of job "j"; its output is in stage_results
+BRANCH_COLUMNS = ("x.job_id, j.business_id, x.stage, x.status, NULL, x.last_error, x.attempts, x.updated_at, "
+                  "j.priority")
+
+def job_row_to_dict(row) -> Dict[str, Any]:
+    job_id, business_id, stage, status, data_json, last_error, attempts, updated_at, priority = row
+    return {"job_id": job_id, "business_id": business_id, "stage": stage, "status": status,
+            "data": data_json, "last_error": last_error, "attempts": attempts, "updated_at": updated_at,
+            "priority": priority}
+
+def get_jobs(job_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    rows = get_conn().execute(
+        f"SELECT {JOB_COLUMNS} FROM jobs j WHERE j.id IN (SELECT value FROM json_each(?))",
+        (json.dumps(job_ids),)
+    )
+    return {row[0]: job_row_to_dict(row) for row in rows}
+
+def keyset(column: str, cursor: Optional[int], descending: bool) -> Tuple[str, list, str]:
+    """WHERE fragment, params and ORDER BY for id-cursor pagination.
+
+    The cursor is the last id the client saw; pages never use OFFSET, so
+    every page costs the same no matter how deep it is.
+    """
+    if cursor is None:
+        bound, params = "1", []
+    else:
+        bound, params = f"{column} {'<' if descending else '>'} ?", [cursor]
+    return bound, params, f"{column} {'DESC' if descending else 'ASC'}"
+
+def find_jobs(limit: int, cursor: Optional[int] = None, descending: bool = False,
+              include_data: bool = True, **filters) -> List[Dict[str, Any]]:
+    """One page of jobs matching the filters, after `cursor` in id order.
+
+    With a stage filter, jobs running that stage as a branch are listed too;
+    otherwise each job is listed once, at its primary stage. Listings pass
+    include_data=False so page size doesn't depend on how large each stage's
+    output is.
+    """
+    where, params = _filter_sql(**filters)
+    bound, bound_params, order = keyset("j.id", cursor, descending)
+    # Only pay for the join when filtering on the business's created_at
+    join = "JOIN businesses b ON b.id = j.business_id" if filters.get("created_after") or filters.get("created_before") else ""
+    columns = JOB_COLUMNS if include_data else JOB_COLUMNS.replace("j.data_json", "NULL")
+    sql, sql_params = f"SELECT {columns} FROM jobs j {join} WHERE {where} AND {bound}", [*params, *bound_params]
+    if filters.get("stage"):
+        # A job is at a given stage either as its primary stage or as a branch, never both
+        branch_where, branch_params = _filter_sql(row="x", **filters)
+        branch_bound, _, _ = keyset("x.job_id", cursor, descending)
+        sql += (f" UNION ALL SELECT {BRANCH_COLUMNS} FROM job_branches x JOIN jobs j ON j.id = x.job_id {join} "
+                f"WHERE {branch_where} AND {branch_bound}")
+        sql_params += [*branch_params, *bound_params]
+        order = order.replace("j.id", "id")
+    rows = get_conn().execute(f"{sql} ORDER BY {order} LIMIT ?", (*sql_params, limit)).fetchall()
+    items = [job_row_to_dict(row) for row in rows]
+    if not include_data:
+        for item in items:
+            del item["data"]
+    return items
+
+def stage_counts() -> Dict[str, Dict[str, int]]:
+    """Job counts per stage and status (the dashboard's Kanban columns), branches included.
+
+    Read from `stage_counters`, which triggers on `jobs` and `job_branches`
+    keep in step with every write, so the cost does not grow with the jobs
+    table.
+    """
+    counts: Dict[str, Dict[str, int]] = {}
+    for stage, status, n in get_conn().execute("SELECT stage, status, n FROM stage_counters WHERE n > 0"):
+        counts.setdefault(stage, {})[status] = n
+    return counts
+
+def reconcile_stage_counts() -> int:
+    """Rebuild `stage_counters` from `jobs` and `job_branches`; returns how many (stage, status) rows had drifted."""
+    with db.transaction() as conn:
+        actual: Dict[Tuple[str, str], int] = {}
+        for stage, status, n in conn.execute(
+            "SELECT stage, COALESCE(status, ''), COUNT(*) FROM jobs GROUP BY stage, status "
+            "UNION ALL SELECT stage, status, COUNT(*) FROM job_branches GROUP BY stage, status"
+        ):
+            actual[(stage, status)] = actual.get((stage, status), 0) + n
+        stored = {(stage, status): n for stage, status, n in conn.execute("SELECT stage, status, n FROM stage_counters")}
+        drifted = sum(1 for key in actual.keys() | stored.keys() if actual.get(key, 0) != stored.get(key, 0))
+        if drifted:
+            conn.execute("DELETE FROM stage_counters")
+            conn.executemany("INSERT INTO stage_counters (stage, status, n) VALUES (?,?,?)",
+                             [(stage, status, n) for (stage, status), n in actual.items()])
+    return drifted
+
+
+# ======================
+# Priority queue
+# ======================
+def queue_depth() -> Dict[str, Any]:
+    """Queued jobs per priority band, overall and per stage; branches count at their job's priority."""
+    bands = {name: 0 for name, _ in BANDS}
+    by_stage: Dict[str, Dict[str, int]] = {}
+    for stage, band, n in get_conn().execute(
+        f"SELECT stage, {band_sql()} AS band, COUNT(*) FROM jobs WHERE status='queued' GROUP BY stage, band "
+        f"UNION ALL SELECT b.stage, {band_sql('j.priority')} AS band, COUNT(*) FROM job_branches b "
+        f"JOIN jobs j ON j.id = b.job_id WHERE b.status='queued' GROUP BY b.stage, band"
+    ):
+        bands[band] += n
+        by_stage.setdefault(stage, {})[band] = by_stage.get(stage, {}).get(band, 0) + n
+    return {"bands": bands, "by_stage": by_stage, "total": sum(bands.values())}
+
+def set_location_weight(flow: str, weight: float):
+    """Share of the runner a location gets relative to others (default 1.0)."""
+    get_conn().execute(
+        "INSERT INTO queue_flows (flow, weight) VALUES (?,?) ON CONFLICT(flow) DO UPDATE SET weight=excluded.weight",
+        (flow, weight)
+    )
+
+def location_weights() -> Dict[str, float]:
+    return dict(get_conn().execute("SELECT flow, weight FROM queue_flows WHERE weight != 1.0 AND flow NOT LIKE '%|%'"))
@@ -1,14 +1,14 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
 from typing import Optional, List, Dict
-import sqlite3
 import json
 
+import db
+
 app = FastAPI(title="LeadGenWorkflow API")
-DB_PATH = "data/leads.db"
 
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    return db.get_conn()
 
 class Intake(BaseModel):
     name: str
@@ -38,13 +38,9 @@ class Pitch(BaseModel):
 
 @app.post("/api/intake")
 def intake(data: Intake):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO businesses (name, location, website_url, status) VALUES (?,?,?, 'pending')",
-                (data.name, data.location, data.url))
+    cur = get_conn().execute("INSERT INTO businesses (name, location, website_url, status) VALUES (?,?,?, 'pending')",
+                             (data.name, data.location, data.url))
     bid = cur.lastrowid
-    conn.commit()
-    conn.close()
     return {"business_id": bid, "status": "accepted"}
 
 @app.post("/api/analyze")
@@ -0,0 +1,262 @@
+"""
+In-process metrics with a Prometheus text endpoint.
+
+Samples are aggregated in memory (a lock and a few integer adds per
+observation) and only formatted when /metrics is scraped; nothing is written
+to the database. Counts are per process, so a multi-worker deployment should
+scrape each worker.
+
+Instrumented:
+  - HTTP latency per route template, and the SQLite time spent inside each
+    request (`MetricsMiddleware` + `db.TimedConnection`)
+  - stage run time per stage and outcome (runner.py)
+  - Telegram sendMessage latency (notify.py)
+  - CSV import rows and rows/sec (importer.py)
+  - job counts per stage and status, read from stage_counters at scrape time
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Paths left out of the HTTP histograms: the scrape itself and long-lived streams
+UNTIMED_PATHS = {"/metrics", "/api/events"}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# ======================
+# Metric types
+# ======================
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Incremented directly, or summed at scrape time by a `collect` callback."""
+    kind = "counter"
+
+    def __init__(self, *args, collect: Optional[Callable[[], Iterable[Tuple[Sequence[str], float]]]] = None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.collect = collect
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in self.items()]
+
+    def items(self) -> List[Tuple[Tuple[str, ...], float]]:
+        if self.collect is not None:
+            try:
+                return sorted((tuple(k), v) for k, v in self.collect())
+            except Exception as e:
+                print(f"Metrics: collecting {self.name} failed: {e}")
+                return []
+        with self._lock:
+            return sorted(self._values.items())
+
+
+class Gauge(Counter):
+    """Set directly, or computed at scrape time by a `collect` callback."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(counts), total)) for k, (counts, total) in self._series.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ======================
+# Metrics
+# ======================
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "leadgen_http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status")))
+HTTP_DB_TIME = REGISTRY.register(Histogram(
+    "leadgen_http_request_db_seconds", "SQLite time spent while serving one request", ("method", "route")))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "leadgen_stage_duration_seconds", "Stage function run time", ("stage", "outcome"), buckets=STAGE_BUCKETS))
+TELEGRAM_LATENCY = REGISTRY.register(Histogram(
+    "leadgen_telegram_send_duration_seconds", "Telegram sendMessage round trip", ("outcome",)))
+IMPORT_ROWS = REGISTRY.register(Counter("leadgen_import_rows_total", "CSV import rows by outcome", ("outcome",)))
+IMPORT_DURATION = REGISTRY.register(Histogram(
+    "leadgen_import_duration_seconds", "CSV import wall time", buckets=STAGE_BUCKETS))
+IMPORT_RATE = REGISTRY.register(Gauge("leadgen_import_rows_per_second", "Rows per second of the latest CSV import"))
+
+
+def _job_counts():
+    from jobs import stage_counts
+    for stage, statuses in stage_counts().items():
+        for status, n in statuses.items():
+            yield (stage, status), n
+
+
+JOBS = REGISTRY.register(Gauge("leadgen_jobs", "Jobs per stage and status (queue depth)", ("stage", "status"),
+                               collect=_job_counts))
+
+
+# ======================
+# DB time
+# ======================
+# A one-item list per request; the thread pool copies the context, so work
+# run via run_in_threadpool adds to the same request's total
+_request_db_time: ContextVar[Optional[list]] = ContextVar("request_db_time", default=None)
+# Thread id -> [statements, seconds]. Each thread only writes its own entry,
+# so the per-statement hot path takes no lock; scrapes sum the entries
+_db_totals: Dict[int, list] = {}
+
+
+def record_db(seconds: float):
+    totals = _db_totals.get(threading.get_ident())
+    if totals is None:
+        totals = _db_totals[threading.get_ident()] = [0, 0.0]
+    totals[0] += 1
+    totals[1] += seconds
+    request_total = _request_db_time.get()
+    if request_total is not None:
+        request_total[0] += seconds
+
+
+def _db_sum(index: int):
+    yield (), sum(totals[index] for totals in list(_db_totals.values()))
+
+
+DB_STATEMENTS = REGISTRY.register(Counter("leadgen_db_statements_total", "SQLite statements executed",
+                                          collect=lambda: _db_sum(0)))
+DB_SECONDS = REGISTRY.register(Counter("leadgen_db_seconds_total", "Time spent executing SQLite statements",
+                                       collect=lambda: _db_sum(1)))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: request latency and DB time, labelled by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED or scope["path"] in UNTIMED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        db_time = [0.0]
+        token = _request_db_time.set(db_time)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_db_time.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners can't blow up cardinality
+            template = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.observe(elapsed, method=scope["method"], route=template, status=status[0])
+            HTTP_DB_TIME.observe(db_time[0], method=scope["method"], route=template)
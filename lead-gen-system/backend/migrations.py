@@ -0,0 +1,508 @@
+"""
+Versioned schema migrations.
+
+The schema version lives in `PRAGMA user_version`. Each migration runs in its
+own transaction together with the version bump, so a failed step leaves the
+database at the previous version. Add new steps at the bottom with the next
+version number; never edit a migration that has shipped.
+
+Migrations don't call into application modules: the keys, priority bands and
+trigger SQL they were written against are frozen below. When the app's
+version changes (dedup.py, priority.py), add a migration with a new frozen
+copy rather than letting an old one pick the change up on fresh databases.
+"""
+import re
+import sqlite3
+import unicodedata
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+Migration = Tuple[int, str, Callable[[sqlite3.Cursor], None]]
+MIGRATIONS: List[Migration] = []
+
+# Predicate shared by the active-jobs partial index and the queries that use
+# it; SQLite only picks a partial index when the query repeats its WHERE term
+ACTIVE_JOBS = "status IN ('queued', 'running')"
+
+
+def migration(version: int, description: str):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def _columns(cur: sqlite3.Cursor, table: str) -> set:
+    return {row[1] for row in cur.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def latest_version() -> int:
+    return max(v for v, _, _ in MIGRATIONS)
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations on an autocommit connection; returns the new version."""
+    current = get_version(conn)
+    for version, description, step in sorted(MIGRATIONS):
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn.cursor())
+            conn.execute(f"PRAGMA user_version={version}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        print(f"Applied migration {version}: {description}")
+        current = version
+    return current
+
+
+# ======================
+# Frozen values (see the module docstring)
+# ======================
+# dedup.business_key and dedup.location_block as of migrations 7 and 8
+_STATES_V1 = {
+    "new south wales": "nsw",
+    "victoria": "vic",
+    "queensland": "qld",
+    "south australia": "sa",
+    "western australia": "wa",
+    "tasmania": "tas",
+    "northern territory": "nt",
+    "australian capital territory": "act",
+}
+_NON_WORD_V1 = re.compile(r"[^\w]+")
+_STATE_NAMES_V1 = re.compile(r"\b(" + "|".join(_STATES_V1) + r")\b")
+_POSTCODE_V1 = re.compile(r"\b\d{4}\b")
+
+
+def _normalize_text_v1(value: Optional[str]) -> str:
+    if not value:
+        return ""
+    if not value.isascii():
+        value = unicodedata.normalize("NFKD", value)
+        value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    value = value.casefold().replace("&", " and ").replace("'", "")
+    return " ".join(_NON_WORD_V1.sub(" ", value).split())
+
+
+def _normalize_location_v1(location: Optional[str]) -> str:
+    text = _STATE_NAMES_V1.sub(lambda m: _STATES_V1[m.group(1)], _normalize_text_v1(location))
+    words = text.split()
+    if words and words[-1] == "australia":
+        words.pop()
+    return " ".join(words)
+
+
+def _url_host_v1(url: Optional[str]) -> str:
+    if not url or not url.strip():
+        return ""
+    url = url.strip()
+    if "://" not in url:
+        url = "http://" + url
+    try:
+        host = (urlsplit(url).hostname or "").lower().rstrip(".")
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def _business_key_v1(name: str, location: Optional[str], url: Optional[str] = None) -> str:
+    return "|".join((_normalize_text_v1(name), _normalize_location_v1(location), _url_host_v1(url)))
+
+
+def _location_block_v1(location: Optional[str]) -> str:
+    words = _POSTCODE_V1.sub(" ", _normalize_location_v1(location)).split()
+    while words and words[-1] in _STATES_V1.values():
+        words.pop()
+    return " ".join(words)
+
+
+# priority.py as of migrations 9 and 16
+_DEFAULT_PRIORITY_V1 = 50
+_PRIORITY_SPREAD_V1 = 25
+_BANDS_V1 = (("high", 70), ("medium", 40), ("low", 0))
+
+
+def _band_sql_v1(column: str) -> str:
+    whens = " ".join(f"WHEN {column} >= {floor} THEN '{name}'" for name, floor in _BANDS_V1[:-1])
+    return f"CASE {whens} ELSE '{_BANDS_V1[-1][0]}' END"
+
+
+# ======================
+# Migrations
+# ======================
+@migration(1, "baseline schema (app.init_db and db_init.py reconciled)")
+def _baseline(cur):
+    # Databases created before migrations existed may come from either
+    # app.init_db (all four tables) or db_init.py (businesses/jobs only), and
+    # may or may not have jobs.attempts.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS businesses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            location TEXT,
+            website_url TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            business_id INTEGER,
+            stage TEXT NOT NULL,
+            status TEXT DEFAULT 'idle', -- idle, processing, queued, running, completed, failed, awaiting_approval
+            data_json TEXT, -- All structured output for this stage
+            last_error TEXT,
+            attempts INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (business_id) REFERENCES businesses(id)
+        )
+    ''')
+    if "attempts" not in _columns(cur, "jobs"):
+        cur.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER DEFAULT 0")
+    # Campaign/Stage definitions
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stages (
+            stage_name TEXT PRIMARY KEY,
+            description TEXT
+        )
+    ''')
+    cur.executemany("INSERT OR IGNORE INTO stages (stage_name, description) VALUES (?,?)", [
+        ("Intake", "Collect business info"),
+        ("Analysis", "Website audit"),
+        ("Competitors", "Top competitor research"),
+        ("Rebuild", "Generate new structure"),
+        ("Demo", "Deploy demo site"),
+        ("Pitch", "Generate pitch materials"),
+    ])
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            level TEXT,
+            message TEXT,
+            FOREIGN KEY (job_id) REFERENCES jobs(id)
+        )
+    ''')
+
+
+@migration(2, "indexes for business lookup, job-by-business and the job queue")
+def _hot_path_indexes(cur):
+    # get_business_id: (name, location) -> id, answered from the index alone
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_businesses_name_location ON businesses(name, location)")
+    # get_job_by_business
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_business ON jobs(business_id)")
+    # Queue claims and active counts; only queued/running rows are indexed,
+    # so the index stays small however many jobs have finished
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_jobs_active ON jobs(status, stage) WHERE {ACTIVE_JOBS}")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_job ON logs(job_id)")
+
+
+@migration(3, "notification outbox for the Telegram dispatcher")
+def _notification_outbox(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending', -- pending, failed (sent rows are deleted)
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0, -- unix time
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox(next_attempt_at) WHERE status='pending'"
+    )
+
+
+@migration(4, "indexes for batch stage filters")
+def _batch_filter_indexes(cur):
+    # Batch endpoints and /api/status/batch filter on stage/status and on
+    # the business's created_at range
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_stage_status ON jobs(stage, status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_businesses_created_at ON businesses(created_at)")
+
+
+@migration(5, "indexes for keyset-paginated job and log listings")
+def _listing_indexes(cur):
+    # Single-column indexes keep rows in id order within each value, so
+    # "stage=? AND id>? ORDER BY id" seeks straight to the page
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_stage ON jobs(stage)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_level ON logs(level)")
+
+
+@migration(6, "stage_counters maintained by triggers on jobs")
+def _stage_counters(cur):
+    # Kanban column counts without GROUP BY over jobs: every insert, delete
+    # and stage/status change adjusts one row here inside the same statement
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stage_counters (
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            n INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (stage, status)
+        ) WITHOUT ROWID
+    ''')
+    add = ("INSERT INTO stage_counters (stage, status, n) VALUES (new.stage, COALESCE(new.status, ''), 1) "
+           "ON CONFLICT(stage, status) DO UPDATE SET n = n + 1;")
+    remove = "UPDATE stage_counters SET n = n - 1 WHERE stage = old.stage AND status = COALESCE(old.status, '');"
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS trg_jobs_count_insert AFTER INSERT ON jobs BEGIN {add} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS trg_jobs_count_delete AFTER DELETE ON jobs BEGIN {remove} END")
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_jobs_count_update AFTER UPDATE OF stage, status ON jobs
+        WHEN old.stage IS NOT new.stage OR old.status IS NOT new.status
+        BEGIN {remove} {add} END
+    ''')
+    cur.execute("DELETE FROM stage_counters")
+    cur.execute(
+        "INSERT INTO stage_counters (stage, status, n) "
+        "SELECT stage, COALESCE(status, ''), COUNT(*) FROM jobs GROUP BY stage, status"
+    )
+
+
+@migration(7, "businesses.dedup_key with a unique index for idempotent intake")
+def _dedup_key(cur):
+    if "dedup_key" not in _columns(cur, "businesses"):
+        cur.execute("ALTER TABLE businesses ADD COLUMN dedup_key TEXT")
+    # Backfill: the oldest row of each duplicate group owns the key; later
+    # copies keep NULL so the unique index can be built over existing data
+    seen, keys = set(), []
+    for business_id, name, location, url in cur.execute(
+        "SELECT id, name, location, website_url FROM businesses ORDER BY id"
+    ).fetchall():
+        key = _business_key_v1(name, location, url)
+        if key not in seen:
+            seen.add(key)
+            keys.append((key, business_id))
+    cur.executemany("UPDATE businesses SET dedup_key=? WHERE id=?", keys)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_businesses_dedup_key ON businesses(dedup_key)")
+
+
+@migration(8, "businesses.location_block and the business_duplicates review table")
+def _fuzzy_dedup(cur):
+    # Blocking key for fuzzy matching: only businesses in the same suburb or
+    # city are compared, and the index loads one block at a time
+    if "location_block" not in _columns(cur, "businesses"):
+        cur.execute("ALTER TABLE businesses ADD COLUMN location_block TEXT")
+    cur.executemany(
+        "UPDATE businesses SET location_block=? WHERE id=?",
+        [(_location_block_v1(location), business_id)
+         for business_id, location in cur.execute("SELECT id, location FROM businesses").fetchall()]
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_businesses_location_block ON businesses(location_block)")
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS business_duplicates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            business_id INTEGER NOT NULL,
+            duplicate_of INTEGER NOT NULL,
+            score REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'flagged',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (business_id, duplicate_of),
+            FOREIGN KEY(business_id) REFERENCES businesses(id),
+            FOREIGN KEY(duplicate_of) REFERENCES businesses(id)
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_business_duplicates_status ON business_duplicates(status)")
+
+
+def _fair_stamp_v1(table: str, row: str, business_id: str, priority: str) -> str:
+    """Trigger body giving the `table` row matching `row` its fair_tag and moving its flow's finish (see priority.py)."""
+    location = f"COALESCE((SELECT location_block FROM businesses WHERE id = {business_id}), '')"
+    flow = f"{location} || '|' || {_band_sql_v1(priority)}"
+    return f'''
+        UPDATE {table} SET fair_tag =
+            MAX((SELECT vtime FROM queue_clock WHERE id = 1),
+                COALESCE((SELECT finish FROM queue_flows WHERE flow = {flow}), 0))
+            + {_PRIORITY_SPREAD_V1}.0 / ({_PRIORITY_SPREAD_V1} + {priority})
+              / COALESCE((SELECT weight FROM queue_flows WHERE flow = {location}), 1.0)
+        WHERE {row};
+        INSERT INTO queue_flows (flow, finish) SELECT {flow}, fair_tag FROM {table} WHERE {row}
+        ON CONFLICT(flow) DO UPDATE SET finish = excluded.finish;
+    '''
+
+
+@migration(9, "job priority with weighted fair queueing across locations")
+def _fair_queue(cur):
+    columns = _columns(cur, "jobs")
+    if "priority" not in columns:
+        cur.execute(f"ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT {_DEFAULT_PRIORITY_V1}")
+    if "fair_tag" not in columns:
+        cur.execute("ALTER TABLE jobs ADD COLUMN fair_tag REAL NOT NULL DEFAULT 0")
+    # Location weights, and the tag of the latest queued job per
+    # "location|band" flow
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS queue_flows (
+            flow TEXT PRIMARY KEY,
+            weight REAL NOT NULL DEFAULT 1.0 CHECK (weight > 0),
+            finish REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cur.execute("CREATE TABLE IF NOT EXISTS queue_clock (id INTEGER PRIMARY KEY CHECK (id = 1), vtime REAL NOT NULL)")
+    cur.execute("INSERT OR IGNORE INTO queue_clock (id, vtime) VALUES (1, 0)")
+    # Existing queued jobs keep their id order (tag 0, ties broken by id)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(stage, fair_tag, id) WHERE status = 'queued'")
+
+    stamp = _fair_stamp_v1("jobs", "id = new.id", "new.business_id", "new.priority")
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_jobs_fair_insert AFTER INSERT ON jobs
+        WHEN new.status = 'queued' BEGIN {stamp} END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_jobs_fair_update AFTER UPDATE OF status ON jobs
+        WHEN new.status = 'queued' AND old.status IS NOT 'queued' BEGIN {stamp} END
+    ''')
+
+
+@migration(10, "structured job log columns and daily log_rollups for retention")
+def _log_rollups(cur):
+    columns = _columns(cur, "logs")
+    for name, decl in (("stage", "TEXT"), ("duration_ms", "REAL"), ("payload", "TEXT")):
+        if name not in columns:
+            cur.execute(f"ALTER TABLE logs ADD COLUMN {name} {decl}")
+    # Retention deletes and daily_stats range over timestamp
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs(timestamp)")
+    # One row per compacted (day, stage, level); '' stands for NULL so the key is unique
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS log_rollups (
+            day TEXT NOT NULL,
+            stage TEXT NOT NULL DEFAULT '',
+            level TEXT NOT NULL DEFAULT '',
+            events INTEGER NOT NULL,
+            jobs INTEGER NOT NULL,
+            duration_ms_sum REAL NOT NULL DEFAULT 0,
+            duration_ms_max REAL,
+            timed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, stage, level)
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(11, "stage_results: every stage's output per job, optionally zlib-compressed")
+def _stage_results(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS stage_results (
+            job_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            encoding TEXT NOT NULL DEFAULT 'json',  -- json | zlib
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL,  -- uncompressed JSON bytes
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_id, stage),
+            FOREIGN KEY (job_id) REFERENCES jobs(id)
+        ) WITHOUT ROWID
+    ''')
+    # data_json holds the output of the stage before the current one (or of
+    # the current one once completed); keep it as that stage's result
+    stages = ["Intake", "Analysis", "Competitors", "Rebuild", "Demo", "Pitch"]
+    previous = " ".join(f"WHEN '{after}' THEN '{before}'" for before, after in zip(stages, stages[1:]))
+    cur.execute(f'''
+        INSERT OR IGNORE INTO stage_results (job_id, stage, body, size)
+        SELECT id, CASE WHEN status = 'completed' THEN stage ELSE CASE stage {previous} END END,
+               CAST(data_json AS BLOB), length(CAST(data_json AS BLOB))
+        FROM jobs WHERE data_json IS NOT NULL AND data_json != 'null'
+          AND (status = 'completed' OR stage IN ({",".join(f"'{s}'" for s in stages[1:])}))
+    ''')
+
+
+@migration(12, "url_discovery cache of websites found for URL-less leads")
+def _url_discovery(cur):
+    # lookup_key is "name tokens|location block", or "name tokens|*" for a
+    # chain-wide domain; a NULL url records a search that found nothing
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS url_discovery (
+            lookup_key TEXT PRIMARY KEY,
+            url TEXT,
+            score REAL,
+            resolved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(13, "competitor_sets: competitor research shared per (category, location block)")
+def _competitor_sets(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS competitor_sets (
+            category TEXT NOT NULL,
+            location_block TEXT NOT NULL,
+            location TEXT,
+            body TEXT NOT NULL,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (category, location_block)
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(14, "job_branches: stages running alongside a job's primary stage")
+def _job_branches(cur):
+    # One row per (job, stage) started off the job's primary path; kept as
+    # 'completed' once done so a join can see it (see pipeline.py)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS job_branches (
+            job_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_id, stage)
+        ) WITHOUT ROWID
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_branches_claim ON job_branches(stage, job_id) WHERE status = 'queued'")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_job_branches_active ON job_branches(status) WHERE {ACTIVE_JOBS}")
+
+
+@migration(15, "stage_counters and a listing index for job_branches")
+def _branch_counters(cur):
+    # Branches are counted in their stage's column like primary stages
+    # (see migration 6), so the counters add up over both tables
+    add = ("INSERT INTO stage_counters (stage, status, n) VALUES (new.stage, new.status, 1) "
+           "ON CONFLICT(stage, status) DO UPDATE SET n = n + 1;")
+    remove = "UPDATE stage_counters SET n = n - 1 WHERE stage = old.stage AND status = old.status;"
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS trg_job_branches_count_insert AFTER INSERT ON job_branches BEGIN {add} END")
+    cur.execute(f"CREATE TRIGGER IF NOT EXISTS trg_job_branches_count_delete AFTER DELETE ON job_branches BEGIN {remove} END")
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_job_branches_count_update AFTER UPDATE OF stage, status ON job_branches
+        WHEN old.stage IS NOT new.stage OR old.status IS NOT new.status
+        BEGIN {remove} {add} END
+    ''')
+    cur.execute('''
+        INSERT INTO stage_counters (stage, status, n)
+        SELECT stage, status, COUNT(*) FROM job_branches WHERE true GROUP BY stage, status
+        ON CONFLICT(stage, status) DO UPDATE SET n = n + excluded.n
+    ''')
+    # Rows stay in job_id order within a stage, for keyset pages of ?stage=
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_branches_stage ON job_branches(stage)")
+
+
+@migration(16, "job_branches.fair_tag so branches take turns in the fair queue")
+def _branch_fair_queue(cur):
+    # Stamped like jobs' (migration 9) at the job's location and priority
+    # when the branch is queued; already queued branches keep job_id order
+    if "fair_tag" not in _columns(cur, "job_branches"):
+        cur.execute("ALTER TABLE job_branches ADD COLUMN fair_tag REAL NOT NULL DEFAULT 0")
+    stamp = _fair_stamp_v1("job_branches", "job_id = new.job_id AND stage = new.stage",
+                        "(SELECT business_id FROM jobs WHERE id = new.job_id)",
+                        "(SELECT priority FROM jobs WHERE id = new.job_id)")
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_job_branches_fair_insert AFTER INSERT ON job_branches
+        WHEN new.status = 'queued' BEGIN {stamp} END
+    ''')
+    cur.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_job_branches_fair_update AFTER UPDATE OF status ON job_branches
+        WHEN new.status = 'queued' AND old.status IS NOT 'queued' BEGIN {stamp} END
+    ''')
+    cur.execute("DROP INDEX IF EXISTS idx_job_branches_claim")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_job_branches_fair ON job_branches(stage, status, fair_tag)")
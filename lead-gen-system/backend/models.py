@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Any
 import json
 from datetime import datetime
 
@@ -19,8 +19,9 @@ class IntakeRequest(BaseModel):
 
 class IntakeResponse(BaseModel):
     business_id: int
-    job_id: int
-    status: str  # accepted | requires_url_discovery
+    job_id: Optional[int] = None  # None while held back as a possible_duplicate
+    status: str  # accepted | duplicate | possible_duplicate | requires_url_discovery
+    duplicate_of: Optional[int] = None
 
 # ======================
 # Analysis Models
@@ -50,9 +51,13 @@ class AnalysisResponse(BaseModel):
 # ======================
 class CompetitorInfo(BaseModel):
     name: str = Field(..., max_length=200)
+    url: Optional[str] = Field(None, max_length=500)
     structure_strengths: List[str] = Field(default_factory=list, max_items=5)
     messaging_gaps: List[str] = Field(default_factory=list, max_items=5)
 
+class CompetitorsOutput(BaseModel):
+    top3: List[CompetitorInfo] = Field(default_factory=list, max_items=3)
+
 class CompetitorsRequest(BaseModel):
     business_id: int
 
@@ -63,10 +68,12 @@ class CompetitorsResponse(BaseModel):
 # ======================
 # Rebuild Models
 # ======================
+# Earlier stage outputs are loaded server-side from stage_results (see
+# results.STAGE_INPUTS); the fields stay, optional, for older clients
 class RebuildRequest(BaseModel):
     business_id: int
-    audit: AuditResult
-    competitors: List[CompetitorInfo]
+    audit: Optional[AuditResult] = None
+    competitors: Optional[List[CompetitorInfo]] = None
 
 class RebuildOutput(BaseModel):
     structure: List[str] = Field(default_factory=list, max_items=20)
@@ -83,7 +90,7 @@ class RebuildResponse(BaseModel):
 # ======================
 class DemoRequest(BaseModel):
     business_id: int
-    rebuild_json: RebuildOutput
+    rebuild_json: Optional[RebuildOutput] = None
 
 class DemoOutput(BaseModel):
     demo_url: str = Field(..., max_length=500)
@@ -99,8 +106,8 @@ class DemoResponse(BaseModel):
 # ======================
 class PitchRequest(BaseModel):
     business_id: int
-    rebuild_json: RebuildOutput
-    demo_json: DemoOutput
+    rebuild_json: Optional[RebuildOutput] = None
+    demo_json: Optional[DemoOutput] = None
 
 class PitchOutput(BaseModel):
     executive_summary: str = Field(..., max_length=3000)
@@ -0,0 +1,268 @@
+"""
+Asynchronous Telegram notification dispatcher.
+
+`Notifier.notify()` never blocks: it drops the message on a bounded in-memory
+queue and returns. A background task on the event loop wakes every
+`flush_interval` seconds, coalesces bursts that share a key ("42 analyses
+completed" instead of 42 messages), persists the result to the
+`notification_outbox` table, and sends what is due over one pooled
+`httpx.AsyncClient`. Outbox reads and writes run in worker threads
+(`asyncio.to_thread`), so a busy database never stalls the loop. Sends respect Telegram's per-chat and global rate limits,
+honour `retry_after` on 429s, and are retried with exponential backoff, so
+queued messages survive slow API calls and restarts.
+"""
+import asyncio
+import os
+import queue
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+
+import db
+import metrics
+
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+NOTIFY_FLUSH_INTERVAL = float(os.getenv("NOTIFY_FLUSH_INTERVAL", "2.0"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "8"))
+# Telegram allows about one message per second per chat and 30/s overall
+PER_CHAT_RATE = 1.0
+GLOBAL_RATE = 30.0
+MAX_MESSAGE_LENGTH = 4096
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 600.0
+SEND_BATCH = 50
+
+
+@dataclass
+class Notification:
+    text: str
+    key: Optional[str] = None
+    # Format string with {count}, used when several notifications with the
+    # same key arrive within one flush interval
+    summary: Optional[str] = None
+
+
+class RateLimiter:
+    """Spaces calls so that each key gets at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next: Dict[str, float] = {}
+
+    async def acquire(self, key: str = ""):
+        now = time.monotonic()
+        at = max(now, self._next.get(key, 0.0))
+        self._next[key] = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def defer(self, key: str, seconds: float):
+        self._next[key] = max(self._next.get(key, 0.0), time.monotonic() + seconds)
+
+
+def coalesce(items: List[Notification]) -> List[str]:
+    """Collapse notifications sharing a key into one summary message, keeping order."""
+    groups: Dict[object, List[Notification]] = {}
+    for i, item in enumerate(items):
+        groups.setdefault(item.key if item.key is not None else ("single", i), []).append(item)
+    messages = []
+    for group in groups.values():
+        first = group[0]
+        if len(group) > 1 and first.summary:
+            messages.append(first.summary.format(count=len(group)))
+        else:
+            messages.extend(item.text for item in group)
+    return messages
+
+
+class TelegramSendError(Exception):
+    def __init__(self, message: str, retryable: bool, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class Notifier:
+    def __init__(
+        self,
+        token: str,
+        chat_id: str,
+        api_base: str = TELEGRAM_API_BASE,
+        queue_size: int = NOTIFY_QUEUE_SIZE,
+        flush_interval: float = NOTIFY_FLUSH_INTERVAL,
+        max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+        per_chat_rate: float = PER_CHAT_RATE,
+        global_rate: float = GLOBAL_RATE,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_base = api_base.rstrip("/")
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._queue: "queue.Queue[Notification]" = queue.Queue(maxsize=queue_size)
+        self._chat_limiter = RateLimiter(per_chat_rate)
+        self._global_limiter = RateLimiter(global_rate)
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        # Serializes flushes so the background task and an explicit flush()
+        # never pick up the same outbox row
+        self._flush_lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token and self.chat_id)
+
+    # ---------- producer side (any thread) ----------
+    def notify(self, text: str, key: Optional[str] = None, summary: Optional[str] = None):
+        if not self.enabled:
+            return
+        item = Notification(text, key, summary)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Don't block the caller and don't lose the message: spill straight to the outbox
+            self._persist([item.text])
+
+    # ---------- lifecycle (event loop) ----------
+    async def start(self):
+        if not self.enabled or self._task:
+            return
+        self._client = httpx.AsyncClient(
+            base_url=self.api_base,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+            transport=self._transport,
+        )
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._stopping.set()
+        try:
+            # A send may be waiting out a rate limit; don't hold shutdown for it
+            await asyncio.wait_for(self._task, timeout=5.0)
+        except asyncio.TimeoutError:
+            pass
+        self._task = None
+        # Anything still in memory goes to the outbox for the next start
+        await asyncio.to_thread(self._collect)
+        await self._client.aclose()
+        self._client = None
+
+    async def flush(self):
+        """Collect and send everything that is due now (tests, shutdown hooks)."""
+        async with self._flush_lock:
+            await asyncio.to_thread(self._collect)
+            await self._send_due()
+
+    # ---------- internals ----------
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Telegram dispatcher error: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _collect(self):
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if items:
+            self._persist(coalesce(items))
+
+    def _persist(self, texts: List[str]):
+        with db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO notification_outbox (chat_id, text) VALUES (?, ?)",
+                [(self.chat_id, text[:MAX_MESSAGE_LENGTH]) for text in texts]
+            )
+
+    @staticmethod
+    def _write(sql: str, params: tuple):
+        db.get_conn().execute(sql, params)
+
+    def _due(self) -> List[tuple]:
+        return db.get_conn().execute(
+            "SELECT id, chat_id, text, attempts FROM notification_outbox "
+            "WHERE status='pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+            (time.time(), SEND_BATCH)
+        ).fetchall()
+
+    async def _send_due(self):
+        while not self._stopping.is_set():
+            rows = await asyncio.to_thread(self._due)
+            if not rows:
+                return
+            for row_id, chat_id, text, attempts in rows:
+                if self._stopping.is_set():
+                    return
+                await self._send_one(row_id, chat_id, text, attempts)
+
+    async def _send_one(self, row_id: int, chat_id: str, text: str, attempts: int):
+        await self._global_limiter.acquire()
+        await self._chat_limiter.acquire(chat_id)
+        try:
+            await self._post(chat_id, text)
+        except TelegramSendError as e:
+            attempts += 1
+            if e.retry_after:
+                self._chat_limiter.defer(chat_id, e.retry_after)
+            if not e.retryable or attempts >= self.max_attempts:
+                await asyncio.to_thread(
+                    self._write,
+                    "UPDATE notification_outbox SET status='failed', attempts=?, last_error=? WHERE id=?",
+                    (attempts, str(e), row_id)
+                )
+                print(f"Telegram send error: {e}")
+                return
+            delay = max(e.retry_after, min(BACKOFF_BASE ** attempts, BACKOFF_MAX))
+            await asyncio.to_thread(
+                self._write,
+                "UPDATE notification_outbox SET attempts=?, last_error=?, next_attempt_at=? WHERE id=?",
+                (attempts, str(e), time.time() + delay, row_id)
+            )
+            return
+        await asyncio.to_thread(self._write, "DELETE FROM notification_outbox WHERE id=?", (row_id,))
+
+    async def _post(self, chat_id: str, text: str):
+        started = time.perf_counter()
+        try:
+            resp = await self._client.post(f"/bot{self.token}/sendMessage", json={"chat_id": chat_id, "text": text})
+        except httpx.HTTPError as e:
+            metrics.TELEGRAM_LATENCY.observe(time.perf_counter() - started, outcome="network_error")
+            raise TelegramSendError(f"{type(e).__name__}: {e}", retryable=True)
+        metrics.TELEGRAM_LATENCY.observe(time.perf_counter() - started,
+                                         outcome="ok" if resp.status_code == 200 else str(resp.status_code))
+        if resp.status_code == 200:
+            return
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {}
+        retry_after = float((body.get("parameters") or {}).get("retry_after", 0))
+        retryable = resp.status_code == 429 or resp.status_code >= 500
+        raise TelegramSendError(
+            f"HTTP {resp.status_code}: {body.get('description', resp.text[:200])}",
+            retryable=retryable,
+            retry_after=retry_after,
+        )
+
+    def pending(self) -> int:
+        return db.get_conn().execute(
+            "SELECT COUNT(*) FROM notification_outbox WHERE status='pending'"
+        ).fetchone()[0] + self._queue.qsize()
@@ -0,0 +1,61 @@
+"""
+Stage dependency graph.
+
+Each stage lists the stages whose output it needs (STAGE_INPUTS) and can
+start as soon as all of them have finished. Stages that don't depend on each
+other run side by side. Analysis and Competitors only need Intake, so both
+start when a lead comes in, and Rebuild joins them.
+
+A job's row in `jobs` follows one path through the graph, its primary
+stage. Every other stage in flight at the same time is a branch with its own
+row in `job_branches` (see jobs.py).
+"""
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+ENTRY = "Intake"  # done when the job is created; it has no output
+
+STAGE_INPUTS: Dict[str, Tuple[str, ...]] = {
+    "Intake": (),
+    "Analysis": ("Intake",),
+    "Competitors": ("Intake",),
+    "Rebuild": ("Analysis", "Competitors"),
+    "Demo": ("Rebuild",),
+    "Pitch": ("Rebuild", "Demo"),
+}
+
+
+def _topological(inputs: Dict[str, Tuple[str, ...]]) -> List[str]:
+    # Kahn's algorithm, keeping declaration order among stages that are ready together
+    order, placed = [], set()
+    while len(order) < len(inputs):
+        ready = [s for s in inputs if s not in placed and all(d in placed for d in inputs[s])]
+        if not ready:
+            raise ValueError(f"Stage graph has a cycle or an unknown input: {inputs}")
+        order += ready
+        placed.update(ready)
+    return order
+
+
+# Every stage after all of its inputs; the order the dashboard lists them in
+STAGES = _topological(STAGE_INPUTS)
+
+
+@lru_cache(maxsize=None)
+def ancestors(stage: str) -> FrozenSet[str]:
+    """Every stage that has to finish before `stage` can start."""
+    found = set()
+    for parent in STAGE_INPUTS.get(stage, ()):
+        found |= {parent} | ancestors(parent)
+    return frozenset(found)
+
+
+def ready(done: Iterable[str], started: Iterable[str] = ()) -> List[str]:
+    """Stages whose inputs are all done and that haven't started, in STAGES order."""
+    done, started = set(done), set(started)
+    return [s for s in STAGES
+            if s not in done and s not in started and all(d in done for d in STAGE_INPUTS[s])]
+
+
+# Stages that start together once Intake is done; the first is the job's primary stage
+FIRST_STAGES = ready({ENTRY})
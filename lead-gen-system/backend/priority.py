@@ -0,0 +1,69 @@
+"""
+Lead priority and fair queueing.
+
+`score_audit()` turns the Analysis stage's `AuditScore` into a 0-100 priority:
+the weaker a site's conversion and SEO, the bigger the opportunity, so the
+sooner its later (expensive) stages run. Jobs start at DEFAULT_PRIORITY until
+their audit is known.
+
+The runner claims queued jobs in `fair_tag` order. The tag is a virtual
+finish time, as in weighted fair queueing. Each (location, priority band)
+pair is a flow, and a job's tag is
+
+    max(queue clock, its flow's last tag) + COST(priority) / location weight
+
+A trigger stamps the tag whenever a job becomes queued (see migration 9), so
+every code path that queues work is covered. Branches get theirs the same
+way, at their job's location and priority (migration 16). Claiming advances the queue
+clock to the largest tag handed out. A location with a thousand queued leads
+therefore takes turns with a location that has ten. A high-priority lead
+doesn't wait behind its location's medium backlog, and its flow moves up to
+five times faster than a priority-0 one. Claiming reads the partial index on
+(stage, fair_tag) over queued jobs, so it costs O(log n) however long the
+queue is.
+"""
+from typing import Dict, Optional, Union
+
+from models import AuditScore
+
+DEFAULT_PRIORITY = 50
+# Opportunity weight of each audit dimension; they sum to 1
+SCORE_WEIGHTS = {"conversion": 0.35, "seo": 0.30, "mobile": 0.15, "design": 0.10, "trust": 0.10}
+# Lower bound of each band, highest first
+BANDS = (("high", 70), ("medium", 40), ("low", 0))
+# Tag increment is PRIORITY_SPREAD / (PRIORITY_SPREAD + priority): 1.0 at
+# priority 0 down to 0.2 at 100
+PRIORITY_SPREAD = 25
+# The fair-queue triggers hold frozen copies of these: changing one needs a
+# migration that recreates them (see migrations.py)
+
+
+def score_audit(scores: Union[AuditScore, Dict]) -> int:
+    """Opportunity score: 100 for a site failing everywhere, 0 for a perfect one."""
+    scores = AuditScore.model_validate(scores)
+    deficit = sum(weight * (100 - getattr(scores, name)) for name, weight in SCORE_WEIGHTS.items())
+    return max(0, min(100, round(deficit)))
+
+
+def priority_from_result(stage: str, result: Optional[Dict]) -> Optional[int]:
+    """Priority implied by a finished stage's output; None leaves it unchanged."""
+    if stage != "Analysis" or not isinstance(result, dict) or "scores" not in result:
+        return None
+    try:
+        return score_audit(result["scores"])
+    except ValueError as e:
+        print(f"Priority: ignoring malformed audit scores: {e}")
+        return None
+
+
+def band(priority: int) -> str:
+    for name, floor in BANDS:
+        if priority >= floor:
+            return name
+    return BANDS[-1][0]
+
+
+def band_sql(column: str = "priority") -> str:
+    """SQL CASE expression mapping a priority column to its band name."""
+    whens = " ".join(f"WHEN {column} >= {floor} THEN '{name}'" for name, floor in BANDS[:-1])
+    return f"CASE {whens} ELSE '{BANDS[-1][0]}' END"
@@ -0,0 +1,94 @@
+"""
+Per-stage result history.
+
+Each stage's output is kept in `stage_results` under (job_id, stage), so the
+audit is still there when Rebuild runs and Pitch can read both the rebuild and
+the demo. (jobs.data_json only holds the latest output.) Bodies are stored as
+JSON text. Those of RESULT_COMPRESS_MIN bytes or more are zlib-compressed
+when that makes them smaller.
+
+The runner attaches a stage's inputs to the claimed job as `job["inputs"]`
+({stage: result}), read for the whole claimed batch in one primary-key query.
+`get_result_json()` returns a single stage's stored JSON without decoding it
+or touching any other stage's row.
+"""
+import json
+import os
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from db import get_conn
+from pipeline import ENTRY, STAGE_INPUTS as STAGE_DEPENDENCIES
+
+RESULT_COMPRESS_MIN = int(os.getenv("RESULT_COMPRESS_MIN", "1024"))
+RESULT_COMPRESS_LEVEL = 6
+
+# Earlier stage outputs each stage reads: its inputs in pipeline.py, less
+# Intake, which stores none (mirrors the *Request models in models.py)
+STAGE_INPUTS: Dict[str, Tuple[str, ...]] = {
+    stage: tuple(s for s in inputs if s != ENTRY) for stage, inputs in STAGE_DEPENDENCIES.items()
+    if any(s != ENTRY for s in inputs)
+}
+
+
+def encode(result_json: str) -> Tuple[str, bytes]:
+    raw = result_json.encode()
+    if len(raw) >= RESULT_COMPRESS_MIN:
+        packed = zlib.compress(raw, RESULT_COMPRESS_LEVEL)
+        if len(packed) < len(raw):
+            return "zlib", packed
+    return "json", raw
+
+
+def decode_json(encoding: str, body) -> bytes:
+    """Stored body -> JSON bytes (no parsing)."""
+    if encoding == "zlib":
+        return zlib.decompress(body)
+    return body.encode() if isinstance(body, str) else bytes(body)
+
+
+def save_result(job_id: int, stage: str, result_json: str):
+    """Store (or replace, on a rerun) one stage's output; `result_json` is already serialized."""
+    encoding, body = encode(result_json)
+    get_conn().execute(
+        "INSERT INTO stage_results (job_id, stage, encoding, body, size) VALUES (?,?,?,?,?) "
+        "ON CONFLICT(job_id, stage) DO UPDATE SET encoding=excluded.encoding, body=excluded.body, "
+        "size=excluded.size, updated_at=CURRENT_TIMESTAMP",
+        (job_id, stage, encoding, body, len(result_json))
+    )
+
+
+def get_result_json(job_id: int, stage: str) -> Optional[bytes]:
+    row = get_conn().execute(
+        "SELECT encoding, body FROM stage_results WHERE job_id=? AND stage=?", (job_id, stage)
+    ).fetchone()
+    return decode_json(*row) if row else None
+
+
+def get_result(job_id: int, stage: str) -> Optional[Any]:
+    body = get_result_json(job_id, stage)
+    return json.loads(body) if body is not None else None
+
+
+def list_results(job_id: int) -> List[Dict[str, Any]]:
+    """Stored stages of one job with their sizes; bodies are not read."""
+    rows = get_conn().execute(
+        "SELECT stage, encoding, size, length(body), updated_at FROM stage_results WHERE job_id=?", (job_id,)
+    ).fetchall()
+    return [{"stage": r[0], "encoding": r[1], "size": r[2], "stored_bytes": r[3], "updated_at": r[4]} for r in rows]
+
+
+def load_inputs(jobs: Iterable[Tuple[int, str]]) -> Dict[int, Dict[str, Any]]:
+    """{job_id: {stage: result}} with the STAGE_INPUTS of each (job_id, stage) pair."""
+    wanted = [[job_id, input_stage] for job_id, stage in jobs for input_stage in STAGE_INPUTS.get(stage, ())]
+    inputs: Dict[int, Dict[str, Any]] = {}
+    if not wanted:
+        return inputs
+    rows = get_conn().execute(
+        "SELECT r.job_id, r.stage, r.encoding, r.body FROM json_each(?) w "
+        "JOIN stage_results r ON r.job_id = w.value ->> 0 AND r.stage = w.value ->> 1",
+        (json.dumps(wanted),)
+    )
+    for job_id, stage, encoding, body in rows:
+        inputs.setdefault(job_id, {})[stage] = json.loads(decode_json(encoding, body))
+    return inputs
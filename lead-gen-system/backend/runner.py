@@ -0,0 +1,240 @@
+"""
+Background stage runner.
+
+Stage endpoints only mark a job "queued". A dispatcher thread claims queued
+jobs and branches (see pipeline.py), runs the matching stage function on a
+thread or process pool, and writes the outcome back: on success
+`jobs.complete_stage` starts every stage the result unblocks, on failure
+`last_error` is recorded and the stage is retried until `max_attempts` is
+reached. Branches of one job run in parallel. Outcomes that finish between two dispatcher
+ticks are written back together in one transaction.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import db
+import joblog
+import jobs
+import metrics
+import results
+import validation
+from priority import priority_from_result
+
+RUNNER_WORKERS = int(os.getenv("RUNNER_WORKERS", "4"))
+RUNNER_EXECUTOR = os.getenv("RUNNER_EXECUTOR", "thread")  # thread | process
+RUNNER_MAX_ATTEMPTS = int(os.getenv("RUNNER_MAX_ATTEMPTS", "3"))
+RUNNER_AUTO_ADVANCE = os.getenv("RUNNER_AUTO_ADVANCE", "false").lower() in ("1", "true", "yes")
+RUNNER_POLL_INTERVAL = float(os.getenv("RUNNER_POLL_INTERVAL", "1.0"))
+
+
+class JobRunner:
+    def __init__(
+        self,
+        stage_functions: Dict[str, Callable[[Dict], Dict]],
+        stage_messages: Optional[Dict[str, Tuple[str, str]]] = None,
+        notify: Optional[Callable[..., None]] = None,
+        workers: int = RUNNER_WORKERS,
+        executor: str = RUNNER_EXECUTOR,
+        max_attempts: int = RUNNER_MAX_ATTEMPTS,
+        auto_advance: bool = RUNNER_AUTO_ADVANCE,
+        poll_interval: float = RUNNER_POLL_INTERVAL,
+        validate: str = validation.RESULT_VALIDATION,
+    ):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor {executor!r}, expected 'thread' or 'process'")
+        if validate not in validation.VALIDATION_MODES:
+            raise ValueError(f"Unknown validation mode {validate!r}, expected one of {validation.VALIDATION_MODES}")
+        self.stage_functions = stage_functions
+        self.stage_messages = stage_messages or {}
+        self.notify = notify
+        self.workers = workers
+        self.executor_kind = executor
+        self.max_attempts = max_attempts
+        # When set, a finished stage queues the next one instead of waiting
+        # for its endpoint to be called
+        self.auto_advance = auto_advance
+        self.poll_interval = poll_interval
+        # What to do with a stage output its model rejects (see validation.py)
+        self.validate = validate
+
+        self._executor: Optional[Executor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._inflight: Dict[Tuple[int, str], Future] = {}
+        # (job, result, error, seconds) tuples waiting to be written back
+        self._done = deque()
+        self._lock = threading.Lock()
+
+    # ---------- lifecycle ----------
+    def start(self):
+        if self._thread:
+            return
+        recovered = jobs.requeue_running()
+        if recovered:
+            print(f"Job runner: requeued {recovered} interrupted job(s)")
+        pool_cls = ProcessPoolExecutor if self.executor_kind == "process" else ThreadPoolExecutor
+        self._executor = pool_cls(max_workers=self.workers)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._loop, name="job-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True):
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._executor.shutdown(wait=wait)
+        self._write_back()
+        self._thread = None
+        self._executor = None
+
+    def wake(self):
+        """Tell the dispatcher there is new work instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until nothing is queued or running. Returns False on timeout."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            with self._lock:
+                busy = bool(self._inflight)
+            if not busy and jobs.count_active() == 0:
+                return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+
+    # ---------- dispatch ----------
+    def _loop(self):
+        while not self._stopping.is_set():
+            self._write_back()
+            with self._lock:
+                free = self.workers - len(self._inflight)
+            claimed = []
+            try:
+                claimed = jobs.claim_jobs(free, self.stage_functions)
+            except Exception as e:
+                print(f"Job runner claim error: {e}")
+            for job in claimed:
+                self._submit(job)
+            if not claimed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _submit(self, job: Dict):
+        # Only free workers are filled, so submit-to-done is the stage's run time
+        started = time.perf_counter()
+        fut = self._executor.submit(self.stage_functions[job["stage"]], job)
+        with self._lock:
+            self._inflight[job["id"], job["stage"]] = fut
+        fut.add_done_callback(lambda f, job=job, started=started: self._finished(job, f, started))
+
+    def _finished(self, job: Dict, fut: Future, started: float):
+        # Runs on a worker (or the process pool's management) thread; the
+        # dispatcher thread does the DB write
+        elapsed = time.perf_counter() - started
+        try:
+            self._done.append((job, fut.result(), None, elapsed))
+            outcome = "success"
+        except Exception as e:
+            self._done.append((job, None, "".join(traceback.format_exception_only(type(e), e)).strip(), elapsed))
+            outcome = "error"
+        metrics.STAGE_LATENCY.observe(elapsed, stage=job["stage"], outcome=outcome)
+        self._wakeup.set()
+
+    def _write_back(self):
+        done = []
+        while self._done:
+            done.append(self._done.popleft())
+        if not done:
+            return
+        done = self._validate(done)
+        try:
+            with db.transaction():
+                notices = [self._record(*item) for item in done]
+        except Exception as e:
+            # Fall back to one transaction per job so one bad row can't block the rest
+            print(f"Job runner batch write failed ({e}); writing jobs one at a time")
+            notices = []
+            for item in done:
+                try:
+                    with db.transaction():
+                        notices.append(self._record(*item))
+                except Exception as e:
+                    # Count it as a failed attempt, so the job is retried or failed
+                    # instead of sitting in running until lease recovery
+                    job, seconds = item[0], item[3]
+                    try:
+                        with db.transaction():
+                            self._record(job, None, f"Write-back failed: {type(e).__name__}: {e}", seconds)
+                    except Exception as e2:
+                        print(f"Job runner error for job {job['id']}: {e2}")
+        with self._lock:
+            for job, *_ in done:
+                self._inflight.pop((job["id"], job["stage"]), None)
+        if self.notify:
+            for notice in filter(None, notices):
+                text, key, summary = notice
+                self.notify(text, key=key, summary=summary)
+
+    def _validate(self, done: list) -> list:
+        """Check successful outputs per stage in one batch; adds each one's JSON to its tuple."""
+        if self.validate == "off":
+            return [(*item, None) for item in done]
+        by_stage: Dict[str, list] = {}
+        for index, (job, result, error, _) in enumerate(done):
+            if error is None:
+                by_stage.setdefault(job["stage"], []).append(index)
+        checked = {}
+        for stage, indexes in by_stage.items():
+            outcomes = validation.validate_batch(stage, [done[i][1] for i in indexes])
+            checked.update(zip(indexes, outcomes))
+        items = []
+        for index, (job, result, error, seconds) in enumerate(done):
+            body, problem = checked.get(index, (None, None))
+            if problem and self.validate == "strict":
+                result, error = None, problem
+            elif problem:
+                joblog.sink.emit(job["id"], "warning", problem, stage=job["stage"])
+            items.append((job, result, error, seconds, body.decode() if body else None))
+        return items
+
+    @staticmethod
+    def _log(job: Dict, level: str, message: str, seconds: Optional[float], payload: Dict):
+        # Only logged if the outcome's transaction commits
+        db.after_commit(lambda: joblog.sink.emit(job["id"], level, message, stage=job["stage"],
+                                                 duration=seconds, payload=payload))
+
+    def _record(self, job: Dict, result: Optional[Dict], error: Optional[str],
+                seconds: Optional[float] = None, data_json: Optional[str] = None) -> Optional[Tuple[str, str, str]]:
+        """Write one outcome; returns the notification to send once committed."""
+        stage = job["stage"]
+        if error is not None:
+            retry = job["attempts"] < self.max_attempts
+            jobs.fail_job(job["id"], error, retry=retry, branch=stage if job.get("branch") else None)
+            if not retry:
+                print(f"Job {job['id']} failed in {stage} after {job['attempts']} attempt(s): {error}")
+            self._log(job, "warning" if retry else "error", f"{stage} failed", seconds,
+                      {"attempt": job["attempts"], "retry": retry, "error": error})
+            return None
+        priority = priority_from_result(stage, result)
+        data_json = data_json or json.dumps(result)
+        results.save_result(job["id"], stage, data_json)
+        new_stage, status = jobs.complete_stage(
+            job["id"], stage, branch=job.get("branch", False), data_json=data_json, priority=priority,
+            queue=lambda s: self.auto_advance and s in self.stage_functions)
+        self._log(job, "info", f"{stage} completed", seconds,
+                  {"attempt": job["attempts"], "next_stage": new_stage, "status": status, "priority": priority})
+        message = self.stage_messages.get(stage)
+        if not message:
+            return None
+        text, summary = message
+        return text.format(business_id=job["business_id"], job_id=job["id"]), stage, summary
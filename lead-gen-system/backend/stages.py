@@ -0,0 +1,98 @@
+"""
+Stage functions run by the job runner.
+
+Each function takes the claimed job (a plain dict, so it can be shipped to a
+process pool) and returns the stage output. The output is stored in
+stage_results. `job["inputs"]` holds the earlier outputs the stage builds on,
+e.g. {"Analysis": ..., "Competitors": ...} for Rebuild (see results.STAGE_INPUTS).
+"""
+from typing import Dict
+
+import audit
+import competition
+import demo
+
+
+# ======================
+# Mock processing functions (replace with real implementations)
+# ======================
+def mock_analysis(audit_data: Dict) -> Dict:
+    # Return a simple audit result that conforms to schema_audit.json
+    return {
+        "scores": {
+            "design": 78,
+            "seo": 72,
+            "conversion": 65,
+            "trust": 70,
+            "mobile": 80
+        },
+        "finding_summary": "Initial audit completed.",
+        "quick_wins": ["Clear navigation", "Responsive layout"],
+        "weaknesses": ["Missing alt text", "No structured data"]
+    }
+
+def mock_competitors_analysis() -> Dict:
+    return {
+        "top3": [
+            {"name": "Local Pro Plumbing", "structure_strengths": ["Clear service pages"], "messaging_gaps": ["Unique value prop"]},
+            {"name": "Adelaide Coffee Co", "structure_strengths": ["Strong about page"], "messaging_gaps": ["Pricing transparency"]},
+            {"name": "Gym Pro Fitness", "structure_strengths": ["Conversion-optimized CTAs"], "messaging_gaps": ["Social proof"]},
+        ]
+    }
+
+def mock_rebuild_output() -> Dict:
+    return {
+        "structure": ["Home", "About", "Services", "Pricing", "Contact"],
+        "headings": ["Best Plumbing in Town", "Quality Coffee Nearby", "Fitness That Fits Your Schedule"],
+        "CTAs": ["Get a Quote", "Book a Free Consultation"],
+        "trust_signals": ["Testimonials", "Accreditations"]
+    }
+
+def mock_pitch_output() -> Dict:
+    return {
+        "executive_summary": "Executive summary for the lead.",
+        "revenue_opportunity": "$24k/month potential",
+        "before_after": "Before: fragmented; After: cohesive conversion‑focused site",
+        "outbound_email": "Hi … we’d love to help …",
+        "followup_email": "Just checking in …"
+    }
+
+
+# ======================
+# Stage functions
+# ======================
+def run_analysis(job: Dict) -> Dict:
+    return audit.audit_website(job["business"].get("website_url"))
+
+def run_competitors(job: Dict) -> Dict:
+    if not competition.COMPETITORS_ENABLED:
+        return mock_competitors_analysis()
+    return competition.research_competitors(job["business"])
+
+def run_rebuild(job: Dict) -> Dict:
+    return mock_rebuild_output()
+
+def run_demo(job: Dict) -> Dict:
+    return demo.build_demo(job)
+
+def run_pitch(job: Dict) -> Dict:
+    return mock_pitch_output()
+
+
+STAGE_FUNCTIONS = {
+    "Analysis": run_analysis,
+    "Competitors": run_competitors,
+    "Rebuild": run_rebuild,
+    "Demo": run_demo,
+    "Pitch": run_pitch,
+}
+
+# Telegram message sent when a stage finishes, and the summary used when
+# several finish within one notifier flush interval
+STAGE_MESSAGES = {
+    "Analysis": ("🔎 Analysis complete for business {business_id}", "🔎 {count} analyses completed"),
+    "Competitors": ("🔎 Competitors analysis done for business {business_id}", "🔎 {count} competitor analyses done"),
+    "Rebuild": ("🏗️ Rebuild completed for business {business_id}", "🏗️ {count} rebuilds completed"),
+    "Demo": ("🚀 Demo deployed for business {business_id}", "🚀 {count} demos deployed"),
+    "Pitch": ("📣 Pitch generated for business {business_id}", "📣 {count} pitches generated"),
+}
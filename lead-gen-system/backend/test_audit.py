@@ -0,0 +1,107 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import audit
+from audit import AuditEngine, AuditError, analyze_html
+from fixture_server import GOOD_SITE, POOR_SITE, FixtureServer, canned_site
+from models import AuditResult
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def _audit_all(urls, **kwargs):
+    async with AuditEngine(parse_workers=kwargs.pop("parse_workers", 0), **kwargs) as engine:
+        return await engine.audit_many(urls)
+
+
+def test_good_site_outscores_poor_site():
+    with FixtureServer({"/good": canned_site(GOOD_SITE), "/poor": canned_site(POOR_SITE)}) as server:
+        good, poor = run(_audit_all([server.url("/good"), server.url("/poor")], parse_workers=1))
+
+    AuditResult(**good)
+    AuditResult(**poor)
+    for dim in ("design", "seo", "conversion", "trust", "mobile"):
+        assert good["scores"][dim] > poor["scores"][dim], dim
+    assert "Add a responsive viewport meta tag" in poor["quick_wins"]
+    assert "No clear call to action" in poor["weaknesses"]
+    assert len(poor["quick_wins"]) <= 10 and len(poor["weaknesses"]) <= 10
+
+
+def test_analyze_html_is_deterministic():
+    assert analyze_html(GOOD_SITE, "https://example.com/") == analyze_html(GOOD_SITE, "https://example.com/")
+
+
+def test_no_website_gets_zero_scores_without_fetching():
+    result = audit.audit_website(None)
+    assert set(result["scores"].values()) == {0}
+    AuditResult(**result)
+
+
+def test_body_cap_stops_reading():
+    big = GOOD_SITE + "<!--" + "x" * 500_000 + "-->"
+    with FixtureServer({"/": canned_site(big)}) as server:
+        async def go():
+            async with AuditEngine(max_body_bytes=10_000, parse_workers=0) as engine:
+                return await engine.fetch(server.url("/"))
+        page = run(go())
+    assert page.truncated
+    assert len(page.body.encode()) <= 10_000
+
+
+def test_per_host_and_global_limits():
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow(request):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return 200, {"Content-Type": "text/html"}, GOOD_SITE
+
+    with FixtureServer({"/": slow}) as server:
+        results = run(_audit_all([server.url("/")] * 8, per_host=2))
+    assert all(isinstance(r, dict) for r in results)
+    assert peak[0] == 2
+
+
+def test_idle_host_limits_are_dropped():
+    async def fetch_all(urls):
+        async with AuditEngine(parse_workers=0) as engine:
+            await asyncio.gather(*(engine.fetch(u) for u in urls))
+            return len(engine._hosts)
+
+    with FixtureServer({"/": lambda request: (200, {"Content-Type": "text/html"}, GOOD_SITE)}) as server:
+        assert run(fetch_all([server.url("/")] * 4)) == 0
+
+
+def test_errors_are_reported_per_url():
+    with FixtureServer({"/ok": canned_site(GOOD_SITE), "/slow": canned_site(GOOD_SITE, delay=1.0)}) as server:
+        ok, missing, slow = run(_audit_all(
+            [server.url("/ok"), server.url("/missing"), server.url("/slow")], timeout=0.2
+        ))
+    assert isinstance(ok, dict)
+    assert isinstance(missing, AuditError) and "HTTP 404" in str(missing)
+    assert isinstance(slow, AuditError) and "Timeout" in str(slow)
+
+
+def test_analysis_stage_audits_business_site(client):
+    import app
+    with FixtureServer({"/": canned_site(GOOD_SITE)}) as server:
+        created = client.post("/api/intake", json={
+            "name": "Plumbing Pros", "location": "Adelaide, SA", "url": server.url("/"),
+        }).json()
+        client.post("/api/analyze", json={"business_id": created["business_id"]})
+        assert app.runner.wait_idle(timeout=10)
+    body = client.get(f"/api/status/{created['job_id']}").json()
+    assert body["stage"] == "Competitors"
+    assert json.loads(body["data"])["scores"]["mobile"] == 100
+    assert server.hits("/") == 1
@@ -0,0 +1,71 @@
+import app
+
+
+def intake_many(client, n):
+    return [client.post("/api/intake", json={"name": f"Biz {i}", "location": "Adelaide, SA"}).json() for i in range(n)]
+
+
+def test_batch_stage_by_ids_reports_per_id_outcomes(client):
+    created = intake_many(client, 3)
+    ids = [c["business_id"] for c in created]
+
+    resp = client.post("/api/analyze/batch", json={"business_ids": ids[:2] + [999]})
+    assert resp.status_code == 202
+    body = resp.json()
+    assert [r["outcome"] for r in body["results"]] == ["queued", "queued", "not_found"]
+    assert body["counts"] == {"queued": 2, "not_found": 1}
+    assert app.runner.wait_idle(timeout=5)
+
+    # The first two moved on; the third runs Competitors alongside its Analysis
+    body = client.post("/api/competitors/batch", json={"business_ids": ids}).json()
+    assert [(r["outcome"], r["stage"]) for r in body["results"]] == [("queued", "Competitors")] * 3
+    assert app.runner.wait_idle(timeout=5)
+
+    statuses = client.post("/api/status/batch", json={"job_ids": [c["job_id"] for c in created] + [999]}).json()
+    assert [(r.get("stage"), r["status"]) for r in statuses["results"]] == [
+        ("Rebuild", "processing"), ("Rebuild", "processing"), ("Analysis", "processing"), (None, "not_found"),
+    ]
+
+
+def test_batch_stage_by_filter(client):
+    intake_many(client, 5)
+    body = client.post("/api/analyze/batch", json={"filter": {"status": "processing"}, "limit": 3}).json()
+    assert body["counts"] == {"queued": 3}
+    assert app.runner.wait_idle(timeout=5)
+
+    # Three jobs took Competitors over as their primary stage; the other two still run it as a branch
+    body = client.post("/api/status/batch", json={"filter": {"stage": "Competitors"}}).json()
+    assert [r["status"] for r in body["results"]] == ["processing"] * 5
+    body = client.post("/api/status/batch", json={"filter": {"stage": "Analysis", "status": "completed"}}).json()
+    assert len(body["results"]) == 3
+
+    # Nothing was created in the future
+    body = client.post("/api/analyze/batch", json={"filter": {"created_after": "2999-01-01T00:00:00Z"}}).json()
+    assert body["results"] == []
+
+
+def test_branch_stage_by_filter(client):
+    app.runner.stop()  # keep the jobs queued
+    created = intake_many(client, 3)
+    # Competitors runs alongside Analysis from intake on, as a branch of every job
+    assert client.get("/api/counts").json() == {
+        "counts": {"Analysis": {"processing": 3}, "Competitors": {"processing": 3}}, "total": 6}
+
+    body = client.post("/api/competitors/batch", json={"filter": {"status": "processing"}, "limit": 2}).json()
+    assert body["counts"] == {"queued": 2}
+    assert [r["job_id"] for r in body["results"]] == [c["job_id"] for c in created[:2]]
+
+    body = client.get("/api/jobs", params={"stage": "Competitors"}).json()
+    assert [i["status"] for i in body["items"]] == ["queued", "queued", "processing"]
+    body = client.post("/api/status/batch", json={"filter": {"stage": "Competitors", "status": "queued"}}).json()
+    assert [r["business_id"] for r in body["results"]] == [c["business_id"] for c in created[:2]]
+    assert client.get("/api/counts").json()["counts"]["Competitors"] == {"queued": 2, "processing": 1}
+    queue = client.get("/api/queue").json()
+    assert queue["total"] == 2 and queue["by_stage"] == {"Competitors": {"medium": 2}}
+
+
+def test_batch_requires_ids_or_filter(client):
+    assert client.post("/api/analyze/batch", json={}).status_code == 400
+    assert client.post("/api/analyze/batch", json={"business_ids": [1], "filter": {}}).status_code == 400
+    assert client.post("/api/analyze/batch", json={"filter": {"stage": "Pitch"}}).status_code == 400
+    assert client.post("/api/status/batch", json={"job_ids": list(range(app.MAX_BATCH + 1))}).status_code == 400
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pytest
+
+from audit import AuditEngine
+from cache import PageCache, normalize_url
+from fixture_server import GOOD_SITE, POOR_SITE, FixtureServer
+
+
+@pytest.fixture
+def page_cache(tmp_path):
+    cache = PageCache(tmp_path / "cache.db")
+    yield cache
+    cache.close()
+
+
+def etag_route(state):
+    """Serves state["html"] with an ETag and answers If-None-Match with 304."""
+    def handler(request):
+        etag = f'"{hash(state["html"])}"'
+        if request.headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"Content-Type": "text/html", "ETag": etag}, state["html"]
+    return handler
+
+
+def audit_urls(cache, urls):
+    async def go():
+        async with AuditEngine(parse_workers=0, cache=cache) as engine:
+            return await engine.audit_many(urls)
+    return asyncio.run(go())
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTP://Example.COM", "http://example.com/"),
+    ("https://example.com:443/a?b=2&a=1#top", "https://example.com/a?a=1&b=2"),
+    ("http://example.com:8080/?utm_source=x&id=3", "http://example.com:8080/?id=3"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+
+def test_fresh_entry_skips_fetch(page_cache):
+    with FixtureServer({"/": etag_route({"html": GOOD_SITE})}) as server:
+        first = audit_urls(page_cache, [server.url("/")])[0]
+        second = audit_urls(page_cache, [server.url("/?utm_source=email")])[0]
+        assert server.hits("/") == 1
+    assert first == second
+    assert page_cache.stats()["hits"] == 1 and page_cache.stats()["misses"] == 1
+
+
+def test_stale_entry_revalidates_with_etag(page_cache):
+    state = {"html": GOOD_SITE}
+    with FixtureServer({"/": etag_route(state)}) as server:
+        first = audit_urls(page_cache, [server.url("/")])[0]
+        page_cache.ttl = 0
+        again = audit_urls(page_cache, [server.url("/")])[0]
+        assert server.requests[-1][2].get("If-None-Match")
+        assert again == first
+        assert page_cache.stats()["revalidated"] == 1
+
+        state["html"] = POOR_SITE
+        changed = audit_urls(page_cache, [server.url("/")])[0]
+    assert changed["scores"]["mobile"] < first["scores"]["mobile"]
+    stats = page_cache.stats()
+    assert (stats["misses"], stats["changed"]) == (2, 1)
+
+
+def test_concurrent_requests_for_one_url_fetch_once(page_cache):
+    with FixtureServer({"/": etag_route({"html": GOOD_SITE})}) as server:
+        results = audit_urls(page_cache, [server.url("/")] * 20)
+        assert server.hits("/") == 1
+    assert all(r == results[0] for r in results)
+
+
+def test_lru_and_max_age_eviction(page_cache):
+    for i in range(5):
+        # Distinct, incompressible-ish bodies so each blob has real size
+        page_cache.put_page(f"http://site{i}.example/", f"http://site{i}.example/", 200, {},
+                            "".join(chr(33 + (i * 7919 + j * 104729) % 90) for j in range(20_000)))
+        time.sleep(0.01)
+    page_cache.get_page("http://site0.example/")  # most recently used now
+
+    sizes = [page_cache._pool.connect().execute(
+        "SELECT size FROM blobs JOIN pages ON content_hash = hash WHERE url=?", (f"http://site{i}.example/",)
+    ).fetchone()[0] for i in range(5)]
+    page_cache.max_bytes = sum(sizes) - sizes[1] - sizes[2]
+    assert page_cache.evict() == 2
+    kept = {i for i in range(5) if page_cache.get_page(f"http://site{i}.example/")}
+    assert kept == {0, 3, 4}
+    assert page_cache.stats()["blobs"] == 3
+
+    page_cache.max_age = 0
+    assert page_cache.evict() == 3
+    assert page_cache.size() == 0
@@ -0,0 +1,168 @@
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import audit
+import competition
+import db
+import jobs
+from app import init_db
+from competition import CompetitorEngine, CompetitorError, category_of
+from fixture_server import FixtureServer
+from runner import JobRunner
+
+SITES = {
+    "plumber": ["https://www.yellowpages.com.au/plumbers", "https://plumbingpros.example/",
+                "https://ajplumbing.example/", "https://drainking.example/", "https://fastflow.example/"],
+    "cafe": ["https://beanbar.example/", "https://dailygrind.example/"],
+}
+SCORES = {"https://plumbingpros.example/": 90, "https://ajplumbing.example/": 60, "https://drainking.example/": 75,
+          "https://fastflow.example/": 40, "https://beanbar.example/": 80, "https://dailygrind.example/": 70}
+
+
+def fake_searxng(request):
+    query = parse_qs(urlsplit(request.path).query)["q"][0]
+    urls = next((urls for category, urls in SITES.items() if query.startswith(category)), [])
+    results = [{"title": f"{urlsplit(u).hostname.split('.')[0].title()} | {query}", "url": u, "content": ""}
+               for u in urls]
+    return 200, {"Content-Type": "application/json"}, json.dumps({"query": query, "results": results})
+
+
+def fake_audits(calls):
+    def audit_many(urls):
+        calls.append(list(urls))
+        return [{"scores": dict.fromkeys(("design", "seo", "conversion", "trust", "mobile"), SCORES[u]),
+                 "quick_wins": [f"quick win for {u}"], "weaknesses": ["No enquiry form"]}
+                if u in SCORES else RuntimeError("fetch failed") for u in urls]
+    return audit_many
+
+
+def add_job(conn, name, location, url=None, stage="Competitors", status="queued"):
+    bid = conn.execute("INSERT INTO businesses (name, location, website_url) VALUES (?,?,?)",
+                       (name, location, url)).lastrowid
+    return conn.execute("INSERT INTO jobs (business_id, stage, status) VALUES (?,?,?)",
+                        (bid, stage, status)).lastrowid
+
+
+def test_category_from_trade_words():
+    assert category_of("Plumbing Pros Adelaide", "Adelaide, SA") == "plumber"
+    assert category_of("The Daily Grind Coffee Co", "Perth, WA") == "cafe"
+    assert category_of("Velvet Interiors", "Perth, WA") == "velvet interiors"  # "vet" must start a word
+
+
+def test_markets_are_researched_once_and_shared(db_path):
+    init_db()
+    conn = db.get_conn()
+    plumbers = [add_job(conn, "Plumbing Pros", "Adelaide, SA", "https://plumbingpros.example"),
+                add_job(conn, "Jim's Plumbing", "North Adelaide, SA"),
+                add_job(conn, "Ace Plumbers", "Adelaide SA 5000")]
+    cafe = add_job(conn, "Bean Cafe", "Perth, WA")
+    calls = []
+    with FixtureServer({"/search": fake_searxng}) as server:
+        engine = CompetitorEngine(server.url("/"), audit_many=fake_audits(calls))
+        runner = JobRunner({"Competitors": lambda job: engine.for_business(job["business"])}, workers=4,
+                           poll_interval=0.01)
+        runner.start()
+        try:
+            assert runner.wait_idle(timeout=10)
+        finally:
+            runner.stop()
+            engine.close()
+        # Adelaide plumbers (two blocks: adelaide, north adelaide) and Perth cafes
+        assert server.hits("/search") == 3
+    assert sum(len(c) for c in calls) <= 9  # every candidate site audited at most once per market
+
+    data = jobs.get_jobs(plumbers + [cafe])
+    top = {job_id: [c["name"] for c in json.loads(data[job_id]["data"])["top3"]] for job_id in data}
+    # Ranked by audit score, failed audits and directories dropped, the lead's own site left out
+    assert top[plumbers[0]] == ["Drainking", "Ajplumbing", "Fastflow"]
+    assert top[plumbers[2]] == ["Plumbingpros", "Drainking", "Ajplumbing"]
+    assert top[cafe] == ["Beanbar", "Dailygrind"]
+    first = json.loads(data[plumbers[2]]["data"])["top3"][0]
+    assert first["url"] == "https://plumbingpros.example/"
+    assert first["messaging_gaps"] == ["quick win for https://plumbingpros.example/", "No enquiry form"]
+    assert set(first["structure_strengths"]) == set(competition.STRENGTHS.values())
+
+
+def test_ttl_and_stale_fallback(db_path):
+    init_db()
+    business = {"name": "Plumbing Pros", "location": "Adelaide, SA"}
+    calls = []
+    with FixtureServer({"/search": fake_searxng}) as server:
+        engine = CompetitorEngine(server.url("/"), audit_many=fake_audits(calls))
+        try:
+            first = engine.for_business(business)
+            assert engine.for_business(business) == first
+            assert server.hits("/search") == 1
+        finally:
+            engine.close()
+    # Past the TTL with search down: the stale list is still served
+    db.get_conn().execute("UPDATE competitor_sets SET fetched_at = datetime('now', '-30 days')")
+    with FixtureServer({}) as server:
+        engine = CompetitorEngine(server.url("/"), audit_many=fake_audits(calls))
+        try:
+            assert engine.for_business(business) == first
+            with pytest.raises(CompetitorError):
+                engine.for_business({"name": "Bean Cafe", "location": "Perth, WA"})
+        finally:
+            engine.close()
+
+
+def test_concurrent_jobs_join_one_research(db_path):
+    init_db()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    audits = fake_audits(calls)
+
+    def slow_audits(urls):
+        started.set()
+        release.wait(5)
+        return audits(urls)
+
+    with FixtureServer({"/search": fake_searxng}) as server:
+        engine = CompetitorEngine(server.url("/"), audit_many=slow_audits)
+        out = []
+        threads = [threading.Thread(target=lambda: out.append(engine.for_business(
+            {"name": "Plumbing Pros", "location": "Adelaide, SA"}))) for _ in range(3)]
+        try:
+            threads[0].start()
+            assert started.wait(5)
+            for t in threads[1:]:
+                t.start()
+            release.set()
+            for t in threads:
+                t.join()
+        finally:
+            engine.close()
+        assert server.hits("/search") == 1
+    assert len(calls) == 1 and len(out) == 3 and out[0] == out[1] == out[2]
+
+
+def test_passes_are_bounded_and_audits_chunked(db_path, monkeypatch):
+    init_db()
+    conn = db.get_conn()
+    for name, location in [("Plumbing Pros", "Adelaide, SA"), ("Bean Cafe", "Perth, WA"),
+                           ("Ace Plumbers", "Hobart, TAS")]:
+        add_job(conn, name, location)
+    monkeypatch.setattr(competition, "COMPETITOR_MARKETS_PER_PASS", 2)
+    monkeypatch.setattr(audit, "AUDIT_CONCURRENCY", 2)
+    calls = []
+    audits = fake_audits(calls)
+
+    def one_chunk_times_out(urls):
+        if "https://drainking.example/" in urls:
+            raise TimeoutError()
+        return audits(urls)
+
+    with FixtureServer({"/search": fake_searxng}) as server:
+        engine = CompetitorEngine(server.url("/"), audit_many=one_chunk_times_out)
+        try:
+            top3 = engine.for_business({"name": "Plumbing Pros", "location": "Adelaide, SA"})["top3"]
+        finally:
+            engine.close()
+        assert server.hits("/search") == 2  # this market and one other waiting
+    assert all(len(chunk) <= 2 for chunk in calls)
+    # The timed-out chunk only cost its own two sites
+    assert [c["name"] for c in top3] == ["Plumbingpros", "Ajplumbing"]
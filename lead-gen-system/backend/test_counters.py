@@ -0,0 +1,59 @@
+import db
+import importer
+import jobs
+from app import init_db
+
+
+def group_by_counts():
+    counts = {}
+    for table in ("jobs", "job_branches"):
+        for stage, status, n in db.get_conn().execute(f"SELECT stage, status, COUNT(*) FROM {table} GROUP BY stage, status"):
+            counts.setdefault(stage, {})[status] = counts.get(stage, {}).get(status, 0) + n
+    return counts
+
+
+def test_counters_follow_every_kind_of_write(db_path):
+    init_db()
+    conn = db.get_conn()
+    bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+    job_id = jobs.create_job(bid, "Intake")
+    jobs.update_job_stage(job_id, "Analysis")
+    assert jobs.stage_counts() == {"Analysis": {"processing": 1}}
+
+    lead_importer = importer.LeadImporter("Analysis", batch_size=2)
+    lead_importer.feed("name,location\nB,Adelaide\nC,Adelaide\nD,Adelaide\n")
+    lead_importer.finish()
+    jobs.enqueue_batch("Analysis", [bid, bid + 1])
+    claimed = jobs.claim_jobs(1, ["Analysis"])
+    jobs.fail_job(claimed[0]["id"], "boom", retry=False)
+    jobs.enqueue_matching("Analysis", 10, status="processing")
+    # Imported leads run Competitors as a branch, counted in its own column
+    jobs.enqueue_matching("Competitors", 2, status="processing")
+    conn.execute("DELETE FROM jobs WHERE id = ?", (job_id + 1,))
+    # Writes that leave stage and status alone don't touch the counters
+    conn.execute("UPDATE jobs SET last_error = 'x'")
+
+    assert jobs.stage_counts() == group_by_counts() == {"Analysis": {"failed": 1, "queued": 2},
+                                                        "Competitors": {"processing": 1, "queued": 2}}
+
+
+def test_reconcile_repairs_drift(db_path):
+    init_db()
+    conn = db.get_conn()
+    bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+    jobs.create_job(bid, "Analysis")
+    jobs.open_branches([1], ["Competitors"])
+    assert jobs.reconcile_stage_counts() == 0
+
+    conn.execute("UPDATE stage_counters SET n = 40")
+    conn.execute("INSERT INTO stage_counters VALUES ('Ghost', 'idle', 3)")
+    assert jobs.reconcile_stage_counts() == 3
+    assert jobs.stage_counts() == group_by_counts() == {"Analysis": {"idle": 1}, "Competitors": {"processing": 1}}
+
+
+def test_counts_endpoint(client):
+    for name in ("A", "B"):
+        client.post("/api/intake", json={"name": name, "location": "Adelaide"})
+    assert client.get("/api/counts").json() == {
+        "counts": {"Analysis": {"processing": 2}, "Competitors": {"processing": 2}}, "total": 4}
+    assert 'leadgen_jobs{stage="Competitors",status="processing"} 2' in client.get("/metrics").text
@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+
+import pytest
+
+import db
+
+
+def test_connection_pragmas(db_path):
+    conn = db.get_conn()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA mmap_size").fetchone()[0] == db.MMAP_SIZE
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] == -db.CACHE_SIZE_KB
+
+
+def test_connection_reused_per_thread(db_path):
+    assert db.get_conn() is db.get_conn()
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(db.get_conn()))
+    t.start()
+    t.join()
+    assert other[0] is not db.get_conn()
+    # Closed with its thread
+    assert len(db.get_pool()) == 1
+    with pytest.raises(sqlite3.ProgrammingError):
+        other[0].execute("SELECT 1")
+
+
+def test_close_all_reopens_per_thread(db_path):
+    first = db.get_conn()
+    db.close_all()
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.execute("SELECT 1")
+    assert db.get_conn() is not first and db.get_conn().execute("SELECT 1").fetchone() == (1,)
+
+
+def test_transaction_rolls_back_and_nests(db_path):
+    db.get_conn().execute("CREATE TABLE t (v INTEGER)")
+    with pytest.raises(RuntimeError):
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            with db.transaction():
+                conn.execute("INSERT INTO t VALUES (2)")
+            raise RuntimeError("boom")
+    assert db.get_conn().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO t VALUES (3)")
+    assert db.get_conn().execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+
+
+def test_intake_uses_pool(client, db_path):
+    resp = client.post("/api/intake", json={"name": "EcoClean Solutions", "location": "Adelaide, SA"})
+    assert resp.status_code == 200
+    body = resp.json()
+
+    resp = client.get(f"/api/status/{body['job_id']}")
+    assert resp.json()["stage"] == "Analysis"
+
+    # Visible to an independent connection, i.e. committed
+    row = sqlite3.connect(db_path).execute("SELECT stage FROM jobs WHERE id=?", (body["job_id"],)).fetchone()
+    assert row == ("Analysis",)
@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+import db
+import importer
+from app import init_db
+from dedup import business_key
+
+
+@pytest.mark.parametrize("a, b", [
+    (("Plumbing Pros Adelaide", "Adelaide, SA", None), ("  plumbing pros ADELAIDE ", "adelaide sa", "")),
+    (("Café Roma", "Adelaide, South Australia", "https://www.caferoma.example/menu"),
+     ("Cafe Roma", "Adelaide SA Australia", "http://caferoma.example:8080")),
+    (("Smith & Sons", "Perth, WA", None), ("Smith and Sons", "Perth WA", None)),
+])
+def test_business_key_equivalences(a, b):
+    assert business_key(*a) == business_key(*b)
+
+
+def test_business_key_keeps_distinct_leads_apart():
+    assert business_key("Plumbing Pros", "Adelaide, SA") != business_key("Plumbing Pros", "Perth, WA")
+    assert business_key("A", "B", "https://a.example") != business_key("A", "B", "https://b.example")
+
+
+def test_intake_is_idempotent(client):
+    first = client.post("/api/intake", json={"name": "EcoClean Solutions", "location": "Adelaide, SA"}).json()
+    again = client.post("/api/intake", json={"name": "ecoclean solutions", "location": "Adelaide SA"}).json()
+    assert again == {"business_id": first["business_id"], "job_id": first["job_id"], "status": "duplicate"}
+
+    forced = client.post("/api/intake?dedupe=false", json={"name": "EcoClean Solutions", "location": "Adelaide, SA"})
+    assert forced.json()["status"] == "accepted"
+    assert forced.json()["business_id"] != first["business_id"]
+    assert db.get_conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 2
+
+
+def upload(client, text, query=""):
+    return client.post(f"/api/upload-csv{query}", files={"file": ("leads.csv", text.encode(), "text/csv")}).json()
+
+
+def test_reimport_skips_known_and_in_file_duplicates(client):
+    client.post("/api/intake", json={"name": "Gym Pro Fitness", "location": "Adelaide, SA"})
+    csv_text = (
+        "Business Name,Location,Website URL\n"
+        "Gym Pro Fitness,\"Adelaide, SA\",\n"
+        "Adelaide Coffee Co,\"Adelaide, SA\",\n"
+        "adelaide coffee co,Adelaide SA,\n"
+        "Local Pro Plumbing,\"Adelaide, SA\",\n"
+    )
+    body = upload(client, csv_text)
+    assert (body["imported"], body["duplicates_in_file"], body["duplicates_existing"]) == (2, 1, 1)
+    assert body["skipped_duplicates"] == 2
+
+    again = upload(client, csv_text)
+    assert (again["imported"], again["skipped_duplicates"]) == (0, 4)
+    assert db.get_conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 3
+
+    forced = upload(client, csv_text, "?dedupe=false")
+    assert forced["imported"] == 4
+    assert db.get_conn().execute("SELECT COUNT(*) FROM businesses WHERE dedup_key IS NOT NULL").fetchone()[0] == 3
+
+
+@pytest.mark.parametrize("dedupe", [True, False])
+def test_duplicates_across_batches_are_found_in_the_database(db_path, dedupe):
+    init_db()
+    db.get_conn().execute("INSERT INTO businesses (name, location, dedup_key) VALUES ('Old Co', 'Perth', ?)",
+                          (business_key("Old Co", "Perth"),))
+    lead_importer = importer.LeadImporter("Analysis", batch_size=2, dedupe=dedupe)
+    lead_importer.feed("name,location\nA Co,Perth\nB Co,Perth\na co,Perth\nOld Co,Perth\nB Co,Perth\n")
+    report = lead_importer.finish()
+    assert not lead_importer._batch_keys
+    if dedupe:
+        assert (report.imported, report.duplicates_in_file, report.duplicates_existing) == (2, 2, 1)
+    else:
+        assert report.imported == 5
+        keyed = db.get_conn().execute("SELECT COUNT(*) FROM businesses WHERE dedup_key IS NOT NULL").fetchone()[0]
+        assert keyed == 3
+
+
+def test_migration_backfills_keys_over_existing_duplicates(db_path):
+    with sqlite3.connect(db_path) as legacy:
+        legacy.executescript('''
+            CREATE TABLE businesses (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, location TEXT,
+                website_url TEXT, status TEXT DEFAULT 'pending', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            INSERT INTO businesses (name, location) VALUES ('A Co', 'Adelaide, SA'), ('a co', 'Adelaide SA'), ('B', 'X');
+        ''')
+    init_db()
+    keys = db.get_conn().execute("SELECT id, dedup_key IS NOT NULL FROM businesses ORDER BY id").fetchall()
+    assert keys == [(1, 1), (2, 0), (3, 1)]
@@ -0,0 +1,94 @@
+import gzip
+import json
+
+import pytest
+
+import db
+import demo
+import jobs
+from app import init_db
+from demo import DemoBuilder, render_site
+from runner import JobRunner
+from stages import STAGE_FUNCTIONS, mock_rebuild_output
+
+REBUILD = {
+    "structure": ["Home", "Services", "About Us", "Contact"],
+    "headings": ["Adelaide's <fastest> plumbers", "Blocked drains, burst pipes"],
+    "CTAs": ["Get a Quote", "Call Now"],
+    "trust_signals": ["Licensed & insured", "500+ reviews"],
+}
+
+
+def site(business_id=1, **rebuild):
+    return {"business": {"id": business_id, "name": "Plumbing Pros", "location": "Adelaide, SA"},
+            "rebuild": {**REBUILD, **rebuild}}
+
+
+def test_renders_one_page_per_structure_entry(db_path):
+    report = render_site(site())
+    assert (report["pages"], report["rendered"], report["skipped"]) == (4, 4, 0)
+    assert report["demo_url"].endswith("/demos/1/")
+    out = demo.DEMOS_DIR / "1"
+    assert sorted(p.name for p in out.glob("*.html")) == ["about-us.html", "contact.html", "index.html",
+                                                           "services.html"]
+    home = (out / "index.html").read_text()
+    assert gzip.decompress((out / "index.html.gz").read_bytes()).decode() == home
+    stylesheet = demo.environment().stylesheet
+    assert f'href="../assets/{stylesheet}"' in home and (demo.DEMOS_DIR / "assets" / stylesheet).exists()
+    assert "Adelaide&#39;s &lt;fastest&gt; plumbers" in home  # autoescaped
+    assert 'href="contact.html"' in home and "Licensed &amp; insured" in home
+    assert "<h1>Blocked drains, burst pipes</h1>" in (out / "services.html").read_text()
+    assert "<form" in (out / "contact.html").read_text()
+
+
+def test_unchanged_pages_are_skipped(db_path):
+    render_site(site())
+    index = demo.DEMOS_DIR / "1" / "index.html"
+    stamp = index.stat().st_mtime_ns
+    assert render_site(site())["skipped"] == 4
+    assert index.stat().st_mtime_ns == stamp
+
+    # A new CTA is on every page; a dropped page is removed
+    report = render_site(site(structure=["Home", "Services", "Contact"], CTAs=["Book Online"]))
+    assert (report["rendered"], report["skipped"]) == (3, 0)
+    assert not list((demo.DEMOS_DIR / "1").glob("about-us.*"))
+    manifest = json.loads((demo.DEMOS_DIR / "1" / "manifest.json").read_text())
+    assert sorted(manifest["pages"]) == ["contact.html", "index.html", "services.html"]
+
+
+def test_template_bytecode_is_cached(db_path):
+    render_site(site())
+    assert list(demo.DEMO_TEMPLATE_CACHE.glob("__jinja2_*.cache"))
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_builder_renders_batches(db_path, workers):
+    builder = DemoBuilder(workers=workers)
+    try:
+        first = builder.build([site(i) for i in range(1, 9)])
+        again = builder.build([site(i) for i in range(1, 9)])
+    finally:
+        builder.close()
+    assert (first["sites"], first["rendered"], first["skipped"]) == (8, 32, 0)
+    assert (again["rendered"], again["skipped"]) == (0, 32)
+    assert all((demo.DEMOS_DIR / str(i) / "index.html").exists() for i in range(1, 9))
+
+
+def test_demo_stage_renders_from_rebuild_output(db_path):
+    init_db()
+    conn = db.get_conn()
+    bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('Bean Cafe', 'Perth, WA')").lastrowid
+    job_id = conn.execute("INSERT INTO jobs (business_id, stage, status) VALUES (?, 'Rebuild', 'queued')",
+                          (bid,)).lastrowid
+    runner = JobRunner({"Rebuild": lambda job: mock_rebuild_output(), "Demo": STAGE_FUNCTIONS["Demo"]},
+                       workers=1, auto_advance=True, poll_interval=0.01)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=5)
+    finally:
+        runner.stop()
+    job = jobs.get_jobs([job_id])[job_id]
+    assert (job["stage"], job["status"]) == ("Pitch", "processing")
+    assert json.loads(job["data"]) == {"demo_url": demo.demo_url(bid)}
+    assert (demo.DEMOS_DIR / str(bid) / "pricing.html").exists()
+    assert demo.stored_sites()[0]["business"]["name"] == "Bean Cafe"
@@ -0,0 +1,99 @@
+import asyncio
+import gzip
+
+import demo
+from demo import render_site
+from demo_server import DemoServer, accepted
+
+SITE = {"business": {"id": 7, "name": "Bean Cafe", "location": "Perth, WA"},
+        "rebuild": {"structure": ["Home", "Menu", "Contact"], "headings": ["Coffee worth the walk"],
+                    "CTAs": ["Order Ahead"], "trust_signals": ["4.9 stars"]}}
+
+
+def test_accept_encoding_parsing():
+    assert accepted("gzip, deflate, br;q=0.8") == {"gzip": 1.0, "deflate": 1.0, "br": 0.8}
+    assert accepted("br;q=0, *;q=0.5") == {"br": 0.0, "*": 0.5}
+    assert accepted(None) == {}
+
+
+def test_serves_precompressed_pages_with_etags(db_path):
+    render_site(SITE)
+    page = demo.DEMOS_DIR / "7" / "index.html"
+    (page.parent / "index.html.br").write_bytes(b"fake brotli")  # as written with the brotli package
+    server = DemoServer()
+
+    plain = server.respond("7/", {})
+    assert plain.status_code == 200 and plain.body == page.read_bytes()
+    assert plain.headers["content-type"] == "text/html; charset=utf-8"
+    assert plain.headers["cache-control"] == "public, max-age=300" and plain.headers["vary"] == "Accept-Encoding"
+
+    gz = server.respond("7/index.html", {"accept-encoding": "gzip, deflate"})
+    assert gz.headers["content-encoding"] == "gzip" and gzip.decompress(gz.body) == plain.body
+    br = server.respond("7/", {"accept-encoding": "gzip, br"})
+    assert br.headers["content-encoding"] == "br" and br.body == b"fake brotli"
+    assert len({plain.headers["etag"], gz.headers["etag"], br.headers["etag"]}) == 3
+
+    again = server.respond("7/", {"accept-encoding": "gzip", "if-none-match": gz.headers["etag"]})
+    assert again.status_code == 304 and again.body == b""
+    assert server.respond("7/", {"if-none-match": gz.headers["etag"]}).status_code == 200
+
+    head = server.respond("7/menu.html", {}, head=True)
+    assert head.body == b"" and int(head.headers["content-length"]) == (page.parent / "menu.html").stat().st_size
+
+
+def test_hot_files_come_from_memory(db_path):
+    render_site(SITE)
+    page = demo.DEMOS_DIR / "7" / "menu.html"
+    server = DemoServer(check_interval=60)
+    assert server.cached(page) is None  # a miss goes to the threadpool in serve()
+    first = server.respond("7/menu.html", {})
+    assert server.cached(page).bodies["identity"] == first.body
+    page.unlink()
+    assert server.respond("7/menu.html", {}).body == first.body  # not read again
+
+    # Re-rendered pages are picked up at the next check
+    render_site({**SITE, "rebuild": {**SITE["rebuild"], "CTAs": ["Book a Table"]}})
+    server.check_interval = 0
+    changed = server.respond("7/menu.html", {})
+    assert b"Book a Table" in changed.body and changed.headers["etag"] != first.headers["etag"]
+
+
+def test_assets_large_files_and_limits(db_path):
+    render_site(SITE)
+    stylesheet = demo.environment().stylesheet
+    server = DemoServer(max_bytes=4096, file_max=1024)
+    css = server.respond(f"assets/{stylesheet}", {"accept-encoding": "gzip"})
+    assert css.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert css.headers["content-type"] == "text/css; charset=utf-8"
+
+    # Pages are over file_max here: streamed from disk, still with ETags and 304s
+    page = server.respond("7/contact.html", {"accept-encoding": "gzip"})
+    assert page.path.name == "contact.html.gz" and page.headers["etag"]
+    assert server.respond("7/contact.html", {"accept-encoding": "gzip",
+                                             "if-none-match": page.headers["etag"]}).status_code == 304
+    assert server.stats()["bytes"] <= 4096
+
+    for path in ("7/manifest.json", "7/index.html.gz", "7/../7/index.html", "7/.index.html.1.tmp", "8/"):
+        assert server.respond(path, {}).status_code == 404, path
+    moved = server.respond("7", {})
+    assert moved.status_code == 301 and moved.headers["location"] == "/demos/7/"
+
+
+def test_demos_route(client):
+    render_site(SITE)
+    resp = client.get("/demos/7/", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200 and resp.headers["content-encoding"] == "gzip"
+    assert "Coffee worth the walk" in resp.text
+    assert client.get("/demos/7/", headers={"If-None-Match": resp.headers["etag"],
+                                            "Accept-Encoding": "gzip"}).status_code == 304
+    assert client.head("/demos/7/").status_code == 200
+    assert client.get("/demos/7", follow_redirects=False).status_code == 301
+
+
+def test_serve_matches_respond(db_path):
+    render_site(SITE)
+    server = DemoServer()
+    served = asyncio.run(server.serve("7/", {"accept-encoding": "gzip"}))
+    assert served.body == server.respond("7/", {"accept-encoding": "gzip"}).body
+    assert asyncio.run(server.serve("7", {})).status_code == 301
+    assert asyncio.run(server.serve("7/manifest.json", {})).status_code == 404
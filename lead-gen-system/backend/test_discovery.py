@@ -0,0 +1,112 @@
+import json
+from urllib.parse import parse_qs, urlsplit
+
+import db
+import discovery
+import importer
+from app import init_db
+from discovery import UrlDiscovery, rank
+from fixture_server import FixtureServer
+
+# Query -> search results; anything else gets a directory listing only
+RESULTS = {
+    "Jim's Mowing Adelaide, SA": [
+        {"title": "Jim's Mowing Adelaide - Yellow Pages", "url": "https://www.yellowpages.com.au/sa/jims-mowing"},
+        {"title": "Jim's Mowing | Lawn mowing", "url": "https://www.jimsmowing.com.au/"},
+    ],
+    "Plumbing Pros Adelaide Adelaide, SA": [
+        {"title": "Plumbing Pros Adelaide | 24/7 plumber", "url": "https://plumbingprosadelaide.com.au/contact"},
+    ],
+}
+
+
+def fake_searxng(request):
+    query = parse_qs(urlsplit(request.path).query)["q"][0]
+    results = RESULTS.get(query, [{"title": f"{query} - Yelp", "url": "https://www.yelp.com.au/biz/x"}])
+    body = {"query": query, "results": [{**r, "content": "", "engine": "fake"} for r in results]}
+    return 200, {"Content-Type": "application/json"}, json.dumps(body)
+
+
+def import_leads(rows, dedupe=True):
+    imp = importer.LeadImporter("Analysis", discover=True, dedupe=dedupe)
+    imp.feed("name,location,website_url\n" + "".join(f'"{n}","{loc}",{url}\n' for n, loc, url in rows))
+    return imp.finish()
+
+
+def test_rank_prefers_the_business_own_domain():
+    match = rank("Jim's Mowing", "Adelaide, SA", RESULTS["Jim's Mowing Adelaide, SA"])
+    assert match.url == "https://www.jimsmowing.com.au/" and match.chain
+    match = rank("Plumbing Pros Adelaide", "Adelaide, SA", RESULTS["Plumbing Pros Adelaide Adelaide, SA"])
+    assert match.url == "https://plumbingprosadelaide.com.au/" and not match.chain
+    unrelated = [{"title": "The Coffee Club", "url": "https://www.coffeeclub.com.au/"}]
+    assert rank("The Coffee Nook", "Melbourne, VIC", unrelated) is None
+
+
+def test_batch_resolves_caches_and_moves_jobs(db_path):
+    init_db()
+    report = import_leads([("Jim's Mowing", "Adelaide, SA", ""), ("Plumbing Pros Adelaide", "Adelaide, SA", ""),
+                           ("Acme Widgets", "Hobart, TAS", ""), ("Known Co", "Perth, WA", "https://known.example")])
+    assert report.awaiting_discovery == 3
+    conn = db.get_conn()
+    assert conn.execute("SELECT stage, status FROM jobs ORDER BY id").fetchall() == [
+        ("Intake", "discovering")] * 3 + [("Analysis", "processing")]
+
+    with FixtureServer({"/search": fake_searxng}) as server:
+        worker = UrlDiscovery(server.url("/"), batch_size=10)
+        try:
+            first = worker.run_batch()
+            assert (first["leads"], first["found"], first["not_found"], first["errors"]) == (3, 2, 1, 0)
+            assert first["leads_per_minute"] > 0
+            assert server.hits("/search") == 3
+
+            # Another branch of the chain and a re-import are answered from url_discovery
+            import_leads([("Jim's Mowing", "Perth, WA", ""), ("Plumbing Pros Adelaide", "Adelaide, SA", ""),
+                          ("Acme Widgets", "Hobart, TAS", "")], dedupe=False)
+            second = worker.run_batch()
+            assert (second["leads"], second["found"], second["not_found"]) == (3, 2, 1)
+            assert server.hits("/search") == 3
+            assert worker.stats()["cached"] == 3 and worker.stats()["waiting"] == 0
+        finally:
+            worker.stop()
+
+    urls = conn.execute("SELECT name, location, website_url FROM businesses ORDER BY id").fetchall()
+    assert urls[:3] == [("Jim's Mowing", "Adelaide, SA", "https://www.jimsmowing.com.au/"),
+                        ("Plumbing Pros Adelaide", "Adelaide, SA", "https://plumbingprosadelaide.com.au/"),
+                        ("Acme Widgets", "Hobart, TAS", None)]
+    assert urls[4] == ("Jim's Mowing", "Perth, WA", "https://www.jimsmowing.com.au/")
+    assert conn.execute("SELECT DISTINCT stage, status FROM jobs").fetchall() == [("Analysis", "processing")]
+
+
+def test_search_errors_leave_leads_discovering(db_path):
+    init_db()
+    import_leads([("Jim's Mowing", "Adelaide, SA", "")])
+    with FixtureServer({}) as server:
+        worker = UrlDiscovery(server.url("/"))
+        try:
+            assert worker.run_batch()["errors"] == 1
+        finally:
+            worker.stop()
+    assert db.get_conn().execute("SELECT stage, status FROM jobs").fetchall() == [("Intake", "discovering")]
+    assert not db.get_conn().execute("SELECT COUNT(*) FROM url_discovery").fetchone()[0]
+
+
+def test_intake_without_url_waits_for_discovery(client, monkeypatch):
+    monkeypatch.setattr(discovery, "DISCOVERY_ENABLED", True)
+    body = client.post("/api/intake", json={"name": "Jim's Mowing", "location": "Adelaide, SA"}).json()
+    assert body["status"] == discovery.REQUIRES_URL_DISCOVERY
+    status = client.get(f"/api/status/{body['job_id']}").json()
+    assert (status["stage"], status["status"]) == ("Intake", "discovering")
+
+    body = client.post("/api/intake", json={"name": "Known Co", "location": "Perth, WA",
+                                            "url": "https://known.example"}).json()
+    assert body["status"] == "accepted"
+    assert client.get("/api/discovery").json()["waiting"] == 1
+
+
+def test_cli_stops_when_search_is_down(db_path, capsys):
+    init_db()
+    import_leads([("Jim's Mowing", "Adelaide, SA", "")])
+    with FixtureServer({}) as server:
+        discovery.main(["--db", str(db_path), "--base-url", server.url("/")])
+        assert server.hits("/search") == 1
+    assert "Every search in the batch failed" in capsys.readouterr().out
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import db
+import events
+import jobs
+from app import init_db
+from events import EventBus, sse_stream
+
+
+def parse(message):
+    fields = dict(line.split(": ", 1) for line in message.strip().splitlines())
+    return fields.get("id"), fields["event"], json.loads(fields["data"])
+
+
+async def next_message(stream):
+    return parse(await asyncio.wait_for(stream.__anext__(), 2))
+
+
+def test_after_commit_runs_only_on_commit(db_path):
+    ran = []
+    with db.transaction():
+        db.after_commit(lambda: ran.append("committed"))
+        assert ran == []
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.after_commit(lambda: ran.append("rolled back"))
+            raise RuntimeError
+    db.after_commit(lambda: ran.append("no transaction"))
+    assert ran == ["committed", "no transaction"]
+
+
+def test_burst_is_one_batch_fanned_out_to_every_client():
+    async def go():
+        calls = []
+        bus = EventBus(flush_interval=0.2)
+        await bus.start(snapshot=lambda: calls.append(1) or {"Analysis": {"queued": len(calls)}})
+        streams = [sse_stream(bus) for _ in range(50)]
+        snapshots = [await next_message(s) for s in streams]
+        assert {s[1] for s in snapshots} == {"snapshot"}
+
+        burst = [{"job_id": i, "stage": "Analysis", "status": "queued"} for i in range(5000)]
+        publisher = threading.Thread(target=lambda: [bus.publish(burst[i:i + 100]) for i in range(0, 5000, 100)])
+        publisher.start()
+        publisher.join()
+        messages = [await next_message(s) for s in streams]
+        bus.stop()
+        return calls, messages
+
+    calls, messages = asyncio.run(go())
+    assert len(calls) == 1  # one counts query shared by 50 clients
+    for event_id, kind, data in messages:
+        assert kind == "transitions"
+        assert len(data["events"]) == 5000
+    assert len({m[0] for m in messages}) == 1
+
+
+def test_resume_replays_missed_batches_then_falls_back_to_snapshot():
+    async def go():
+        bus = EventBus(flush_interval=0, buffer_size=3)
+        await bus.start(snapshot=lambda: {})
+        stream = sse_stream(bus)
+        cursor, _, _ = await next_message(stream)
+        await stream.aclose()
+
+        for i in range(2):
+            bus.publish([{"job_id": i, "stage": "Demo", "status": "queued"}])
+            await asyncio.sleep(0.01)
+        resumed = sse_stream(bus, cursor)
+        replay = [await next_message(resumed) for _ in range(3)]
+        await resumed.aclose()
+
+        for i in range(2, 6):
+            bus.publish([{"job_id": i, "stage": "Demo", "status": "queued"}])
+            await asyncio.sleep(0.01)
+        too_old = sse_stream(bus, cursor)
+        first = await next_message(too_old)
+        await too_old.aclose()
+        restarted = sse_stream(bus, "0000-1")
+        after_restart = await next_message(restarted)
+        await restarted.aclose()
+        bus.stop()
+        return replay, first, after_restart
+
+    replay, first, after_restart = asyncio.run(go())
+    assert [(kind, data.get("events", [{}])[0].get("job_id")) for _, kind, data in replay] == [
+        ("transitions", 0), ("transitions", 1), ("snapshot", None),
+    ]
+    assert first[1] == "snapshot"
+    assert after_restart[1] == "snapshot"
+
+
+def test_job_transitions_reach_the_stream(db_path):
+    init_db()
+
+    async def go():
+        bus = events.bus
+        bus.flush_interval = 0.01
+        await bus.start(snapshot=jobs.stage_counts)
+        stream = sse_stream(bus)
+        await next_message(stream)
+
+        def work():
+            with db.transaction() as conn:
+                bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+                job_id = jobs.create_job(bid, "Intake")
+                jobs.update_job_stage(job_id, "Analysis")
+            jobs.enqueue_batch("Analysis", [bid])
+            jobs.claim_jobs(10, ["Analysis"])
+        await asyncio.to_thread(work)
+
+        seen = []
+        while len(seen) < 4:
+            _, _, data = await next_message(stream)
+            seen += [(e["stage"], e["status"]) for e in data["events"]]
+        counts = data.get("counts")
+        bus.stop()
+        await stream.aclose()
+        return seen, counts
+
+    seen, counts = asyncio.run(go())
+    assert seen == [("Intake", "idle"), ("Analysis", "processing"), ("Analysis", "queued"), ("Analysis", "running")]
+    assert counts is None or counts == {"Analysis": {"running": 1}}
@@ -0,0 +1,159 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import db
+from app import init_db
+from dedup import FuzzyRecord, find_duplicates, location_block, scan_businesses, score
+
+
+def record(name, location="Adelaide, SA", url=None, business_id=1):
+    return FuzzyRecord.from_row(business_id, name, location, url)
+
+
+def test_location_block_drops_state_postcode_and_country():
+    assert location_block("North Adelaide, SA 5006") == "north adelaide"
+    assert location_block("Adelaide South Australia, Australia") == "adelaide"
+    assert location_block("Perth WA") != location_block("Adelaide SA")
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Plumbing Pros", "Plumbing Pros Pty Ltd"),
+    ("Pro Fitness Gym", "Gym Pro Fitness"),
+    ("Plumbing Pros Adelaide", "Plumbing Prox"),
+    ("Summit Roofing Services", "Summit Roofing Service"),
+])
+def test_near_duplicates_score_above_threshold(a, b):
+    assert score(record(a), record(b)) >= 0.7
+
+
+@pytest.mark.parametrize("a, b", [
+    ("Sunrise Bakery", "Sunset Bakery"),
+    ("Smile Dental", "Bright Dental"),
+    ("Coastal Cafe", "Coastal Cafe 2"),
+    ("ABC Electrical", "ABD Electrical"),
+])
+def test_different_businesses_score_below_threshold(a, b):
+    assert score(record(a), record(b)) < 0.7
+
+
+def test_websites_decide_when_both_are_known():
+    assert score(record("Plumbing Pros", url="https://a.example"), record("Plumbing Pros", url="https://b.example")) == 0
+    assert score(record("Acme", url="https://www.acme.example"), record("Acme Plumbing", url="http://acme.example")) == 1
+
+
+def test_find_duplicates_clusters_within_location_blocks():
+    rows = [
+        (1, "Plumbing Pros", "Adelaide, SA", None),
+        (2, "Plumbing Pros Pty Ltd", "Adelaide SA 5000", None),
+        (3, "Plumbing Pros", "Perth, WA", None),
+        (4, "The Plumbing Pros", "Adelaide", None),
+        (5, "Sunset Bakery", "Adelaide", None),
+    ]
+    result = find_duplicates(rows)
+    assert result.clusters == [[1, 2, 4]]
+    assert sorted((dup, canonical) for dup, canonical, _ in result.pairs) == [(2, 1), (4, 1)]
+
+
+def add_business(name, location="Adelaide, SA"):
+    with db.transaction() as conn:
+        bid = conn.execute(
+            "INSERT INTO businesses (name, location, location_block) VALUES (?,?,?)",
+            (name, location, location_block(location))
+        ).lastrowid
+        conn.execute("INSERT INTO jobs (business_id, stage, status) VALUES (?, 'Analysis', 'queued')", (bid,))
+    return bid
+
+
+def test_scan_merge_retires_duplicates_and_their_jobs(db_path):
+    init_db()
+    keep, dup = add_business("Bright Dental"), add_business("Bright Dental Pty Ltd")
+    add_business("Smile Dental")
+    assert scan_businesses(action="flag").clusters == [[keep, dup]]
+    assert scan_businesses(action="merge").pairs[0][:2] == (dup, keep)
+
+    conn = db.get_conn()
+    assert conn.execute("SELECT status FROM businesses WHERE id=?", (dup,)).fetchone()[0] == "merged"
+    assert conn.execute("SELECT status FROM jobs WHERE business_id=?", (dup,)).fetchone()[0] == "merged"
+    assert conn.execute("SELECT status FROM business_duplicates").fetchall() == [("merged",)]
+    # Merged businesses drop out of later scans
+    assert scan_businesses().pairs == []
+
+
+def upload(client, text, query=""):
+    return client.post(f"/api/upload-csv{query}", files={"file": ("leads.csv", text.encode(), "text/csv")}).json()
+
+
+def test_import_flags_near_duplicates_without_jobs(client):
+    client.post("/api/intake", json={"name": "Plumbing Pros", "location": "Adelaide, SA"})
+    body = upload(client, (
+        "name,location\n"
+        "Plumbing Pros Pty Ltd,Adelaide SA 5000\n"
+        "Sunset Bakery,Adelaide\n"
+        "Sunset Bakery Co,Adelaide\n"
+    ), "?fuzzy=flag")
+    assert (body["imported"], body["possible_duplicates"]) == (3, 2)
+    conn = db.get_conn()
+    held = conn.execute("SELECT id FROM businesses WHERE status='possible_duplicate' ORDER BY id").fetchall()
+    assert len(held) == 2
+    assert conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 2
+
+    flags = client.get("/api/dedup/flags").json()["items"]
+    assert [(f["business"]["name"], f["candidate"]["name"]) for f in flags] == [
+        ("Plumbing Pros Pty Ltd", "Plumbing Pros"), ("Sunset Bakery Co", "Sunset Bakery"),
+    ]
+    # Dismissing a flag releases the business into the pipeline
+    released = client.post("/api/dedup/dismiss", json={
+        "business_id": flags[1]["business_id"], "duplicate_of": flags[1]["duplicate_of"],
+    }).json()
+    assert released["job_id"] is not None
+    merged = client.post("/api/dedup/merge", json={"business_id": flags[0]["business_id"],
+                                                   "into": flags[0]["duplicate_of"]})
+    assert merged.json()["status"] == "merged"
+    assert client.post("/api/dedup/merge", json={"business_id": flags[0]["business_id"],
+                                                 "into": flags[0]["duplicate_of"]}).status_code == 409
+
+    skipped = upload(client, "name,location\nThe Plumbing Pros,Adelaide\n", "?fuzzy=skip")
+    assert (skipped["imported"], skipped["duplicates_fuzzy"]) == (0, 1)
+
+
+def test_intake_fuzzy_modes(client):
+    first = client.post("/api/intake", json={"name": "Gym Pro Fitness", "location": "Adelaide, SA"}).json()
+    held = client.post("/api/intake?fuzzy=flag", json={"name": "Pro Fitness Gym", "location": "Adelaide"}).json()
+    assert held["status"] == "possible_duplicate" and held["job_id"] is None
+    assert held["duplicate_of"] == first["business_id"]
+    skipped = client.post("/api/intake?fuzzy=skip", json={"name": "Gym Pro Fitness Pty Ltd", "location": "Adelaide"})
+    assert skipped.json() == {"business_id": first["business_id"], "job_id": first["job_id"], "status": "duplicate"}
+
+    scan = client.post("/api/dedup/scan", json={"action": "report"}).json()
+    assert scan["clusters"] == 1
+
+
+def test_resubmitted_near_duplicate_stays_held_back(client):
+    first = client.post("/api/intake", json={"name": "Gym Pro Fitness", "location": "Adelaide, SA"}).json()
+    lead = {"name": "Pro Fitness Gym", "location": "Adelaide"}
+    held = client.post("/api/intake?fuzzy=flag", json=lead).json()
+    again = client.post("/api/intake?fuzzy=flag", json=lead).json()
+    assert again == {"business_id": held["business_id"], "job_id": None, "status": "possible_duplicate",
+                     "duplicate_of": first["business_id"]}
+    assert db.get_conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 1
+
+
+def test_cli_scan_and_check(db_path, tmp_path):
+    init_db()
+    add_business("Bright Dental")
+    add_business("Bright Dental Care")
+    leads = tmp_path / "leads.csv"
+    leads.write_text("Business Name,Location\nBright Dental,\"Adelaide, SA\"\nSunset Bakery,Adelaide\n"
+                     "Sunset Bakery Pty Ltd,Adelaide\n")
+    script = Path(__file__).with_name("dedup.py")
+    scan = subprocess.run([sys.executable, str(script), "--db", str(db_path), "scan"],
+                          capture_output=True, text=True, check=True)
+    assert '"clusters": 1' in scan.stdout
+    check = subprocess.run([sys.executable, str(script), "--db", str(db_path), "check", str(leads)],
+                           capture_output=True, text=True, check=True)
+    lines = check.stdout.strip().splitlines()
+    assert len(lines) == 2
+    assert '"business_id": 1' in lines[0] and '"line": 3' in lines[1]
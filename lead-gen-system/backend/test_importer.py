@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import pytest
+
+import db
+import importer
+from app import init_db
+
+LEADS_CSV = Path(__file__).parent.parent / "data" / "leads.csv"
+
+
+def test_upload_real_leads_export(client):
+    with open(LEADS_CSV, "rb") as f:
+        resp = client.post("/api/upload-csv", files={"file": ("leads.csv", f, "text/csv")})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["imported"] == 5
+    assert body["rejected"] == 0
+
+    conn = db.get_conn()
+    rows = conn.execute("SELECT name, location, website_url FROM businesses ORDER BY id").fetchall()
+    assert rows[0] == ("Plumbing Pros Adelaide", "Adelaide, SA", None)
+    jobs = conn.execute("SELECT business_id, stage, status FROM jobs ORDER BY id").fetchall()
+    assert jobs == [(i, "Analysis", "processing") for i in range(1, 6)]
+
+
+def test_streaming_chunks_batches_and_rejects(db_path):
+    init_db()
+    text = (
+        "﻿name,location,website_url\r\n"
+        + "".join(f'"Biz {i}","Adelaide, SA",https://biz{i}.com.au\r\n' for i in range(7))
+        + '"Multi\nLine Co","Perth, WA",\r\n'
+        + ',"Hobart, TAS",\r\n'
+        + '"Bad Url","Darwin, NT",ftp://nope\r\n'
+    )
+    imp = importer.LeadImporter("Analysis", batch_size=3)
+    # Feed in tiny pieces so records straddle chunk boundaries
+    for i in range(0, len(text), 5):
+        imp.feed(text[i:i + 5])
+    report = imp.finish().to_dict()
+
+    assert report["imported"] == 8
+    assert [b["rows"] for b in report["batches"]] == [3, 3, 2]
+    assert [(r["row"], r["reason"]) for r in report["rejected_rows"]] == [
+        (9, "missing name"),
+        (10, "website_url must start with http:// or https://"),
+    ]
+    names = [r[0] for r in db.get_conn().execute("SELECT name FROM businesses ORDER BY id")]
+    assert names[0] == "Biz 0" and names[-1] == "Multi\nLine Co"
+    assert db.get_conn().execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 8
+
+
+def test_missing_required_columns(client):
+    resp = client.post("/api/upload-csv", files={"file": ("x.csv", b"foo,bar\n1,2\n", "text/csv")})
+    assert resp.status_code == 400
+    assert "location" in resp.json()["detail"]
+
+
+def test_empty_file_rejected(db_path):
+    init_db()
+    with pytest.raises(ValueError):
+        importer.LeadImporter("Analysis").finish()
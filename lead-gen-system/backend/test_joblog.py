@@ -0,0 +1,108 @@
+import time
+from datetime import datetime, timezone
+
+import db
+import joblog
+from app import init_db
+from joblog import LogSink
+from runner import JobRunner
+
+
+def add_job(stage="Analysis"):
+    conn = db.get_conn()
+    bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+    return conn.execute("INSERT INTO jobs (business_id, stage, status) VALUES (?, ?, 'queued')",
+                        (bid, stage)).lastrowid
+
+
+def log_count():
+    return db.get_conn().execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+
+def test_sink_buffers_until_batch_size_or_stop(db_path):
+    init_db()
+    sink = LogSink(batch_size=3, flush_interval=60)
+    sink.start()
+    try:
+        sink.emit(1, "info", "a", stage="Analysis", duration=0.25, payload={"k": 1})
+        sink.emit(1, "info", "b")
+        assert log_count() == 0 and sink.pending() == 2
+        sink.emit(2, "error", "c")  # reaching batch_size wakes the writer
+        for _ in range(200):
+            if log_count() == 3:
+                break
+            time.sleep(0.01)
+        assert log_count() == 3
+        sink.emit(2, "info", "d")
+    finally:
+        sink.stop()
+    assert log_count() == 4
+    row = db.get_conn().execute("SELECT stage, duration_ms, payload FROM logs WHERE message = 'a'").fetchone()
+    assert row == ("Analysis", 250.0, '{"k": 1}')
+
+
+def test_full_buffer_drops_oldest(db_path):
+    init_db()
+    sink = LogSink(batch_size=100, buffer_max=2)
+    dropped = joblog.LOG_EVENTS.value(outcome="dropped")
+    for message in "abc":
+        sink.emit(1, "info", message)
+    assert sink.flush() == 2
+    assert joblog.LOG_EVENTS.value(outcome="dropped") == dropped + 1
+    assert [r[0] for r in db.get_conn().execute("SELECT message FROM logs ORDER BY id")] == ["b", "c"]
+
+
+def test_compaction_rolls_old_days_into_daily_aggregates(db_path):
+    init_db()
+    conn = db.get_conn()
+    conn.executemany(
+        "INSERT INTO logs (job_id, timestamp, level, stage, message, duration_ms) VALUES (?,?,?,?,?,?)",
+        [
+            (1, "2026-03-01 09:00:00", "info", "Analysis", "ok", 100.0),
+            (2, "2026-03-01 18:30:00", "info", "Analysis", "ok", 300.0),
+            (2, "2026-03-01 18:31:00", "error", "Analysis", "failed", None),
+            (3, "2026-03-02 08:00:00", "info", "Analysis", "ok", 50.0),
+            (3, "2026-03-10 08:00:00", "info", "Demo", "ok", 10.0),
+        ]
+    )
+    before = joblog.daily_stats(end="2026-03-02")
+    now = datetime(2026, 3, 9, 12, tzinfo=timezone.utc)
+    assert joblog.compact(retention_days=7, now=now) == 3  # 2026-03-02 is still inside the window
+    assert joblog.compact(retention_days=7, now=now) == 0
+    assert joblog.daily_stats(end="2026-03-02") == before
+    assert joblog.daily_stats(start="2026-03-01", end="2026-03-01", level="info") == [{
+        "day": "2026-03-01", "stage": "Analysis", "level": "info", "events": 2, "jobs": 2,
+        "avg_duration_ms": 200.0, "max_duration_ms": 300.0,
+    }]
+    assert [d["day"] for d in joblog.daily_stats(stage="Analysis")] == ["2026-03-01", "2026-03-01", "2026-03-02"]
+    assert log_count() == 2
+
+
+def test_runner_logs_stage_outcomes_with_duration(db_path):
+    init_db()
+    ok, bad = add_job(), add_job()
+
+    def analyse(job):
+        if job["id"] == bad:
+            raise RuntimeError("no site")
+        return {"scores": {}}
+    runner = JobRunner({"Analysis": analyse}, workers=2, max_attempts=1, poll_interval=0.01)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=5)
+    finally:
+        runner.stop()
+    joblog.sink.flush()
+    rows = {r[0]: r[1:] for r in db.get_conn().execute(
+        "SELECT job_id, level, stage, message, duration_ms IS NOT NULL FROM logs")}
+    assert rows[ok] == ("info", "Analysis", "Analysis completed", 1)
+    assert rows[bad] == ("error", "Analysis", "Analysis failed", 1)
+
+
+def test_daily_endpoint_sees_buffered_events(client):
+    import app
+    app.log_job_event(None, "info", "hello", stage="Intake", duration=0.5)
+    body = client.get("/api/logs/daily", params={"stage": "Intake"}).json()
+    assert [(d["events"], d["avg_duration_ms"]) for d in body] == [(1, 500.0)]
+    item = client.get("/api/logs", params={"level": "info"}).json()["items"][-1]
+    assert (item["stage"], item["duration_ms"], item["payload"]) == ("Intake", 500.0, None)
@@ -0,0 +1,70 @@
+import json
+
+import app
+
+
+def upload(client, n):
+    rows = "".join(f'"Biz {i}","Adelaide, SA",\n' for i in range(n))
+    client.post("/api/upload-csv", files={"file": ("l.csv", ("name,location,website_url\n" + rows).encode(), "text/csv")})
+
+
+def test_jobs_keyset_pages(client):
+    upload(client, 25)
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/api/jobs", params=params).json()
+        seen += [item["job_id"] for item in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == list(range(1, 26))
+    assert "data" not in body["items"][0]
+
+    body = client.get("/api/jobs", params={"limit": 3, "order": "desc"}).json()
+    assert [i["job_id"] for i in body["items"]] == [25, 24, 23]
+    body = client.get("/api/jobs", params={"limit": 3, "order": "desc", "cursor": 23}).json()
+    assert [i["job_id"] for i in body["items"]] == [22, 21, 20]
+
+
+def test_jobs_filters(client):
+    upload(client, 6)
+    client.post("/api/analyze/batch", json={"business_ids": [2, 4]})
+    assert app.runner.wait_idle(timeout=5)
+
+    # Competitors is 2 and 4's primary stage now, and still a branch of the rest
+    body = client.get("/api/jobs", params={"stage": "Competitors"}).json()
+    assert [i["business_id"] for i in body["items"]] == [1, 2, 3, 4, 5, 6]
+    body = client.get("/api/jobs", params={"stage": "Competitors", "cursor": 3, "limit": 2}).json()
+    assert [i["job_id"] for i in body["items"]] == [4, 5] and body["next_cursor"] == 5
+    body = client.get("/api/jobs", params={"stage": "Analysis", "status": "completed", "order": "desc"}).json()
+    assert [i["business_id"] for i in body["items"]] == [4, 2]
+    body = client.get("/api/jobs", params={"stage": "Analysis", "status": "processing", "limit": 2}).json()
+    assert [i["business_id"] for i in body["items"]] == [1, 3]
+    assert client.get("/api/jobs", params={"business_id": 5}).json()["items"][0]["job_id"] == 5
+    assert client.get("/api/jobs", params={"limit": 5000}).status_code == 422
+
+
+def test_ndjson_export_streams_every_page(client, monkeypatch):
+    monkeypatch.setattr(app, "EXPORT_PAGE_SIZE", 4)
+    upload(client, 10)
+    resp = client.get("/api/jobs", params={"format": "ndjson", "cursor": 2})
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["job_id"] for line in lines] == list(range(3, 11))
+
+
+def test_logs_listing(client):
+    upload(client, 2)
+    for i in range(5):
+        app.log_job_event(1 + i % 2, "error" if i == 3 else "info", f"event {i}")
+
+    body = client.get("/api/logs", params={"limit": 2}).json()
+    assert [i["message"] for i in body["items"]] == ["event 0", "event 1"]
+    assert body["next_cursor"] == 2
+    body = client.get("/api/logs", params={"business_id": 2}).json()
+    assert [i["message"] for i in body["items"]] == ["event 1", "event 3"]
+    body = client.get("/api/logs", params={"level": "error"}).json()
+    assert [i["message"] for i in body["items"]] == ["event 3"]
+    resp = client.get("/api/logs", params={"format": "ndjson", "job_id": 1})
+    assert len(resp.text.splitlines()) == 3
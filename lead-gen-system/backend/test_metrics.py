@@ -0,0 +1,88 @@
+import asyncio
+import re
+
+import httpx
+
+import db
+import metrics
+from app import init_db
+from metrics import Counter, Histogram
+from notify import Notifier
+from runner import JobRunner
+
+
+def sample(text, name, **labels):
+    """Value of one series in Prometheus text output, or None."""
+    for line in text.splitlines():
+        match = re.fullmatch(rf"{name}(?:\{{(.*)\}})? (\S+)", line)
+        if match and all(f'{k}="{v}"' in (match.group(1) or "") for k, v in labels.items()):
+            return float(match.group(2))
+    return None
+
+
+def test_histogram_and_counter_render_prometheus_text():
+    h = Histogram("t_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        h.observe(value, route='/a"b')
+    c = Counter("t_total", "test")
+    c.inc(2)
+    text = "\n".join(h.render() + c.render())
+    assert "# TYPE t_seconds histogram" in text
+    assert 't_seconds_bucket{route="/a\\"b",le="0.1"} 1' in text
+    assert 't_seconds_bucket{route="/a\\"b",le="1"} 3' in text
+    assert 't_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in text
+    assert sample(text, "t_seconds_sum") == 4.05
+    assert sample(text, "t_total") == 2
+
+
+def test_requests_are_timed_by_route_with_db_time(client):
+    import app
+    app.runner.stop()
+    job_id = client.post("/api/intake", json={"name": "A", "location": "Adelaide"}).json()["job_id"]
+    for _ in range(3):
+        assert client.get(f"/api/status/{job_id}").status_code == 200
+    client.get("/no/such/path")
+    client.post("/api/upload-csv", files={"file": ("l.csv", b"name,location\nB,Perth\nC,\n", "text/csv")})
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    status_route = dict(method="GET", route="/api/status/{job_id}", status="200")
+    assert sample(text, "leadgen_http_request_duration_seconds_count", **status_route) >= 3
+    assert sample(text, "leadgen_http_request_duration_seconds_count", route="unmatched", status="404") >= 1
+    assert sample(text, "leadgen_http_request_db_seconds_sum", route="/api/intake") > 0
+    assert sample(text, "leadgen_jobs", stage="Analysis", status="processing") == 2
+    assert sample(text, "leadgen_import_rows_total", outcome="rejected") >= 1
+    assert sample(text, "leadgen_import_rows_per_second") > 0
+    assert 'route="/metrics"' not in text
+
+
+def test_stage_and_telegram_latency(db_path):
+    init_db()
+    before = metrics.STAGE_LATENCY.count(stage="Analysis", outcome="error")
+    conn = db.get_conn()
+    bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+    conn.execute("INSERT INTO jobs (business_id, stage, status) VALUES (?, 'Analysis', 'queued')", (bid,))
+
+    def boom(job):
+        raise RuntimeError("x")
+    runner = JobRunner({"Analysis": boom}, workers=1, max_attempts=1, poll_interval=0.01)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=5)
+    finally:
+        runner.stop()
+    assert metrics.STAGE_LATENCY.count(stage="Analysis", outcome="error") == before + 1
+
+    sent = metrics.TELEGRAM_LATENCY.count(outcome="ok")
+
+    async def scenario():
+        notifier = Notifier("TOKEN", "42", per_chat_rate=1000, global_rate=1000, flush_interval=60,
+                            transport=httpx.MockTransport(lambda r: httpx.Response(200, json={"ok": True})))
+        await notifier.start()
+        notifier.notify("hello")
+        await notifier.flush()
+        await notifier.stop()
+
+    asyncio.run(scenario())
+    assert metrics.TELEGRAM_LATENCY.count(outcome="ok") == sent + 1
@@ -0,0 +1,126 @@
+import sqlite3
+
+import pytest
+
+import competition
+import db
+import dedup
+import discovery
+import joblog
+import jobs
+import migrations
+import priority
+import results
+from app import find_logs, get_business_id, init_db
+
+LEGACY_DB_INIT_SCHEMA = '''
+    CREATE TABLE businesses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, location TEXT,
+        website_url TEXT, status TEXT DEFAULT 'pending', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    CREATE TABLE jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, business_id INTEGER, stage TEXT NOT NULL,
+        status TEXT DEFAULT 'idle', data_json TEXT, last_error TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    INSERT INTO businesses (name, location) VALUES ('Plumbing Pros Adelaide', 'Adelaide, SA');
+    INSERT INTO jobs (business_id, stage, status) VALUES (1, 'Analysis', 'processing');
+'''
+
+
+def test_fresh_database_reaches_latest_version(db_path):
+    init_db()
+    conn = db.get_conn()
+    assert migrations.get_version(conn) == migrations.latest_version()
+    # Re-running is a no-op
+    assert migrations.migrate(conn) == migrations.latest_version()
+
+
+def test_upgrades_legacy_db_init_schema(db_path):
+    with sqlite3.connect(db_path) as legacy:
+        legacy.executescript(LEGACY_DB_INIT_SCHEMA)
+    init_db()
+    conn = db.get_conn()
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert {"businesses", "jobs", "stages", "logs"} <= tables
+    assert conn.execute("SELECT stage, status, attempts FROM jobs").fetchall() == [("Analysis", "processing", 0)]
+    assert get_business_id("Plumbing Pros Adelaide", "Adelaide, SA") == 1
+
+
+def test_failed_migration_rolls_back(db_path, monkeypatch):
+    init_db()
+    conn = db.get_conn()
+    version = migrations.get_version(conn)
+
+    def broken(cur):
+        cur.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS + [(version + 1, "broken", broken)])
+    with pytest.raises(RuntimeError):
+        migrations.migrate(conn)
+    assert migrations.get_version(conn) == version
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name='half_done'").fetchone() is None
+
+
+def test_hot_queries_do_not_scan(db_path):
+    """Query-plan regression: every hot lookup must be an index search."""
+    init_db()
+    conn = db.get_conn()
+    bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+    jobs.create_job(bid, "Analysis")
+
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        get_business_id("A", "B")
+        jobs.get_job_by_business(bid)
+        jobs.enqueue_stage(bid, "Analysis")
+        jobs.count_active()
+        jobs.stage_statuses(1)
+        jobs.claim_jobs(10, ["Analysis", "Competitors"])
+        jobs.requeue_running()
+        jobs.enqueue_batch("Analysis", [bid])
+        jobs.get_jobs([1, 2])
+        jobs.find_jobs(10, stage="Analysis", status="processing")
+        jobs.enqueue_matching("Analysis", 10, status="processing")
+        # Keyset listings, first and later pages, both directions
+        jobs.find_jobs(100, cursor=0, include_data=False)
+        jobs.find_jobs(100, cursor=5, stage="Analysis")
+        jobs.find_jobs(100, cursor=5, descending=True, status="completed")
+        find_logs(100, cursor=5, level="error")
+        find_logs(100, job_id=1)
+        dedup.FuzzyIndex().load_blocks(conn, ["b"])
+        dedup.find_flags(100, cursor=5)
+        jobs.close_business_jobs(bid, "merged")
+        joblog.daily_stats(start="2026-01-01", end="2026-01-31")
+        results.load_inputs([(1, "Rebuild"), (2, "Pitch")])
+        results.get_result_json(1, "Analysis")
+        finder = discovery.UrlDiscovery(batch_size=10, client=object())
+        finder.pending()
+        finder.stats()
+        discovery.cached(["a|b", "a|*"])
+        competition.stored([("plumber", "adelaide"), ("cafe", "perth")])
+        competition.pending_markets()
+    finally:
+        conn.set_trace_callback(None)
+
+    hot = [s for s in statements if s.lstrip().upper().startswith(("SELECT", "UPDATE"))]
+    assert len(hot) >= 6
+    for sql in hot:
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        # json_each() id lists are virtual tables, not stored rows
+        scans = [p for p in plan if p.startswith("SCAN ") and "VIRTUAL TABLE" not in p]
+        assert not scans, f"full scan in {sql!r}: {plan}"
+
+
+@pytest.mark.parametrize("name, location, url", [
+    ("Café Roma & Sons", "Adelaide, South Australia 5000", "https://www.caferoma.example:8080/menu"),
+    ("Smith's Plumbing Pty Ltd", "North Adelaide SA Australia", None),
+    ("  GYM pro  ", "Perth, WA 6000", "gympro.example"),
+])
+def test_frozen_migration_values_match_the_app(name, location, url):
+    """A failure here means dedup.py or priority.py changed: add a migration with the new values."""
+    assert migrations._business_key_v1(name, location, url) == dedup.business_key(name, location, url)
+    assert migrations._location_block_v1(location) == dedup.location_block(location)
+    assert (migrations._DEFAULT_PRIORITY_V1, migrations._PRIORITY_SPREAD_V1, migrations._BANDS_V1) == (
+        priority.DEFAULT_PRIORITY, priority.PRIORITY_SPREAD, priority.BANDS)
+    assert migrations._band_sql_v1("p") == priority.band_sql("p")
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import threading
+
+import httpx
+
+import db
+from app import init_db
+from notify import Notifier
+
+
+class FakeTelegram:
+    """Stands in for api.telegram.org; `responses` are served before falling back to 200."""
+
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.sent = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        assert request.url.path == "/botTOKEN/sendMessage"
+        if self.responses:
+            return self.responses.pop(0)
+        self.sent.append(json.loads(request.content)["text"])
+        return httpx.Response(200, json={"ok": True, "result": {}})
+
+
+def make_notifier(fake):
+    return Notifier("TOKEN", "42", per_chat_rate=1000, global_rate=1000, flush_interval=60,
+                    transport=httpx.MockTransport(fake.handler))
+
+
+def outbox():
+    return db.get_conn().execute("SELECT status, attempts, last_error FROM notification_outbox").fetchall()
+
+
+def test_bursts_are_coalesced(db_path):
+    init_db()
+    fake = FakeTelegram()
+
+    async def scenario():
+        notifier = make_notifier(fake)
+        await notifier.start()
+        for i in range(42):
+            notifier.notify(f"🔎 Analysis complete for business {i}", key="Analysis", summary="🔎 {count} analyses completed")
+        notifier.notify("🚀 Demo deployed for business 7", key="Demo", summary="🚀 {count} demos deployed")
+        await notifier.flush()
+        await notifier.stop()
+
+    asyncio.run(scenario())
+    assert fake.sent == ["🔎 42 analyses completed", "🚀 Demo deployed for business 7"]
+    assert outbox() == []
+
+
+def test_rate_limited_message_is_retried(db_path):
+    init_db()
+    fake = FakeTelegram([httpx.Response(429, json={"ok": False, "description": "Too Many Requests",
+                                                   "parameters": {"retry_after": 3}})])
+
+    async def scenario():
+        notifier = make_notifier(fake)
+        await notifier.start()
+        notifier.notify("hello")
+        await notifier.flush()
+        assert outbox() == [("pending", 1, "HTTP 429: Too Many Requests")]
+        # Not due yet, so nothing is re-sent
+        await notifier.flush()
+        assert fake.sent == []
+        db.get_conn().execute("UPDATE notification_outbox SET next_attempt_at=0")
+        notifier._chat_limiter._next.clear()
+        await notifier.flush()
+        await notifier.stop()
+
+    asyncio.run(scenario())
+    assert fake.sent == ["hello"]
+    assert outbox() == []
+
+
+def test_permanent_errors_are_marked_failed(db_path):
+    init_db()
+    fake = FakeTelegram([httpx.Response(400, json={"ok": False, "description": "Bad Request: chat not found"})])
+
+    async def scenario():
+        notifier = make_notifier(fake)
+        await notifier.start()
+        notifier.notify("hello")
+        await notifier.flush()
+        await notifier.stop()
+
+    asyncio.run(scenario())
+    assert outbox() == [("failed", 1, "HTTP 400: Bad Request: chat not found")]
+
+
+def test_unsent_messages_survive_restart(db_path):
+    init_db()
+    fake = FakeTelegram()
+
+    async def first_process():
+        notifier = make_notifier(fake)
+        await notifier.start()
+        notifier.notify("queued before shutdown")
+        await notifier.stop()
+
+    async def second_process():
+        notifier = make_notifier(fake)
+        await notifier.start()
+        await notifier.flush()
+        await notifier.stop()
+
+    asyncio.run(first_process())
+    assert fake.sent == [] and len(outbox()) == 1
+    asyncio.run(second_process())
+    assert fake.sent == ["queued before shutdown"]
+
+
+def test_disabled_without_credentials(db_path):
+    init_db()
+    notifier = Notifier("", "")
+    notifier.notify("dropped")
+    assert notifier.pending() == 0
+
+
+def test_outbox_io_stays_off_the_event_loop(db_path, monkeypatch):
+    init_db()
+    fake = FakeTelegram([httpx.Response(500, json={"ok": False, "description": "down"})])
+    threads = set()
+    get_conn = db.get_conn
+
+    def tracked():
+        threads.add(threading.get_ident())
+        return get_conn()
+
+    async def scenario():
+        notifier = make_notifier(fake)
+        await notifier.start()
+        monkeypatch.setattr(db, "get_conn", tracked)
+        notifier.notify("first")
+        notifier.notify("second")
+        await notifier.flush()
+        await notifier.stop()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert threads and loop_thread not in threads
+    assert fake.sent == ["second"] and [row[1] for row in outbox()] == [1]
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+import db
+import jobs
+import pipeline
+from app import init_db
+from runner import JobRunner
+
+
+def add_job(status="processing"):
+    init_db()
+    bid = db.get_conn().execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+    job_id = jobs.create_job(bid, "Intake")
+    jobs.start_pipeline([job_id], status=status)
+    return bid, job_id
+
+
+def branch_row(job_id, stage):
+    return db.get_conn().execute(
+        "SELECT status, attempts, last_error FROM job_branches WHERE job_id=? AND stage=?", (job_id, stage)
+    ).fetchone()
+
+
+def test_graph_order():
+    assert pipeline.STAGES == ["Intake", "Analysis", "Competitors", "Rebuild", "Demo", "Pitch"]
+    assert pipeline.FIRST_STAGES == ["Analysis", "Competitors"]
+    assert pipeline.ancestors("Pitch") == {"Intake", "Analysis", "Competitors", "Rebuild", "Demo"}
+    assert pipeline.ready({"Intake", "Analysis"}, {"Competitors"}) == []
+    with pytest.raises(ValueError):
+        pipeline._topological({"A": ("B",), "B": ("A",)})
+
+
+def test_independent_stages_run_side_by_side(db_path):
+    _, job_id = add_job(status="queued")
+    both = threading.Barrier(2, timeout=5)
+    order = []
+
+    def first(name):
+        def run(job):
+            both.wait()  # only returns once Analysis and Competitors are running at the same time
+            order.append(name)
+            return {"top3": []} if name == "Competitors" else {}
+        return run
+
+    def later(name):
+        def run(job):
+            order.append(name)
+            return {}
+        return run
+
+    functions = {"Analysis": first("Analysis"), "Competitors": first("Competitors"),
+                 "Rebuild": later("Rebuild"), "Demo": later("Demo"), "Pitch": later("Pitch")}
+    runner = JobRunner(functions, workers=2, auto_advance=True, poll_interval=0.01)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=10)
+    finally:
+        runner.stop()
+    assert set(order[:2]) == {"Analysis", "Competitors"} and order[2:] == ["Rebuild", "Demo", "Pitch"]
+    assert jobs.stage_statuses(job_id) == dict.fromkeys(pipeline.STAGES, "completed")
+
+
+def test_primary_waits_at_the_join(db_path):
+    bid, job_id = add_job()
+    assert jobs.stage_statuses(job_id) == {"Intake": "completed", "Analysis": "processing",
+                                           "Competitors": "processing"}
+    assert jobs.enqueue_stage(bid, "Competitors")["status"] == "queued"
+    assert jobs.complete_stage(job_id, "Analysis") == ("Rebuild", "waiting")
+    assert jobs.enqueue_stage(bid, "Rebuild")["status"] == "waiting"
+    assert jobs.complete_stage(job_id, "Competitors", branch=True) == ("Rebuild", "processing")
+    assert jobs.stage_statuses(job_id)["Competitors"] == "completed"
+
+
+def test_idle_branch_is_taken_over(db_path):
+    _, job_id = add_job()
+    # Nobody asked for Competitors yet, so the job's row moves onto it
+    assert jobs.complete_stage(job_id, "Analysis") == ("Competitors", "processing")
+    assert branch_row(job_id, "Analysis")[0] == "completed" and branch_row(job_id, "Competitors") is None
+    assert jobs.complete_stage(job_id, "Competitors") == ("Rebuild", "processing")
+
+
+def test_branch_failures_are_kept_apart(db_path):
+    bid, job_id = add_job()
+    jobs.enqueue_stage(bid, "Competitors")
+
+    def broken(job):
+        raise RuntimeError("search down")
+    runner = JobRunner({"Competitors": broken}, workers=1, max_attempts=2, poll_interval=0.01)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=5)
+    finally:
+        runner.stop()
+    assert branch_row(job_id, "Competitors") == ("failed", 2, "RuntimeError: search down")
+    job = jobs.get_jobs([job_id])[job_id]
+    assert (job["stage"], job["status"], job["attempts"]) == ("Analysis", "processing", 0)
+    # A retry requested through the stage endpoint starts the branch over
+    assert jobs.enqueue_stage(bid, "Competitors")["status"] == "queued"
+    assert branch_row(job_id, "Competitors") == ("queued", 0, None)
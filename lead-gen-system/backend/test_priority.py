@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+import db
+import jobs
+from app import init_db
+from dedup import location_block
+from priority import band, priority_from_result, score_audit
+from runner import JobRunner
+
+PERFECT = {"design": 100, "seo": 100, "conversion": 100, "trust": 100, "mobile": 100}
+
+
+def test_weak_conversion_and_seo_score_highest():
+    assert score_audit({k: 0 for k in PERFECT}) == 100
+    assert score_audit(PERFECT) == 0
+    weak_funnel = score_audit({**PERFECT, "conversion": 10, "seo": 20})
+    weak_looks = score_audit({**PERFECT, "design": 10, "trust": 20})
+    assert weak_funnel > weak_looks
+    assert band(weak_funnel) == "medium" and band(weak_looks) == "low" and band(90) == "high"
+    assert priority_from_result("Analysis", {"scores": {**PERFECT, "seo": "bad"}}) is None
+    assert priority_from_result("Demo", {"scores": PERFECT}) is None
+
+
+def add_jobs(location, count, priority=50):
+    with db.transaction() as conn:
+        ids = []
+        for i in range(count):
+            bid = conn.execute(
+                "INSERT INTO businesses (name, location, location_block) VALUES (?,?,?)",
+                (f"{location} {i}", location, location_block(location))
+            ).lastrowid
+            ids.append(conn.execute(
+                "INSERT INTO jobs (business_id, stage, status, priority) VALUES (?, 'Rebuild', 'processing', ?)",
+                (bid, priority)
+            ).lastrowid)
+    return ids
+
+
+def claim_order(n):
+    return [job["id"] for job in jobs.claim_jobs(n, ["Rebuild"])]
+
+
+def test_locations_take_turns(db_path):
+    init_db()
+    adelaide, perth = add_jobs("Adelaide, SA", 30), add_jobs("Perth, WA", 3)
+    jobs.enqueue_batch("Rebuild", [jobs.get_jobs([i])[i]["business_id"] for i in adelaide + perth])
+    first = claim_order(6)
+    assert sorted(set(first) & set(perth)) == perth
+    assert claim_order(100) == adelaide[3:]
+
+
+def test_branches_take_turns_with_each_other_and_with_jobs(db_path):
+    init_db()
+    adelaide, perth = add_jobs("Adelaide, SA", 30), add_jobs("Perth, WA", 3)
+    jobs.open_branches(adelaide + perth, ["Competitors"])
+    jobs.enqueue_matching("Competitors", 100, status="processing")
+    first = [job["id"] for job in jobs.claim_jobs(6, ["Competitors"])]
+    assert sorted(set(first) & set(perth)) == perth
+
+    # Queued after the branches, Rebuild jobs interleave with what is left of them
+    jobs.enqueue_matching("Rebuild", 100, status="processing")
+    claimed = jobs.claim_jobs(8, ["Rebuild", "Competitors"])
+    assert {job["stage"] for job in claimed} == {"Rebuild", "Competitors"}
+
+
+def test_location_weights_and_priority_shift_the_share(db_path):
+    init_db()
+    jobs.set_location_weight(location_block("Perth"), 3.0)
+    adelaide, perth = add_jobs("Adelaide", 20), add_jobs("Perth", 20)
+    urgent = add_jobs("Adelaide", 1, priority=100)
+    jobs.enqueue_matching("Rebuild", 100, status="processing")
+    first = claim_order(13)
+    assert urgent[0] in first[:3]
+    assert len(set(first) & set(perth)) == 9  # three Perth jobs per Adelaide one
+
+
+def test_audit_result_sets_priority_of_later_stages(db_path):
+    init_db()
+    (job_id,) = add_jobs("Adelaide", 1)
+    jobs.update_job_stage(job_id, "Analysis", status="queued")
+    weak = {"scores": {**PERFECT, "conversion": 0, "seo": 0}}
+    runner = JobRunner({"Analysis": lambda job: weak}, workers=1, auto_advance=True, poll_interval=0.01)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=5)
+    finally:
+        runner.stop()
+    job = jobs.get_jobs([job_id])[job_id]
+    assert (job["stage"], job["priority"]) == ("Competitors", 65)
+    assert json.loads(job["data"]) == weak
+
+
+def test_queue_endpoint_reports_bands(client):
+    import app
+    app.runner.stop()  # keep the jobs queued
+    add_jobs("Adelaide", 2, priority=90)
+    add_jobs("Adelaide", 1, priority=10)
+    jobs.enqueue_matching("Rebuild", 10, status="processing")
+    assert client.post("/api/queue/weights", json={"location": "Perth, WA 6000", "weight": 2}).json() == {
+        "location": "perth", "weight": 2.0,
+    }
+    body = client.get("/api/queue").json()
+    assert body["bands"] == {"high": 2, "medium": 0, "low": 1}
+    assert body["by_stage"] == {"Rebuild": {"high": 2, "low": 1}}
+    assert body["location_weights"] == {"perth": 2.0}
+    assert client.post("/api/queue/weights", json={"location": "x", "weight": 0}).status_code == 422
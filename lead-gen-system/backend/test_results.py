@@ -0,0 +1,90 @@
+import json
+import sqlite3
+
+import db
+import jobs
+import results
+from app import init_db
+from runner import JobRunner
+
+AUDIT = {"scores": {"design": 50, "seo": 50, "conversion": 50, "trust": 50, "mobile": 50},
+         "finding_summary": "x" * 4000}
+
+
+def test_large_results_are_compressed_and_round_trip(db_path):
+    init_db()
+    results.save_result(1, "Analysis", json.dumps(AUDIT))
+    results.save_result(1, "Demo", json.dumps({"demo_url": "http://d"}))
+    stored = {r["stage"]: r for r in results.list_results(1)}
+    assert stored["Analysis"]["encoding"] == "zlib"
+    assert stored["Analysis"]["stored_bytes"] < stored["Analysis"]["size"] / 10
+    assert stored["Demo"]["encoding"] == "json"
+    assert results.get_result(1, "Analysis") == AUDIT
+    results.save_result(1, "Demo", json.dumps({"demo_url": "http://e"}))  # a rerun replaces the row
+    assert results.get_result_json(1, "Demo") == b'{"demo_url": "http://e"}'
+    assert results.get_result(1, "Pitch") is None
+
+
+def test_downstream_stages_receive_earlier_outputs(db_path):
+    init_db()
+    conn = db.get_conn()
+    bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+    job_id = conn.execute("INSERT INTO jobs (business_id, stage, status) VALUES (?, 'Analysis', 'queued')",
+                          (bid,)).lastrowid
+    seen = {}
+
+    def stage(name, output):
+        def run(job):
+            seen[name] = job["inputs"]
+            return output
+        return run
+    functions = {
+        "Analysis": stage("Analysis", AUDIT),
+        "Competitors": stage("Competitors", {"top3": []}),
+        "Rebuild": stage("Rebuild", {"structure": ["Home"]}),
+        "Demo": stage("Demo", {"demo_url": "http://d"}),
+        "Pitch": stage("Pitch", {"executive_summary": "s"}),
+    }
+    runner = JobRunner(functions, workers=1, auto_advance=True, poll_interval=0.01)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=5)
+    finally:
+        runner.stop()
+    assert seen["Analysis"] == {} and seen["Competitors"] == {}
+    assert seen["Rebuild"] == {"Analysis": AUDIT, "Competitors": {"top3": []}}
+    assert seen["Pitch"] == {"Rebuild": {"structure": ["Home"]}, "Demo": {"demo_url": "http://d"}}
+    assert {r["stage"] for r in results.list_results(job_id)} == set(functions)
+    assert jobs.get_jobs([job_id])[job_id]["status"] == "completed"
+
+
+def test_migration_keeps_existing_output(db_path):
+    init_db()
+    with sqlite3.connect(db_path) as conn:
+        # Back to a version 10 database with jobs already carrying output
+        conn.execute("DROP TABLE stage_results")
+        conn.execute("PRAGMA user_version=10")
+        bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+        conn.executemany("INSERT INTO jobs (business_id, stage, status, data_json) VALUES (?,?,?,?)", [
+            (bid, "Rebuild", "processing", '{"top3": []}'),
+            (bid, "Pitch", "completed", '{"executive_summary": "s"}'),
+            (bid, "Analysis", "processing", None),
+        ])
+    init_db()
+    assert results.get_result(1, "Competitors") == {"top3": []}
+    assert results.get_result(2, "Pitch") == {"executive_summary": "s"}
+    assert results.list_results(3) == []
+
+
+def test_result_endpoints(client):
+    import app
+    app.runner.stop()
+    job_id = client.post("/api/intake", json={"name": "A", "location": "Adelaide"}).json()["job_id"]
+    results.save_result(job_id, "Analysis", json.dumps(AUDIT))
+    listing = client.get(f"/api/jobs/{job_id}/results").json()["results"]
+    assert [(r["stage"], r["encoding"]) for r in listing] == [("Analysis", "zlib")]
+    resp = client.get(f"/api/jobs/{job_id}/results/Analysis")
+    assert resp.headers["content-type"] == "application/json"
+    assert resp.json() == AUDIT
+    assert client.get(f"/api/jobs/{job_id}/results/Demo").status_code == 404
+    assert client.get("/api/jobs/999/results").status_code == 404
@@ -0,0 +1,114 @@
+import pytest
+
+import db
+import jobs
+import results
+import stages
+from app import init_db
+from runner import JobRunner
+
+
+def wait_for(client, job_id, stage, status="processing"):
+    import app
+    assert app.runner.wait_idle(timeout=5)
+    body = client.get(f"/api/status/{job_id}").json()
+    assert (body["stage"], body["status"]) == (stage, status), body
+    return body
+
+
+def test_endpoints_enqueue_and_runner_advances(client):
+    created = client.post("/api/intake", json={"name": "EcoClean Solutions", "location": "Adelaide, SA"}).json()
+    bid, job_id = created["business_id"], created["job_id"]
+
+    resp = client.post("/api/rebuild", json={"business_id": bid})
+    assert resp.status_code == 400
+
+    for endpoint, stage, next_stage in [
+        ("analyze", "Analysis", "Competitors"),
+        ("competitors", "Competitors", "Rebuild"),
+        ("rebuild", "Rebuild", "Demo"),
+        ("demo", "Demo", "Pitch"),
+    ]:
+        resp = client.post(f"/api/{endpoint}", json={"business_id": bid})
+        assert resp.status_code == 202
+        assert resp.json()["status"] == "queued"
+        wait_for(client, job_id, next_stage)
+
+    client.post("/api/pitch", json={"business_id": bid})
+    body = wait_for(client, job_id, "Pitch", "completed")
+    assert "executive_summary" in body["data"]
+
+
+def _flaky(job):
+    if job["attempts"] < 2:
+        raise RuntimeError("upstream timeout")
+    return {"ok": job["attempts"]}
+
+
+def _broken(job):
+    raise ValueError("bad page")
+
+
+def _setup_job(stage):
+    init_db()
+    conn = db.get_conn()
+    bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+    job_id = jobs.create_job(bid, stage)
+    jobs.enqueue_stage(bid, stage)
+    return job_id
+
+
+@pytest.mark.parametrize("fn, expected_status, expected_attempts", [(_flaky, "processing", 2), (_broken, "failed", 3)])
+def test_retries_and_records_last_error(db_path, fn, expected_status, expected_attempts):
+    job_id = _setup_job("Analysis")
+    runner = JobRunner({"Analysis": fn}, workers=2, max_attempts=3, poll_interval=0.01)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=5)
+    finally:
+        runner.stop()
+    status, attempts, last_error = db.get_conn().execute(
+        "SELECT status, attempts, last_error FROM jobs WHERE id=?", (job_id,)
+    ).fetchone()
+    assert (status, attempts) == (expected_status, expected_attempts)
+    if expected_status == "failed":
+        assert last_error == "ValueError: bad page"
+    else:
+        assert last_error is None
+
+
+def test_process_pool_auto_advance(db_path):
+    job_id = _setup_job("Analysis")
+    runner = JobRunner(stages.STAGE_FUNCTIONS, executor="process", workers=2, auto_advance=True, poll_interval=0.01)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=30)
+    finally:
+        runner.stop()
+    row = db.get_conn().execute("SELECT stage, status FROM jobs WHERE id=?", (job_id,)).fetchone()
+    assert row == ("Pitch", "completed")
+
+
+def test_failed_write_back_counts_as_an_attempt(db_path, monkeypatch):
+    init_db()
+    conn = db.get_conn()
+    bids = [conn.execute("INSERT INTO businesses (name, location) VALUES (?, 'B')", (n,)).lastrowid for n in "AB"]
+    good, bad = [jobs.create_job(bid, "Analysis") for bid in bids]
+    for bid in bids:
+        jobs.enqueue_stage(bid, "Analysis")
+    save = results.save_result
+
+    def flaky_save(job_id, stage, body):
+        if job_id == bad:
+            raise RuntimeError("disk full")
+        save(job_id, stage, body)
+    monkeypatch.setattr(results, "save_result", flaky_save)
+    runner = JobRunner({"Analysis": lambda job: {}}, workers=2, max_attempts=2, validate="off", poll_interval=0.01)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=5)
+    finally:
+        runner.stop()
+    rows = dict((r[0], r[1:]) for r in conn.execute("SELECT id, stage, status, attempts, last_error FROM jobs"))
+    assert rows[good][:2] == ("Competitors", "processing")
+    assert rows[bad] == ("Analysis", "failed", 2, "Write-back failed: RuntimeError: disk full")
@@ -0,0 +1,69 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import db
+import joblog
+import jobs
+import validation
+from app import init_db
+from runner import JobRunner
+from stages import mock_analysis, mock_competitors_analysis, mock_pitch_output, mock_rebuild_output
+
+
+def test_audit_model_matches_json_schema():
+    schema = json.loads((Path(__file__).parent / "schema_audit.json").read_text())
+    model = validation.STAGE_MODELS["Analysis"].model_json_schema()
+    assert set(schema["properties"]) == set(model["properties"])
+    scores = schema["properties"]["scores"]
+    bounds = model["$defs"]["AuditScore"]["properties"]
+    assert set(scores["required"]) == set(bounds)
+    for name, spec in scores["properties"].items():
+        assert (bounds[name]["minimum"], bounds[name]["maximum"]) == (spec["minimum"], spec["maximum"])
+
+
+def test_mock_outputs_are_valid():
+    samples = {"Analysis": mock_analysis({}), "Competitors": mock_competitors_analysis(), "Rebuild": mock_rebuild_output(),
+               "Demo": {"demo_url": "http://localhost:8000/demos/1/"}, "Pitch": mock_pitch_output()}
+    for stage, output in samples.items():
+        assert json.loads(validation.dump_result(stage, output)) == output
+
+
+def test_batch_reports_each_bad_item():
+    checked = validation.validate_batch("Rebuild", [
+        {"structure": ["Home"]},
+        {"structure": "Home"},
+        {"headings": [1], "CTAs": ["x"] * 11},
+    ])
+    assert checked[0] == (b'{"structure":["Home"]}', None)  # unset defaults are not written
+    assert checked[1] == (None, "Rebuild output invalid: structure: Input should be a valid list")
+    assert checked[2][0] is None and "headings.0" in checked[2][1] and "CTAs" in checked[2][1]
+    assert validation.validate_batch("Intake", [{"a": 1}]) == [(b'{"a": 1}', None)]
+    with pytest.raises(ValueError):
+        JobRunner({}, validate="loose")
+
+
+@pytest.mark.parametrize("mode, expected_status", [("strict", "failed"), ("warn", "processing")])
+def test_runner_handles_invalid_output(db_path, mode, expected_status):
+    init_db()
+    conn = db.get_conn()
+    bid = conn.execute("INSERT INTO businesses (name, location) VALUES ('A', 'B')").lastrowid
+    job_id = conn.execute("INSERT INTO jobs (business_id, stage, status) VALUES (?, 'Demo', 'queued')",
+                          (bid,)).lastrowid
+    runner = JobRunner({"Demo": lambda job: {"demo_url": None}}, workers=1, max_attempts=1, poll_interval=0.01,
+                       validate=mode)
+    runner.start()
+    try:
+        assert runner.wait_idle(timeout=5)
+    finally:
+        runner.stop()
+    job = jobs.get_jobs([job_id])[job_id]
+    assert job["status"] == expected_status
+    problem = "Demo output invalid: demo_url: Input should be a valid string"
+    if mode == "strict":
+        assert job["last_error"] == problem
+    else:
+        joblog.sink.flush()
+        assert json.loads(job["data"]) == {"demo_url": None}
+        assert conn.execute("SELECT level FROM logs WHERE message = ?", (problem,)).fetchone() == ("warning",)
@@ -0,0 +1,91 @@
+"""
+Stage output validation.
+
+Each stage's output has a model in models.py (`AuditResult` for Analysis,
+which mirrors schema_audit.json, `RebuildOutput`, `PitchOutput`, ...). A
+`TypeAdapter` is built once per stage and cached, so a write costs one
+pydantic-core validation plus one native JSON dump straight to bytes. No
+model is rebuilt and nothing goes through `json.dumps`. That is two passes
+over the data, validate then dump: pydantic has no single validate-and-dump
+call for Python input, and serializing first to use `validate_json` costs a
+third pass and measured about twice as slow (see bench_validation.py). The
+runner hands
+`validate_batch()` everything one tick finished for a stage, and bad outputs
+come back as error strings instead of exceptions.
+
+Output is dumped with exclude_unset, so what is stored is what the stage
+returned, coerced to the model's types and without defaults it never set.
+
+RESULT_VALIDATION decides what the runner does with an invalid output:
+  strict  fail the stage attempt (retried like any other error)
+  warn    store it as returned and log a warning (default)
+  off     skip validation
+"""
+import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from models import AuditResult, CompetitorsOutput, DemoOutput, PitchOutput, RebuildOutput
+
+RESULT_VALIDATION = os.getenv("RESULT_VALIDATION", "warn").lower()
+VALIDATION_MODES = ("strict", "warn", "off")
+
+STAGE_MODELS: Dict[str, Type[BaseModel]] = {
+    "Analysis": AuditResult,
+    "Competitors": CompetitorsOutput,
+    "Rebuild": RebuildOutput,
+    "Demo": DemoOutput,
+    "Pitch": PitchOutput,
+}
+
+# (JSON bytes, None) for a valid output, (None, error summary) otherwise
+Checked = Tuple[Optional[bytes], Optional[str]]
+
+
+@lru_cache(maxsize=None)
+def adapter(stage: str) -> Optional[TypeAdapter]:
+    model = STAGE_MODELS.get(stage)
+    return TypeAdapter(model) if model else None
+
+
+def warm():
+    """Build every stage's validators up front (startup, process-pool workers)."""
+    for stage in STAGE_MODELS:
+        adapter(stage)
+
+
+def summarize(stage: str, error: ValidationError) -> str:
+    """Short error text, e.g. "Analysis output invalid: scores.seo: Input should be ..."."""
+    problems = [
+        f"{'.'.join(str(p) for p in e['loc']) or '<root>'}: {e['msg']}" for e in error.errors()[:5]
+    ]
+    more = f" (+{error.error_count() - 5} more)" if error.error_count() > 5 else ""
+    return f"{stage} output invalid: " + "; ".join(problems) + more
+
+
+def dump_result(stage: str, result: Any) -> bytes:
+    """Validate one output and return its JSON; raises ValidationError."""
+    single = adapter(stage)
+    if single is None:
+        return json.dumps(result).encode()
+    return single.dump_json(single.validate_python(result), exclude_unset=True)
+
+
+def check_result(stage: str, result: Any) -> Checked:
+    try:
+        return dump_result(stage, result), None
+    except ValidationError as e:
+        return None, summarize(stage, e)
+
+
+def validate_batch(stage: str, results: List[Any]) -> List[Checked]:
+    """Validate many outputs of one stage; one (json, error) pair per result, in order.
+
+    Loops over the cached single-item adapter: a TypeAdapter(List[model])
+    measured slower, and it keeps every model of a bulk run alive at once
+    (see bench_validation.py).
+    """
+    return [check_result(stage, result) for result in results]
@@ -4,21 +4,53 @@
 Examples:
   python searxng_search.py "wordpress ecommerce ux checklist" --limit 8
   python searxng_search.py "core web vitals lcp inp cls" --base-url http://192.168.10.208:8087/
+  python searxng_search.py "plumber Adelaide" "plumber Adelaide reviews" --concurrency 4
+  printf 'plumber Adelaide\\nelectrician Adelaide\\n' | python searxng_search.py - --jsonl
 
 SearXNG JSON endpoint:
   <base>/search?q=...&format=json
 
 Notes:
 - Designed for quick research inside OpenClaw where Brave web_search may be unavailable.
+- Several queries run concurrently over a small pool of keep-alive connections,
+  and result URLs are deduplicated across queries.
+- Responses are cached on disk keyed by (base_url, query, language, time_range,
+  safesearch); pass --no-cache to always hit the instance.
+- Stdin is only read when asked for, with a "-" query or --stdin, so the
+  script never blocks under cron. Input is one query per line, or JSONL
+  objects such as {"query": "...", "language": "en", "time_range": "month"};
+  a malformed line is reported on stderr and the other queries still run.
+- Standard library only, so the script runs anywhere Python does.
+
+Library use:
+  with SearxngClient("http://host:8087/", concurrency=8, cache_dir="~/.cache/searxng") as client:
+      batch = client.search_many(["plumber Adelaide", "plumber Adelaide reviews"])
 """
 
 from __future__ import annotations
 
 import argparse
+import hashlib
+import http.client
 import json
+import os
+import queue
 import sys
+import tempfile
+import threading
+import time
 import urllib.parse
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+DEFAULT_BASE_URL = "http://192.168.10.208:8087/"
+DEFAULT_CACHE_DIR = Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "searxng-search"
+USER_AGENT = "openclaw-searxng/1.0"
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+Query = Union[str, Dict[str, Any]]
 
 
 def build_url(base_url: str, query: str, **params: str) -> str:
@@ -29,53 +61,347 @@ def build_url(base_url: str, query: str, **params: str) -> str:
 
 
 def fetch(url: str, timeout: int = 20) -> dict:
-    req = urllib.request.Request(url, headers={"User-Agent": "openclaw-searxng/1.0"})
+    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
     with urllib.request.urlopen(req, timeout=timeout) as resp:
         data = resp.read().decode("utf-8", errors="replace")
     return json.loads(data)
 
 
+def normalize_result(r: dict) -> dict:
+    return {
+        "title": (r.get("title") or "").strip(),
+        "url": (r.get("url") or "").strip(),
+        "snippet": (r.get("content") or "").strip(),
+        "engine": r.get("engine"),
+    }
+
+
+def url_key(url: str) -> str:
+    """Key used to spot the same result URL across queries.
+
+    Ignores scheme, a leading "www.", fragments, tracking parameters and a
+    trailing slash.
+    """
+    parts = urllib.parse.urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    )
+    path = parts.path.rstrip("/")
+    return f"{host}{path}" + (f"?{urllib.parse.urlencode(query)}" if query else "")
+
+
+# ---------------------------------------------------------------------------
+# Disk cache
+# ---------------------------------------------------------------------------
+class DiskCache:
+    """JSON responses stored one file per key, expired after `ttl` seconds."""
+
+    def __init__(self, directory: Union[str, Path], ttl: float = 3600):
+        self.directory = Path(directory).expanduser()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(base_url: str, query: str, language=None, time_range=None, safesearch=None) -> str:
+        raw = json.dumps([base_url.rstrip("/"), query, language, time_range, safesearch])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime < self.ttl:
+                with path.open(encoding="utf-8") as fh:
+                    value = json.load(fh)
+                with self._lock:
+                    self.hits += 1
+                return value
+        except (OSError, ValueError):
+            pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: dict):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename, so a concurrent reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(value, fh, ensure_ascii=False)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def evict(self) -> int:
+        """Delete expired entries; returns how many were removed."""
+        removed = 0
+        cutoff = time.time() - self.ttl
+        if not self.directory.exists():
+            return 0
+        for path in self.directory.glob("*/*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+class SearxngError(Exception):
+    pass
+
+
+class SearxngClient:
+    """Concurrent SearXNG client over a pool of keep-alive connections."""
+
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        concurrency: int = 4,
+        timeout: float = 20,
+        cache_dir: Optional[Union[str, Path]] = None,
+        cache_ttl: float = 3600,
+    ):
+        parts = urllib.parse.urlsplit(base_url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Invalid SearXNG base URL: {base_url!r}")
+        self.base_url = base_url
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.cache = DiskCache(cache_dir, cache_ttl) if cache_dir else None
+        self._scheme = parts.scheme
+        self._host = parts.hostname
+        self._port = parts.port
+        self._path = parts.path.rstrip("/") + "/search"
+        self._conns: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="searxng")
+        self.requests_sent = 0
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "SearxngClient":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                self._conns.get_nowait().close()
+            except queue.Empty:
+                break
+        if self.cache:
+            self.cache.evict()
+
+    # ---------- HTTP ----------
+    def _connect(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+        with self._lock:
+            self.connections_opened += 1
+        return cls(self._host, self._port, timeout=self.timeout)
+
+    def _get(self, params: Dict[str, str]) -> dict:
+        target = f"{self._path}?{urllib.parse.urlencode(params)}"
+        headers = {"User-Agent": USER_AGENT, "Accept": "application/json", "Connection": "keep-alive"}
+        try:
+            conn = self._conns.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn, reused = self._connect(), False
+        try:
+            try:
+                conn.request("GET", target, headers=headers)
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.CannotSendRequest):
+                if not reused:
+                    raise
+                # The server closed an idle keep-alive connection; retry once on a new one
+                conn.close()
+                conn = self._connect()
+                conn.request("GET", target, headers=headers)
+                resp = conn.getresponse()
+            body = resp.read()
+            with self._lock:
+                self.requests_sent += 1
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._conns.put(conn)
+        if resp.status != 200:
+            raise SearxngError(f"HTTP {resp.status} from {self.base_url} for {params.get('q')!r}")
+        return json.loads(body.decode("utf-8", errors="replace"))
+
+    # ---------- search ----------
+    def search(
+        self,
+        query: str,
+        language: Optional[str] = None,
+        time_range: Optional[str] = None,
+        safesearch: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> dict:
+        """One query; returns {"query", "count", "results"} (or "error")."""
+        key = DiskCache.key(self.base_url, query, language, time_range, safesearch)
+        obj = self.cache.get(key) if self.cache else None
+        cached = obj is not None
+        if obj is None:
+            params = {"q": query, "format": "json"}
+            params.update({k: v for k, v in
+                           (("language", language), ("time_range", time_range), ("safesearch", safesearch))
+                           if v is not None})
+            try:
+                obj = self._get(params)
+            except Exception as e:
+                return {"query": query, "count": 0, "results": [], "error": f"{type(e).__name__}: {e}"}
+            if self.cache:
+                self.cache.set(key, obj)
+        results = [normalize_result(r) for r in (obj.get("results") or [])]
+        if limit is not None:
+            results = results[: max(0, limit)]
+        return {"query": query, "count": len(results), "results": results, "cached": cached}
+
+    def search_many(self, queries: Iterable[Query], limit: Optional[int] = None, **defaults) -> dict:
+        """Run queries concurrently and merge their results.
+
+        Each query is a string or a dict with "query" plus any of language,
+        time_range, safesearch and limit. Returns per-query results in input
+        order and "unique_results": every distinct URL once, first-seen order,
+        with the queries that returned it.
+        """
+        specs = []
+        for q in queries:
+            spec = {"query": q} if isinstance(q, str) else dict(q)
+            if not spec.get("query"):
+                continue
+            specs.append({"limit": limit, **defaults, **spec})
+        # Identical queries are sent once
+        distinct = {json.dumps(spec, sort_keys=True): spec for spec in specs}
+        answers = dict(zip(distinct, self._executor.map(lambda spec: self.search(**spec), distinct.values())))
+        per_query = [answers[json.dumps(spec, sort_keys=True)] for spec in specs]
+
+        unique: Dict[str, dict] = {}
+        for result_set in per_query:
+            for r in result_set["results"]:
+                if not r["url"]:
+                    continue
+                entry = unique.get(url_key(r["url"]))
+                if entry is None:
+                    entry = unique[url_key(r["url"])] = {**r, "queries": []}
+                if result_set["query"] not in entry["queries"]:
+                    entry["queries"].append(result_set["query"])
+        return {"queries": per_query, "count": len(unique), "unique_results": list(unique.values())}
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def read_queries(lines: Iterable[str]) -> Tuple[List[Query], List[str]]:
+    """Parse stdin lines; returns (queries, errors) with one error per bad line."""
+    queries: List[Query] = []
+    errors: List[str] = []
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith("{"):
+            queries.append(line)
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError as e:
+            errors.append(f"line {lineno}: invalid JSON: {e}")
+            continue
+        if not isinstance(obj, dict) or not isinstance(obj.get("query"), str) or not obj["query"].strip():
+            errors.append(f"line {lineno}: expected an object with a \"query\" string")
+            continue
+        queries.append(obj)
+    return queries, errors
+
+
 def main(argv: list[str]) -> int:
     ap = argparse.ArgumentParser()
-    ap.add_argument("query")
-    ap.add_argument("--base-url", default="http://192.168.10.208:8087/")
+    ap.add_argument("query", nargs="*", help='search terms; "-" reads queries from stdin')
+    ap.add_argument("--base-url", default=DEFAULT_BASE_URL)
     ap.add_argument("--limit", type=int, default=10)
     ap.add_argument("--language", default=None)
     ap.add_argument("--time-range", default=None, dest="time_range")
     ap.add_argument("--safesearch", default=None)
+    ap.add_argument("--stdin", action="store_true", help="read queries (lines or JSONL) from stdin")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--timeout", type=float, default=20)
+    ap.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR))
+    ap.add_argument("--cache-ttl", type=float, default=3600, help="seconds")
+    ap.add_argument("--no-cache", action="store_true")
+    ap.add_argument("--jsonl", action="store_true", help="print one JSON line per query, then the merged results")
 
     args = ap.parse_args(argv)
 
-    url = build_url(
+    queries: List[Query] = [q for q in args.query if q != "-"]
+    bad_lines: List[str] = []
+    if args.stdin or "-" in args.query:
+        read, bad_lines = read_queries(sys.stdin)
+        queries += read
+    for err in bad_lines:
+        print(f"error: {err}", file=sys.stderr)
+    if not queries:
+        if bad_lines:
+            return 2
+        ap.error("no query given (pass search terms, or - / --stdin to read them from stdin)")
+
+    client = SearxngClient(
         args.base_url,
-        args.query,
-        language=args.language,
-        time_range=args.time_range,
-        safesearch=args.safesearch,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        cache_ttl=args.cache_ttl,
     )
-
-    try:
-        obj = fetch(url)
-    except Exception as e:
-        print(f"error: failed to query SearXNG: {e}", file=sys.stderr)
-        print(f"url: {url}", file=sys.stderr)
-        return 2
-
-    results = obj.get("results") or []
-    results = results[: max(0, args.limit)]
-
-    out = []
-    for r in results:
-        out.append(
-            {
-                "title": (r.get("title") or "").strip(),
-                "url": (r.get("url") or "").strip(),
-                "snippet": (r.get("content") or "").strip(),
-                "engine": r.get("engine"),
-            }
+    with client:
+        batch = client.search_many(
+            queries, limit=args.limit, language=args.language,
+            time_range=args.time_range, safesearch=args.safesearch,
         )
 
-    print(json.dumps({"query": args.query, "count": len(out), "results": out}, ensure_ascii=False, indent=2))
+    failed = [q for q in batch["queries"] if "error" in q]
+    for q in failed:
+        print(f"error: failed to query SearXNG for {q['query']!r}: {q['error']}", file=sys.stderr)
+    if failed:
+        print(f"url: {args.base_url}", file=sys.stderr)
+        if len(failed) == len(batch["queries"]):
+            return 2
+
+    if args.jsonl:
+        for q in batch["queries"]:
+            print(json.dumps(q, ensure_ascii=False))
+        print(json.dumps({"unique_results": batch["unique_results"]}, ensure_ascii=False))
+    elif len(batch["queries"]) == 1:
+        q = batch["queries"][0]
+        print(json.dumps({"query": q["query"], "count": q["count"], "results": q["results"]},
+                         ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(batch, ensure_ascii=False, indent=2))
     return 0
 
 
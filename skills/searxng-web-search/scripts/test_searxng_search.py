@@ -0,0 +1,179 @@
+import io
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import searxng_search
+from searxng_search import SearxngClient, url_key
+
+
+class FakeSearxng:
+    """Local SearXNG stand-in: /search answers with two results per query, one shared by all."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.paths = []
+        self.peak = self._active = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, body = fake.respond(self.path)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+
+    def respond(self, path):
+        parts = urlsplit(path)
+        with self._lock:
+            self.paths.append(path)
+            self._active += 1
+            self.peak = max(self.peak, self._active)
+        time.sleep(self.delay)
+        with self._lock:
+            self._active -= 1
+        if parts.path != "/search":
+            return 404, {"error": "not found"}
+        query = parse_qs(parts.query)["q"][0]
+        return 200, {"query": query, "results": [
+            {"title": f"{query} result", "url": f"https://{query.replace(' ', '-')}.example/",
+             "content": "snippet", "engine": "fake"},
+            {"title": "Directory", "url": "https://www.directory.example/plumbers/?utm_source=x",
+             "content": "listing", "engine": "fake"},
+        ]}
+
+    def url(self, path="/"):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+    def hits(self, path="/search"):
+        return sum(1 for p in self.paths if urlsplit(p).path == path)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def test_url_key_ignores_cosmetic_differences():
+    assert url_key("https://www.a.example/x/?utm_source=y") == url_key("http://a.example/x")
+
+
+def test_search_many_is_concurrent_pooled_and_deduplicated():
+    queries = [f"plumber {i}" for i in range(12)]
+    with FakeSearxng(delay=0.05) as server:
+        with SearxngClient(server.url("/"), concurrency=4) as client:
+            start = time.perf_counter()
+            batch = client.search_many(queries, limit=5)
+            elapsed = time.perf_counter() - start
+            assert client.connections_opened <= 4
+            assert client.requests_sent == 12
+
+    assert server.peak == 4
+    assert elapsed < 12 * 0.05
+    assert [q["query"] for q in batch["queries"]] == queries
+    assert batch["count"] == 13
+    shared = [r for r in batch["unique_results"] if "directory" in r["url"]]
+    assert len(shared) == 1 and shared[0]["queries"] == queries
+
+
+def test_disk_cache_by_query_and_params(tmp_path):
+    with FakeSearxng() as server:
+        with SearxngClient(server.url("/"), cache_dir=tmp_path) as client:
+            client.search_many(["plumber Adelaide", "plumber Adelaide"])
+            client.search("plumber Adelaide", language="en")
+        with SearxngClient(server.url("/"), cache_dir=tmp_path) as client:
+            again = client.search("plumber Adelaide")
+        assert server.hits() == 2
+        assert again["cached"]
+
+        with SearxngClient(server.url("/"), cache_dir=tmp_path, cache_ttl=0) as client:
+            assert not client.search("plumber Adelaide")["cached"]
+        assert not list(tmp_path.glob("*/*.json"))
+
+
+def test_errors_are_reported_per_query():
+    with FakeSearxng() as server:
+        with SearxngClient(server.url("/nowhere/")) as client:
+            result = client.search("anything")
+    assert result["results"] == [] and "HTTP 404" in result["error"]
+
+
+def test_cli_reads_jsonl_from_stdin(monkeypatch, capsys, tmp_path):
+    lines = 'plumber Adelaide\n{"query": "electrician Adelaide", "language": "en"}\n'
+    monkeypatch.setattr(sys, "stdin", io.StringIO(lines))
+    with FakeSearxng() as server:
+        code = searxng_search.main([
+            "--stdin", "--jsonl", "--base-url", server.url("/"), "--cache-dir", str(tmp_path),
+        ])
+        assert any("language=en" in path for path in server.paths)
+    out = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert code == 0
+    assert [o["query"] for o in out[:2]] == ["plumber Adelaide", "electrician Adelaide"]
+    assert len(out[2]["unique_results"]) == 3
+
+
+class _UnreadableStdin(io.StringIO):
+    def isatty(self):
+        return False
+
+    def read(self, *args):
+        raise AssertionError("stdin read without - or --stdin")
+
+    readline = read
+
+    def __iter__(self):
+        raise AssertionError("stdin read without - or --stdin")
+
+
+def test_cli_without_queries_errors_instead_of_reading_stdin(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "stdin", _UnreadableStdin())
+    with pytest.raises(SystemExit) as exc:
+        searxng_search.main(["--no-cache"])
+    assert exc.value.code == 2
+    assert "no query given" in capsys.readouterr().err
+
+
+def test_cli_dash_reads_stdin_alongside_arguments(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "stdin", io.StringIO("electrician Adelaide\n"))
+    with FakeSearxng() as server:
+        code = searxng_search.main(["plumber Adelaide", "-", "--jsonl", "--no-cache", "--base-url", server.url("/")])
+    out = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert code == 0
+    assert [o["query"] for o in out[:2]] == ["plumber Adelaide", "electrician Adelaide"]
+
+
+def test_cli_reports_bad_jsonl_lines_and_runs_the_rest(monkeypatch, capsys):
+    lines = '{"query": "plumber Adelaide"}\n{"query": "broken\n{"query": 42}\n{"language": "en"}\n'
+    monkeypatch.setattr(sys, "stdin", io.StringIO(lines))
+    with FakeSearxng() as server:
+        code = searxng_search.main(["-", "--jsonl", "--no-cache", "--base-url", server.url("/")])
+        assert server.hits() == 1
+    captured = capsys.readouterr()
+    assert code == 0
+    assert "error: line 2: invalid JSON" in captured.err
+    assert "error: line 3:" in captured.err and "error: line 4:" in captured.err
+    assert [json.loads(line) for line in captured.out.splitlines()][0]["query"] == "plumber Adelaide"
+
+    monkeypatch.setattr(sys, "stdin", io.StringIO("{oops\n"))
+    assert searxng_search.main(["--stdin", "--no-cache"]) == 2
+    assert "error: line 1: invalid JSON" in capsys.readouterr().err